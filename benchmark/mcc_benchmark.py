@@ -21,6 +21,7 @@ from palloq.circuitcombination.mcircuit_composer import (
 )
 from palloq.compiler.multi_transpile import multi_transpile
 from palloq.utils.esp import esp
+from palloq.utils.demultiplex import demultiplex_counts
 
 from qiskit.test.mock import FakeToronto
 from utils import PrepareQASMBench
@@ -205,19 +206,9 @@ neither of them are None is fine."
             count: (dict) output count of execution.
             i.g. {'000 001': 100, '000 010': 80...}
         """
-        _result = {}
-        # 0. initialize result format
-        first_count = next(iter(count)).split(" ")
-        for ib, b in enumerate(first_count):
-            # make empty dict to store the measurement results
-            _csize = len(b)
-            _result[ib] = {format(t, "0%db" % (_csize)): 0 for t in range(2 ** _csize)}
-        # update count values
-        for ct, val in count.items():
-            _split_count = ct.split(" ")
-            for ic, b in enumerate(_split_count):
-                _result[ic][b] += val
-        return _result
+        # registers are listed from the last one in bitstrings
+        register_sizes = [len(b) for b in reversed(next(iter(count)).split(" "))]
+        return demultiplex_counts(count, register_sizes)
 
     def _calc_pst(self, emp_count, sim_count):
         # success trial
@@ -2,18 +2,25 @@
 
 from typing import List, Iterable
 from qiskit import QuantumCircuit
-from qiskit.compiler import transpile
 import abc
 import math
 import numpy as np
-import collections
 
+from palloq.circuitcombination.circuit_features import (
+    FeatureCache,
+    default_feature_cache,
+)
 from palloq.utils import esp
 
 
 class CostFunction(metaclass=abc.ABCMeta):
     "a series of cost functions"
 
+    # whether the cost of circuit pairs is the sum of the costs of each circuit
+    additive = False
+    # whether the cost can be updated by accumulator as circuits are added and removed
+    incremental = False
+
     def __init__(self):
         pass
 
@@ -24,26 +31,109 @@ class CostFunction(metaclass=abc.ABCMeta):
         """
         pass
 
+    def feature_matrix(self, circuits: List[QuantumCircuit]) -> np.ndarray:
+        """
+        Function return features of circuits read by batch_cost,
+        a row for each circuit
+        """
+        raise NotImplementedError
+
+    def batch_cost(self, membership: np.ndarray, features: np.ndarray) -> np.ndarray:
+        """
+        Function return costs of many candidate circuit pairs at once
+
+        Arguments:
+            membership: (np.ndarray) boolean matrix (candidates x circuits),
+                True if the circuit is in the candidate circuit pairs
+            features: (np.ndarray) feature_matrix of the circuits
+
+        Returns:
+            (np.ndarray) cost of each candidate
+        """
+        raise NotImplementedError
+
+    def accumulator(self, circuits: List[QuantumCircuit] = ()) -> "CostAccumulator":
+        """
+        Function return CostAccumulator of circuit pairs, which starts with circuits
+        """
+        if not self.incremental:
+            raise NotImplementedError(
+                f"{type(self).__name__} does not support incremental cost"
+            )
+        return CostAccumulator(self, circuits)
+
+    def _circuit_term(self, qc: QuantumCircuit):
+        """
+        Term of a circuit summed up by CostAccumulator
+        """
+        raise NotImplementedError
+
+    def _accumulated_cost(self, total, num_circuits: int) -> float:
+        """
+        Cost of circuit pairs from the sum of the terms of the circuits
+        """
+        return total
+
+
+class CostAccumulator:
+    """
+    Cost of circuit pairs updated in O(1) as circuits are added and removed,
+    from the cached features of the circuits.
+
+    Arguments:
+        cost_function: (CostFunction) incremental cost function
+        circuits: (list) circuits to start with
+    """
+
+    def __init__(
+        self, cost_function: CostFunction, circuits: List[QuantumCircuit] = ()
+    ):
+        self.cost_function = cost_function
+        self.total = 0
+        self.num_circuits = 0
+        for qc in circuits:
+            self.add(qc)
+
+    def add(self, qc: QuantumCircuit) -> None:
+        self.total += self.cost_function._circuit_term(qc)
+        self.num_circuits += 1
+
+    def remove(self, qc: QuantumCircuit) -> None:
+        """
+        Remove a circuit, which must have been added
+        """
+        self.total -= self.cost_function._circuit_term(qc)
+        self.num_circuits -= 1
+
+    def cost(self) -> float:
+        return self.cost_function._accumulated_cost(self.total, self.num_circuits)
+
 
 class CrosstalkBaseCost(CostFunction):
+    incremental = True
+
     def __init__(
         self,
         total_qubits: int,
         device_errors: List[float] = None,
         device_topology: List = None,
+        feature_cache: FeatureCache = None,
     ):
         if not isinstance(total_qubits, int):
             raise TypeError("total_qubits must be int")
         self.total_qubits = total_qubits
         self.device_errors = device_errors
         self.device_topology = device_topology
+        if feature_cache is None:
+            feature_cache = default_feature_cache()
+        self.feature_cache = feature_cache
 
     def _calculate_cost(self) -> float:
         cost = 0
         cost_list = []
 
         for qc in self.circuit_pairs:
-            each_cost = qc.num_qubits / self.total_qubits
+            each_cost = self.feature_cache.features(qc).num_qubits / self.total_qubits
             cost_list.append(each_cost)
 
         _cost = sum(cost_list)
@@ -55,6 +145,28 @@ class CrosstalkBaseCost(CostFunction):
 
         return cost
 
+    def feature_matrix(self, circuits: List[QuantumCircuit]) -> np.ndarray:
+        # the number of qubits
+        return np.array(
+            [[self.feature_cache.features(qc).num_qubits] for qc in circuits],
+            dtype=float,
+        ).reshape(-1, 1)
+
+    def batch_cost(self, membership: np.ndarray, features: np.ndarray) -> np.ndarray:
+        # average of qubits / device qubits, nan for no circuits
+        membership = np.asarray(membership, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (membership @ features[:, 0]) / (
+                self.total_qubits * membership.sum(axis=1)
+            )
+
+    def _circuit_term(self, qc: QuantumCircuit):
+        # the number of qubits, divided in the end to be exact on removal
+        return self.feature_cache.features(qc).num_qubits
+
+    def _accumulated_cost(self, total, num_circuits: int) -> float:
+        return total / (self.total_qubits * num_circuits)
+
     def cost(self, circuit_pairs):
         if isinstance(circuit_pairs, (Iterable)):
             if all(map(lambda x: isinstance(x, QuantumCircuit), circuit_pairs)):
@@ -74,63 +186,57 @@ of Quantum Circuit not {type(circuit_pairs)}"
 
 
 class DurationTimeCost(CostFunction):
+    additive = True
+    incremental = True
+    # duration time of each gate in the basis gates
+    basis_gates = ["rz", "cx", "sx", "x", "id"]
+    durations = {"cx": 2000, "rz": 200, "sx": 200, "x": 200, "id": 200}
+
     def __init__(
         self,
         total_qubits: int,
         device_errors: List[float] = None,
         device_topology: List = None,
+        feature_cache: FeatureCache = None,
     ):
         if not isinstance(total_qubits, int):
             raise TypeError("total_qubits must be int")
         self.total_qubits = total_qubits
         self.device_errors = device_errors
         self.device_topology = device_topology
+        if feature_cache is None:
+            feature_cache = default_feature_cache()
+        self.feature_cache = feature_cache
 
     def _calculate_cost(self) -> float:
-
         cost = 0
-        qc_ops = collections.OrderedDict()
-        cx_duration_time = 2000
-        rz_duration_time = 200
-        sx_duration_time = 200
-        x_duration_time = 200
-        id_duration_time = 200
-        cx_list = []
-        rz_list = []
-        sx_list = []
-        x_list = []
-        id_list = []
-
         for qc in self.circuit_pairs:
-            uqc = transpile(qc, basis_gates=["rz", "cx", "sx", "x", "id"])
-            qc_ops = uqc.count_ops()
-            cx_num = qc_ops.get("cx", 0)
-            rz_num = qc_ops.get("rz", 0)
-            sx_num = qc_ops.get("sx", 0)
-            x_num = qc_ops.get("x", 0)
-            id_num = qc_ops.get("id", 0)
-
-            cx_list.append(cx_num)
-            rz_list.append(rz_num)
-            sx_list.append(sx_num)
-            x_list.append(x_num)
-            id_list.append(id_num)
-
-        total_cx = sum(cx_list)
-        total_rz = sum(rz_list)
-        total_sx = sum(sx_list)
-        total_x = sum(x_list)
-        total_id = sum(id_list)
-        cost = (
-            total_cx * cx_duration_time
-            + total_rz * rz_duration_time
-            + total_sx * sx_duration_time
-            + total_x * x_duration_time
-            + total_id * id_duration_time
-        )
+            qc_ops = self.feature_cache.translated_ops(qc, self.basis_gates)
+            cost += sum(
+                qc_ops.get(gate, 0) * duration
+                for gate, duration in self.durations.items()
+            )
 
         return cost
 
+    def feature_matrix(self, circuits: List[QuantumCircuit]) -> np.ndarray:
+        # op counts of the basis gates in the translated circuits
+        feature_matrix = np.zeros((len(circuits), len(self.basis_gates)))
+        for i, qc in enumerate(circuits):
+            qc_ops = self.feature_cache.translated_ops(qc, self.basis_gates)
+            feature_matrix[i] = [qc_ops.get(gate, 0) for gate in self.basis_gates]
+        return feature_matrix
+
+    def batch_cost(self, membership: np.ndarray, features: np.ndarray) -> np.ndarray:
+        durations = np.array([self.durations[gate] for gate in self.basis_gates])
+        return np.asarray(membership, dtype=float) @ (features @ durations)
+
+    def _circuit_term(self, qc: QuantumCircuit):
+        qc_ops = self.feature_cache.translated_ops(qc, self.basis_gates)
+        return sum(
+            qc_ops.get(gate, 0) * duration for gate, duration in self.durations.items()
+        )
+
     def cost(self, circuit_pairs):
         if isinstance(circuit_pairs, (Iterable)):
             if all(map(lambda x: isinstance(x, QuantumCircuit), circuit_pairs)):
@@ -168,17 +274,24 @@ class DepthBaseCost(CostFunction):
         FIXME If you don't need  some of parameters, please remove it.
     """
 
+    additive = True
+    incremental = True
+
     def __init__(
         self,
         total_qubits: int,
         device_errors: List[float] = None,
         device_topology: List = None,
+        feature_cache: FeatureCache = None,
     ):
         if not isinstance(total_qubits, int):
             raise TypeError("total_qubits must be int")
         self.total_qubits = total_qubits
         self.device_errors = device_errors
         self.device_topology = device_topology
+        if feature_cache is None:
+            feature_cache = default_feature_cache()
+        self.feature_cache = feature_cache
 
     def _calculate_cost(self) -> float:
         """
@@ -196,10 +309,9 @@ class DepthBaseCost(CostFunction):
         # # self.device_topology
         # # depths = np.array([qc.depth() for qc in self.circuit_pairs]) etc.
         for qc in self.circuit_pairs:
-            depth = qc.depth()
-            depths.append(depth)
-            num_qubits = qc.num_qubits
-            num_qubits_list.append(num_qubits)
+            features = self.feature_cache.features(qc)
+            depths.append(features.depth)
+            num_qubits_list.append(features.num_qubits)
 
         # # 2. Using these information, calculate cost
         # # etc. e*depth
@@ -214,6 +326,21 @@ class DepthBaseCost(CostFunction):
         # cost = sum([...])
         return cost
 
+    def feature_matrix(self, circuits: List[QuantumCircuit]) -> np.ndarray:
+        # depth and the number of qubits
+        feature_matrix = np.zeros((len(circuits), 2))
+        for i, qc in enumerate(circuits):
+            features = self.feature_cache.features(qc)
+            feature_matrix[i] = features.depth, features.num_qubits
+        return feature_matrix
+
+    def batch_cost(self, membership: np.ndarray, features: np.ndarray) -> np.ndarray:
+        return np.asarray(membership, dtype=float) @ (features[:, 0] * features[:, 1])
+
+    def _circuit_term(self, qc: QuantumCircuit):
+        features = self.feature_cache.features(qc)
+        return features.depth * features.num_qubits
+
     def cost(self, circuit_pairs):
         if isinstance(circuit_pairs, (Iterable)):
             if all(map(lambda x: isinstance(x, QuantumCircuit), circuit_pairs)):
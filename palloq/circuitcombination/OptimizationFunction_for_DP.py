@@ -2,11 +2,13 @@
 
 from typing import List, Iterable
 from qiskit import QuantumCircuit
-from qiskit.compiler import transpile
 import abc
 import numpy as np
-import collections
 
+from palloq.circuitcombination.circuit_features import (
+    FeatureCache,
+    default_feature_cache,
+)
 from palloq.utils import esp
 
 
@@ -30,18 +32,22 @@ class CrosstalkBaseCost(CostFunction):
         total_qubits: int,
         device_errors: List[float] = None,
         device_topology: List = None,
+        feature_cache: FeatureCache = None,
     ):
         if not isinstance(total_qubits, int):
             raise TypeError("total_qubits must be int")
         self.total_qubits = total_qubits
         self.device_errors = device_errors
         self.device_topology = device_topology
+        if feature_cache is None:
+            feature_cache = default_feature_cache()
+        self.feature_cache = feature_cache
 
     def _calculate_cost(self) -> float:
         cost = []
 
         for qc in self.circuit_pairs:
-            each_cost = qc.num_qubits / self.total_qubits
+            each_cost = self.feature_cache.features(qc).num_qubits / self.total_qubits
             cost.append(each_cost)
 
         """
@@ -71,85 +77,38 @@ of Quantum Circuit not {type(circuit_pairs)}"
 
 
 class DurationTimeCost(CostFunction):
+    # duration time of each gate in the basis gates
+    basis_gates = ["rz", "cx", "sx", "x", "id"]
+    durations = {"cx": 2000, "rz": 200, "sx": 200, "x": 200, "id": 200}
+
     def __init__(
         self,
         total_qubits: int,
         device_errors: List[float] = None,
         device_topology: List = None,
+        feature_cache: FeatureCache = None,
     ):
         if not isinstance(total_qubits, int):
             raise TypeError("total_qubits must be int")
         self.total_qubits = total_qubits
         self.device_errors = device_errors
         self.device_topology = device_topology
+        if feature_cache is None:
+            feature_cache = default_feature_cache()
+        self.feature_cache = feature_cache
 
     def _calculate_cost(self) -> float:
-
         cost = []
-        each_cost = 0
-        qc_ops = collections.OrderedDict()
-        cx_duration_time = 2000
-        rz_duration_time = 200
-        sx_duration_time = 200
-        x_duration_time = 200
-        id_duration_time = 200
-        cx_list = []
-        rz_list = []
-        sx_list = []
-        x_list = []
-        id_list = []
-
         for qc in self.circuit_pairs:
-            uqc = transpile(qc, basis_gates=["rz", "cx", "sx", "x", "id"])
-            qc_ops = uqc.count_ops()
-            cx_num = qc_ops.get("cx", 0)
-            rz_num = qc_ops.get("rz", 0)
-            sx_num = qc_ops.get("sx", 0)
-            x_num = qc_ops.get("x", 0)
-            id_num = qc_ops.get("id", 0)
-
-            cx_list.append(cx_num)
-            rz_list.append(rz_num)
-            sx_list.append(sx_num)
-            x_list.append(x_num)
-            id_list.append(id_num)
-
-            total_cx = sum(cx_list)
-            total_rz = sum(rz_list)
-            total_sx = sum(sx_list)
-            total_x = sum(x_list)
-            total_id = sum(id_list)
-
-            each_cost = (
-                total_cx * cx_duration_time
-                + total_rz * rz_duration_time
-                + total_sx * sx_duration_time
-                + total_x * x_duration_time
-                + total_id * id_duration_time
+            qc_ops = self.feature_cache.translated_ops(qc, self.basis_gates)
+            each_cost = sum(
+                qc_ops.get(gate, 0) * duration
+                for gate, duration in self.durations.items()
             )
             cost.append(each_cost)
 
-            cx_list = []
-            rz_list = []
-            sx_list = []
-            x_list = []
-            id_list = []
-
         return cost
 
-        """
-            uqc = transpile(qc, basis_gates = ['rz', 'cx', 'sx', 'x', 'id'])
-            qc_ops = uqc.count_ops()
-            cx_num = qc_ops.get('cx', 0)
-            rz_num = qc_ops.get('rz', 0)
-            sx_num = qc_ops.get('sx', 0)
-            x_num = qc_ops.get('x', 0)
-            id_num = qc_ops.get('id', 0)
-
-            cost = cx_num * cx_duration_time + rz_num * rz_duration_time + sx_num * sx_duration_time + x_num * x_duration_time + id_num * id_duration_time
-        
-        """
-
     def cost(self, circuit_pairs):
         if isinstance(circuit_pairs, (Iterable)):
             if all(map(lambda x: isinstance(x, QuantumCircuit), circuit_pairs)):
@@ -192,12 +151,16 @@ class DepthBaseCost(CostFunction):
         total_qubits: int,
         device_errors: List[float] = None,
         device_topology: List = None,
+        feature_cache: FeatureCache = None,
     ):
         if not isinstance(total_qubits, int):
             raise TypeError("total_qubits must be int")
         self.total_qubits = total_qubits
         self.device_errors = device_errors
         self.device_topology = device_topology
+        if feature_cache is None:
+            feature_cache = default_feature_cache()
+        self.feature_cache = feature_cache
 
     def _calculate_cost(self) -> float:
         """
@@ -215,10 +178,9 @@ class DepthBaseCost(CostFunction):
         # # self.device_topology
         # # depths = np.array([qc.depth() for qc in self.circuit_pairs]) etc.
         for qc in self.circuit_pairs:
-            depth = qc.depth()
-            depths.append(depth)
-            num_qubits = qc.num_qubits
-            num_qubits_list.append(num_qubits)
+            features = self.feature_cache.features(qc)
+            depths.append(features.depth)
+            num_qubits_list.append(features.num_qubits)
 
         # # 2. Using these information, calculate cost
         # # etc. e*depth
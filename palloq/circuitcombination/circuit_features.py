@@ -0,0 +1,125 @@
+# qiskit version: 0.29.0
+
+# import python tools
+import weakref
+from typing import Dict, List, Optional
+
+# import qiskit tools
+from qiskit import QuantumCircuit
+from qiskit.compiler import transpile
+
+# import palloq tools
+from palloq.utils.translation_cache import TranslationCache
+
+
+class CircuitFeatures:
+    """
+    Features of a circuit read by the cost functions.
+
+    Arguments:
+        circuit: (QuantumCircuit) circuit to extract the features
+    """
+
+    __slots__ = (
+        "num_qubits",
+        "num_clbits",
+        "depth",
+        "size",
+        "count_ops",
+        "translated_ops",
+    )
+
+    def __init__(self, circuit: QuantumCircuit):
+        self.num_qubits = circuit.num_qubits
+        self.num_clbits = circuit.num_clbits
+        self.depth = circuit.depth()
+        self.size = circuit.size()
+        self.count_ops = dict(circuit.count_ops())
+        # basis gates (sorted tuple) -> op counts of the translated circuit
+        self.translated_ops = {}
+
+
+class FeatureCache:
+    """
+    In-memory cache of the features of circuits keyed by circuit identity.
+
+    Features are extracted once per circuit, and the translation to each basis gate
+    set is done once per circuit, through the on-disk translation_cache if given.
+    Entries are dropped when their circuits are garbage collected. Circuits must not
+    be modified once their features are cached.
+
+    Arguments:
+        translation_cache: (TranslationCache) cache of the translated circuits
+    """
+
+    def __init__(self, translation_cache: Optional[TranslationCache] = None):
+        self.translation_cache = translation_cache
+        self.hits = 0
+        self.misses = 0
+        # id(circuit) -> (weak reference to the circuit, features)
+        self._entries = {}
+
+    def features(self, circuit: QuantumCircuit) -> CircuitFeatures:
+        """Features of the circuit, extracted on the first call"""
+        key = id(circuit)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0]() is circuit:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        features = CircuitFeatures(circuit)
+        ref = weakref.ref(circuit, self._remover(key))
+        self._entries[key] = (ref, features)
+        return features
+
+    def translated_ops(
+        self, circuit: QuantumCircuit, basis_gates: List[str]
+    ) -> Dict[str, int]:
+        """Op counts of the circuit translated to basis_gates"""
+        features = self.features(circuit)
+        basis = tuple(sorted(basis_gates))
+        ops = features.translated_ops.get(basis)
+        if ops is None:
+            if self.translation_cache is not None:
+                translated = self.translation_cache.translate(circuit, list(basis))
+            else:
+                translated = transpile(circuit, basis_gates=list(basis))
+            ops = features.translated_ops[basis] = dict(translated.count_ops())
+        return ops
+
+    def _remover(self, key):
+        entries = self._entries
+
+        def remove(ref):
+            entry = entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del entries[key]
+
+        return remove
+
+    def clear(self) -> None:
+        """Remove all the entries"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# cache shared by the cost functions by default
+_default_feature_cache = FeatureCache()
+
+
+def default_feature_cache() -> FeatureCache:
+    """The feature cache shared by the cost functions by default"""
+    return _default_feature_cache
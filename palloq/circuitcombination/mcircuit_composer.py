@@ -2,11 +2,15 @@
 
 import abc
 import numpy as np
-import copy
 import logging
+import time
 
 from typing import Union, List
 from qiskit import QuantumCircuit
+from qiskit.compiler import transpile
+from qiskit.transpiler import InstructionDurations
+from qiskit.exceptions import QiskitError
+from palloq.compiler.packing import estimate_duration, mean_durations
 from palloq.circuitcombination.OptimizationFunction import CostFunction, DepthBaseCost
 from palloq.utils.esp import esp
 
@@ -26,6 +30,20 @@ class MultiCircuitComposer(metaclass=abc.ABCMeta):
         """
         pass
 
+    def compose_all(self) -> List["MultiCircuit"]:
+        """
+        compose all the queued circuits into list of multi circuits
+
+        By default, the queue is drained by compose(), one multi circuit at a time.
+        MCC and MCC_random keep this, since their pair search chooses each group
+        from the circuits left by the previous ones. Only MCC_dp partitions the
+        whole queue jointly.
+        """
+        multi_circuits = []
+        while self.has_qc():
+            multi_circuits.append(self.compose())
+        return multi_circuits
+
 
 class MCC(MultiCircuitComposer):
     """
@@ -36,6 +54,10 @@ class MCC(MultiCircuitComposer):
         max_size: (int) The number of qubits in device
         threshold: (float) the threshold to cut the circuit pairs
         cost_function: (CostFunction) costfunction to evaluate circuit pairs
+        max_nodes: (int) the number of groups searched in each compose, after which
+            the best group found is taken
+        time_limit: (float) the time in seconds of the search in each compose,
+            after which the best group found is taken
     """
 
     def __init__(
@@ -44,6 +66,8 @@ class MCC(MultiCircuitComposer):
         device_size: int,
         threshold: float,
         cost_function: CostFunction = DepthBaseCost,
+        max_nodes: int = None,
+        time_limit: float = None,
     ) -> None:
 
         # The number of qubits in total
@@ -70,6 +94,9 @@ must be Quantum Circuit"
         self.qcircuits = qcircuits
         self._threshold = threshold
         self.optimized_circuits = []
+        # budget of the search
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
         # cost functions
         if issubclass(cost_function, CostFunction):
             self.cost_function = cost_function
@@ -90,44 +117,7 @@ must be Quantum Circuit"
         """
         # FIXME here using class variables, but could be global scope
         self._cost_func = self.cost_function(self._device_size)
-        _candidates = []
-
-        # depth first search
-        def dfs(circuits: List, index: int):
-            # TODO clean up
-            # depth first search
-            # circuits: [(index, QuantumCircuit)]
-            _circuit_instances = [i[1] for i in circuits]
-            total_qubits = sum([i.num_qubits for i in _circuit_instances])
-            _cost = self._cost_func.cost(_circuit_instances)
-            # Three conditions to quit this dfs
-            if (
-                total_qubits >= self._device_size
-                or _cost >= self._threshold
-                or index >= len(self.qcircuits)
-            ):
-                _c = self._cost_func.cost(_circuit_instances[:-1])
-                _candidates.append((circuits[:-1], _c))
-                return
-            # don't add
-            _nqc = copy.copy(circuits)
-            _nqc.append((index, self.qcircuits[index]))
-            # add index+1 circuits
-            dfs(_nqc, index + 1)
-            dfs(circuits, index + 1)
-
-        dfs([(0, self.qcircuits[0])], 1)
-
-        # FIXME Post processing
-        _sorted_candidates = sorted(
-            _candidates, key=lambda x: (len(x[0]), 1 / (x[1] + 1e-6)), reverse=True
-        )
-        _best_choice = None
-        # TODO max len
-        for _choice in _sorted_candidates:
-            if len(_choice[0]) > 1:
-                _best_choice = _choice
-                break
+        _best_choice = self._branch_and_bound()
         _log.info(f"choice: {'Single' if _best_choice is None else 'Multi'}")
         # If there is no choice to take, then just return single qc
         if _best_choice is None:
@@ -143,17 +133,132 @@ must be Quantum Circuit"
         else:
             _log.info("pop out circuit based on cost calculations")
             # take circuits and costs from choice
-            _qcs, _cost = _best_choice
-            # get circuit index and instances
-            _circuits = []
-            for i, v in enumerate(_qcs):
-                self.qcircuits.pop(v[0] - i)
-                _circuits.append(v[1])
+            _indices, _cost = _best_choice
+            _circuits = [self.qcircuits[i] for i in _indices]
+            for i, v in enumerate(_indices):
+                self.qcircuits.pop(v - i)
             mulcirc = MultiCircuit()
             mulcirc.set_circuit_pairs(_circuits)
             mulcirc.set_cost(_cost)
             return mulcirc
 
+    def _branch_and_bound(self):
+        """
+        Search the group with the first circuit that has the most circuits,
+        then the lowest cost, within the device size and the threshold.
+
+        Groups are enumerated in the order of the former exhaustive search, and ties
+        are kept by the first group found, so that the same group is chosen. As in
+        that search, the last circuit in the queue is never taken into a group.
+        Subtrees are pruned by the number of circuits that can still fit into the
+        device, and by the cost of the cheapest of them if the cost function is
+        additive. Otherwise the cost of the group is updated by the accumulator of
+        the cost function if it is incremental.
+
+        Returns:
+            (indices of the group, cost of the group), or None if no group
+            of several circuits is found
+        """
+        n = len(self.qcircuits)
+        additive = self._cost_func.additive
+        # per-circuit features
+        qubits = [qc.num_qubits for qc in self.qcircuits]
+        accumulator = None
+        if additive:
+            costs = [self._cost_func.cost([qc]) for qc in self.qcircuits]
+            root_cost = costs[0]
+        elif self._cost_func.incremental:
+            # the cost of the group is updated as circuits are added and removed
+            accumulator = self._cost_func.accumulator(self.qcircuits[:1])
+            root_cost = accumulator.cost()
+        else:
+            root_cost = self._cost_func.cost(self.qcircuits[:1])
+        if qubits[0] >= self._device_size or root_cost >= self._threshold:
+            return None
+
+        # cumulative sums of the smallest features of the circuits that can be added.
+        # They bound the circuits added after any index j, of which at most last - j
+        # are left.
+        last = n - 1
+        cum_qubits = np.cumsum(sorted(qubits[1:last]))
+        if additive:
+            cum_costs = np.cumsum(sorted(costs[1:last]))
+
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.perf_counter() + self.time_limit
+        best = None
+        nodes = 0
+        cut_short = False
+
+        def search(group, group_qubits, group_cost):
+            nonlocal best, nodes, cut_short
+            if len(group) > 1 and (
+                best is None
+                or len(group) > len(best[0])
+                or (len(group) == len(best[0]) and group_cost < best[1])
+            ):
+                best = (list(group), group_cost)
+
+            # the number of circuits that can still be added
+            group_fit = np.searchsorted(
+                cum_qubits, self._device_size - group_qubits - 1, side="right"
+            )
+            if additive:
+                group_fit = min(
+                    group_fit,
+                    np.searchsorted(
+                        cum_costs, self._threshold - group_cost, side="left"
+                    ),
+                )
+
+            for j in range(group[-1] + 1, last):
+                # the number of circuits from j that can still be added
+                fit = min(group_fit, last - j)
+                if fit == 0:
+                    break
+                if best is not None:
+                    bound = len(group) + fit
+                    if bound < len(best[0]):
+                        break
+                    if bound == len(best[0]) and additive:
+                        lower_cost = group_cost + cum_costs[bound - len(group) - 1]
+                        if lower_cost >= best[1]:
+                            break
+
+                nodes += 1
+                if (self.max_nodes is not None and nodes > self.max_nodes) or (
+                    deadline is not None and time.perf_counter() > deadline
+                ):
+                    cut_short = True
+                    return
+
+                _qubits = group_qubits + qubits[j]
+                if _qubits >= self._device_size:
+                    continue
+                if additive:
+                    _cost = group_cost + costs[j]
+                elif accumulator is not None:
+                    accumulator.add(self.qcircuits[j])
+                    _cost = accumulator.cost()
+                else:
+                    _cost = self._cost_func.cost(
+                        [self.qcircuits[i] for i in group + [j]]
+                    )
+                if _cost < self._threshold:
+                    group.append(j)
+                    search(group, _qubits, _cost)
+                    group.pop()
+                if accumulator is not None:
+                    accumulator.remove(self.qcircuits[j])
+                if cut_short:
+                    return
+
+        search([0], qubits[0], root_cost)
+        if cut_short:
+            _log.info(f"search is cut short after {nodes} nodes")
+        return best
+
     def has_qc(self) -> bool:
         return len(self.qcircuits) > 0
 
@@ -172,6 +277,20 @@ class MCC_dp(MultiCircuitComposer):
         max_size: (int) The number of qubits in device
         threshold: (float) the threshold to cut the circuit pairs
         cost_function: (CostFunction) costfunction to evaluate circuit pairs
+        max_clbits: (int) The number of classical bits a multi circuit can measure
+        max_depth: (int) The depth a circuit can take
+        max_duration: (float) The estimated duration a circuit can take
+        instruction_durations: (InstructionDurations) durations of the backend
+            to estimate the durations of circuits for max_duration. Circuits are
+            translated to the instructions in it, and ValueError is raised if
+            a circuit has instructions of unknown durations.
+        max_states: (int) The size of the dp table, above which the knapsack is
+            solved by a greedy heuristic instead
+
+    The numbers of qubits and classical bits of the circuits add up in a multi
+    circuit, and the knapsack is solved over both of them. The circuits run in
+    parallel in a multi circuit, whose depth and duration are those of its longest
+    circuit, so max_depth and max_duration are limits of each circuit.
     """
 
     def __init__(
@@ -180,6 +299,11 @@ class MCC_dp(MultiCircuitComposer):
         device_size: int,
         offset: int,
         eval_func=esp,
+        max_clbits: int = None,
+        max_depth: int = None,
+        max_duration: float = None,
+        instruction_durations: InstructionDurations = None,
+        max_states: int = 1 << 22,
     ) -> None:
 
         # The number of qubits in total
@@ -200,14 +324,26 @@ not {type(qcircuits)}"
 must be Quantum Circuit"
             )
 
-        if any(map(lambda x: x.num_qubits > device_size, qcircuits)):
-            raise ValueError("One of circuit size is larger than device size.")
+        # device limits
+        self.max_clbits = max_clbits
+        self.max_depth = max_depth
+        self.max_duration = max_duration
+        if max_duration is not None:
+            if instruction_durations is None:
+                raise ValueError("max_duration needs instruction_durations")
+            self._gate_durations = mean_durations(instruction_durations)
+        self._check_device_limits(qcircuits)
+        self.max_states = max_states
 
         self.qcircuits = qcircuits
         self.optimized_circuits = []
         # function that evaluate circuit
         self.eval_func = eval_func
         self.offset = offset
+        # TODO take this as class argument
+        self.error_rates = {"u3": 0.0001, "cx": 0.001, "id": 0}
+        # id(circuit) -> (circuit, value by eval_func)
+        self._values = {}
 
         # average depth
         self._ave_depth = np.mean([qc.depth() for qc in self.qcircuits])
@@ -219,73 +355,255 @@ must be Quantum Circuit"
         Optimization policy:
             combine high esp circuits as many as possible
         """
-        # 0. size of total quantum circuits
-        n = len(self.qcircuits)
-        W = self._device_size - self.offset
-
-        # 1. The number of qubits in one circuit
+        # 1. The number of qubits (and clbits) in one circuit
         # corresponds to the weight for it
-        weights = [qc.num_qubits for qc in self.qcircuits]
+        capacities, weights = self._resources()
         # using estimated successful probability as the value for single circuit
-        # TODO take this as class argument
-        error_rates = {"u3": 0.0001, "cx": 0.001, "id": 0}
         # TODO find proper evaluation method for one
         # circuit in multiple circuit
-        values = [self.eval_func(qc, error_rates) for qc in self.qcircuits]
+        values = self._circuit_values()
         # values = [(abs(self._ave_depth - qc.depth())) for qc in self.qcircuits]
 
-        # 2. prepare dp table and reverse table
-        dp = [[0] * (W) for _ in range(n + 1)]
-        rev = [[0] * (W) for _ in range(n + 1)]
-
-        # 2.1 Initialize dp table
-        for w in range(W):
-            dp[0][w] = 0
-
-        # 3. loop dp
-        for i in range(n):
-            for w in range(W):
-                # pick up ith item
-                if w >= weights[i]:
-                    if dp[i + 1][w] < dp[i][w - weights[i]] + values[i]:
-                        dp[i + 1][w] = dp[i][w - weights[i]] + values[i]
-                        rev[i + 1][w] = w - weights[i]
-
-                # do not pick up ith item
-                if dp[i + 1][w] < dp[i][w]:
-                    dp[i + 1][w] = dp[i][w]
-                    rev[i + 1][w] = w
-        # 4. optimal
-        _combination = []
-        cur_w = W - 1
-        for i in range(n - 1, -1, -1):
-            if rev[i + 1][cur_w] == cur_w - weights[i]:
-                _combination.append(i)
-            cur_w = rev[i + 1][cur_w]
-        # 5. calculate costs
+        # 2. solve the knapsack by dp, or greedy if the dp table is too large
+        if np.any(capacities < 0):
+            _combination = []
+        else:
+            _combination = self._knapsack(weights, values, capacities)
+        # 3. create multi circuit
         if _combination == []:
             mult = MultiCircuit()
-            mult.set_circuit_pairs([self.qcircuits.pop(0)])
+            _qc = self.qcircuits.pop(0)
+            self._values.pop(id(_qc), None)
+            mult.set_circuit_pairs([_qc])
             return mult
         else:
-            # 5.1 create multi circuit class and add circuit
+            # 3.1 create multi circuit class and add circuit
             mult = MultiCircuit()
             mult.set_circuit_pairs([self.qcircuits[i] for i in _combination])
             for i, corr in enumerate(sorted(_combination)):
                 if len(self.qcircuits) == 0:
                     break
                 # need correction for popout
-                self.qcircuits.pop(corr - i)
+                _qc = self.qcircuits.pop(corr - i)
+                self._values.pop(id(_qc), None)
             return mult
 
+    def compose_all(self) -> List["MultiCircuit"]:
+        """
+        partition all the queued circuits into multi circuits at once.
+
+        The values and the resources of the queue are evaluated once. Multi circuits
+        are filled one by one by the knapsack over the circuits left, as compose()
+        does, so that each of them takes the most value. The same circuits are also
+        packed by best fit decreasing on the number of qubits, which is taken
+        instead if it needs fewer multi circuits. Circuits of no positive value and
+        circuits beyond the capacities are not grouped and run alone.
+        Multi circuits are returned in descending order of their total value.
+        """
+        capacities, weights = self._resources()
+        values = np.asarray(self._circuit_values(), dtype=float)
+        packable = (values > 0) & np.all(weights <= capacities, axis=1)
+        indices = np.flatnonzero(packable)
+
+        groups = []
+        left = list(indices)
+        while left:
+            chosen = set(self._knapsack(weights[left], values[left], capacities))
+            groups.append([i for k, i in enumerate(left) if k in chosen])
+            left = [i for k, i in enumerate(left) if k not in chosen]
+        packed_groups = _best_fit_decreasing(indices, weights, values, capacities)
+        if len(packed_groups) < len(groups):
+            groups = packed_groups
+        groups += [[i] for i in np.flatnonzero(~packable)]
+
+        group_values = [sum(values[i] for i in group) for group in groups]
+        multi_circuits = []
+        for g in sorted(range(len(groups)), key=lambda g: -group_values[g]):
+            mult = MultiCircuit()
+            mult.set_circuit_pairs([self.qcircuits[i] for i in groups[g]])
+            multi_circuits.append(mult)
+        self.qcircuits.clear()
+        self._values.clear()
+        return multi_circuits
+
+    def _knapsack(self, weights, values, capacities) -> List[int]:
+        """
+        Indices of the circuits chosen by the knapsack, solved by dp, or greedily
+        if the dp table is larger than max_states
+        """
+        if np.prod(capacities + 1, dtype=float) <= self.max_states:
+            return _knapsack_dp(weights, values, capacities)
+        _log.info("dp table is too large, solve the knapsack greedily")
+        return _knapsack_greedy(weights, values, capacities)
+
+    def _resources(self):
+        """
+        Capacities of the resources summed up in a multi circuit, and the weights
+        of the circuits (circuits x resources)
+        """
+        capacities = [self._device_size - self.offset - 1]
+        weights = [[qc.num_qubits for qc in self.qcircuits]]
+        if self.max_clbits is not None:
+            capacities.append(self.max_clbits)
+            weights.append([qc.num_clbits for qc in self.qcircuits])
+        return (
+            np.array(capacities),
+            np.array(weights, dtype=int).reshape(len(capacities), -1).T,
+        )
+
+    def _circuit_values(self) -> List[float]:
+        """
+        Values of the circuits, evaluated once per circuit while it is in the queue
+        """
+        values = []
+        for qc in self.qcircuits:
+            # the circuit is kept in the entry so that its id is not reused
+            entry = self._values.get(id(qc))
+            if entry is None or entry[0] is not qc:
+                entry = (qc, self.eval_func(qc, self.error_rates))
+                self._values[id(qc)] = entry
+            values.append(entry[1])
+        return values
+
     def has_qc(self) -> bool:
         return len(self.qcircuits) > 0
 
     def push(self, qc: QuantumCircuit) -> None:
         if not isinstance(qc, QuantumCircuit):
             raise ValueError(f"qc must be Quantum Circuit not {type(qc)}")
+        self._check_device_limits([qc])
         self.qcircuits.append(qc)
 
+    def _check_device_limits(self, qcircuits: List[QuantumCircuit]) -> None:
+        """
+        Raise ValueError if one of circuits does not fit the device limits
+        """
+        if any(map(lambda x: x.num_qubits > self._device_size, qcircuits)):
+            raise ValueError("One of circuit size is larger than device size.")
+        if self.max_clbits is not None and any(
+            map(lambda x: x.num_clbits > self.max_clbits, qcircuits)
+        ):
+            raise ValueError("One of circuit clbits is larger than max_clbits.")
+        if self.max_depth is not None and any(
+            map(lambda x: x.depth() > self.max_depth, qcircuits)
+        ):
+            raise ValueError("One of circuit depth is larger than max_depth.")
+        if self.max_duration is not None and any(
+            map(lambda x: self._estimate_duration(x) > self.max_duration, qcircuits)
+        ):
+            raise ValueError("One of circuit duration is longer than max_duration.")
+
+    def _estimate_duration(self, qc: QuantumCircuit) -> float:
+        """
+        Duration of the circuit translated to the instructions of known durations
+        """
+        try:
+            translated = transpile(
+                qc, basis_gates=list(self._gate_durations), optimization_level=0
+            )
+        except QiskitError as err:
+            raise ValueError(
+                f"Duration of circuit {qc.name} is unknown: {err.message}"
+            ) from err
+        unknown = {
+            instruction.name
+            for instruction, _, _ in translated.data
+            if instruction.name not in self._gate_durations
+            and instruction.name != "barrier"
+        }
+        if unknown:
+            raise ValueError(
+                f"Duration of circuit {qc.name} is unknown: "
+                f"no durations of {sorted(unknown)}"
+            )
+        return estimate_duration(translated, self._gate_durations)
+
+
+def _knapsack_dp(weights, values, capacities) -> List[int]:
+    """
+    0/1 knapsack over several resources, filling the dp table of each circuit with
+    shifted maxima over the capacities.
+
+    Arguments:
+        weights: (np.ndarray) weights of the circuits (circuits x resources)
+        values: (list) values of the circuits
+        capacities: (np.ndarray) capacities of the resources
+
+    Returns:
+        indices of the chosen circuits in descending order
+    """
+    shape = tuple(capacities + 1)
+    dp = np.zeros(shape)
+    taken_bits = []
+    for i, weight in enumerate(weights):
+        # pick up ith item
+        pick = np.full(shape, -np.inf)
+        if np.all(weight <= capacities):
+            dst = tuple(slice(w, None) for w in weight)
+            src = tuple(slice(None, c + 1 - w) for w, c in zip(weight, capacities))
+            pick[dst] = dp[src] + values[i]
+        taken = pick > 0
+        row = np.where(taken, pick, 0)
+        # do not pick up ith item
+        skip = row < dp
+        taken &= ~skip
+        dp = np.where(skip, dp, row)
+        taken_bits.append(np.packbits(taken, axis=None))
+
+    combination = []
+    cur = capacities.copy()
+    for i in range(len(weights) - 1, -1, -1):
+        flat = np.ravel_multi_index(tuple(cur), shape)
+        if (taken_bits[i][flat >> 3] >> (7 - (flat & 7))) & 1:
+            combination.append(i)
+            cur -= weights[i]
+    return combination
+
+
+def _best_fit_decreasing(indices, weights, values, capacities) -> List[List[int]]:
+    """
+    Bin packing of the circuits of indices, taken in descending order of the number
+    of qubits, then of the value. Each goes into the group that it leaves with the
+    fewest free qubits.
+
+    Returns:
+        groups of the indices
+    """
+    order = sorted(indices, key=lambda i: (-weights[i, 0], -values[i]))
+    groups = []
+    # free qubits (and clbits) of each group
+    free = np.zeros((len(order), len(capacities)), dtype=int)
+    for i in order:
+        fits = np.flatnonzero(np.all(free[: len(groups)] >= weights[i], axis=1))
+        if len(fits) == 0:
+            free[len(groups)] = capacities - weights[i]
+            groups.append([i])
+            continue
+        best = fits[np.argmin(free[fits, 0])]
+        free[best] -= weights[i]
+        groups[best].append(i)
+    return groups
+
+
+def _knapsack_greedy(weights, values, capacities) -> List[int]:
+    """
+    Heuristic of the knapsack over several resources, picking circuits in
+    descending order of the value per the fraction of the capacities they use.
+
+    Returns:
+        indices of the chosen circuits in descending order
+    """
+    values = np.asarray(values, dtype=float)
+    usage = (weights / np.maximum(capacities, 1)).sum(axis=1)
+    order = np.argsort(-values / np.maximum(usage, 1e-9), kind="stable")
+    free = capacities.copy()
+    combination = []
+    for i in order:
+        if values[i] > 0 and np.all(weights[i] <= free):
+            combination.append(int(i))
+            free -= weights[i]
+    return sorted(combination, reverse=True)
+
 
 class MCC_random(MultiCircuitComposer):
     """
@@ -1 +1,15 @@
-from .dynamic_multiqc_compose import dynamic_multiqc_compose
+from .dynamic_multiqc_compose import (
+    dynamic_multiqc_compose,
+    iter_dynamic_multiqc_compose,
+)
+from .multi_backend_dispatch import multi_backend_dispatch
+from .multi_transpile import multi_transpile
+from .region_parallel_transpile import region_parallel_transpile
+from .packing import (
+    PackingStrategy,
+    CxDifferencePacking,
+    FirstFitDecreasingPacking,
+    BestFitPacking,
+    CxDensityClusterPacking,
+    DurationBalancedPacking,
+)
@@ -4,8 +4,12 @@
 # Written by Yasuhiro Ohkura
 
 # import python tools
+import copy
 import logging
-from typing import List, Union, Optional, Tuple
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Iterable, Iterator, List, Union, Optional, Tuple
 
 # import qiskit tools
 from qiskit.circuit.quantumcircuit import (
@@ -13,7 +17,7 @@ from qiskit.circuit.quantumcircuit import (
     QuantumRegister,
     ClassicalRegister,
 )
-from qiskit.transpiler import CouplingMap
+from qiskit.transpiler import CouplingMap, InstructionDurations, PassManagerConfig
 from qiskit.converters import (
     isinstancelist,
     dag_to_circuit,
@@ -25,7 +29,17 @@ from qiskit.providers.models import BackendProperties
 from qiskit.compiler import transpile
 
 # import palloq tools
+from palloq.compiler.packing import (
+    PackingStrategy,
+    CxDifferencePacking,
+    DurationBalancedPacking,
+)
+from palloq.compiler.region_parallel_transpile import region_parallel_transpile
 from palloq.transpiler.passes.layout.buffered_layout import BufferedMultiLayout
+from palloq.transpiler.passes.schedule import MultiALAPSchedule, MultiASAPSchedule
+from palloq.transpiler.preset_passmanagers.multi_pm import multi_pass_manager
+from palloq.utils.profiler import pass_callback, profile_stage
+from palloq.utils.translation_cache import TranslationCache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -43,6 +57,13 @@ def dynamic_multiqc_compose(
     num_idle_qubits=0,
     output_name: Optional[Union[str, List[str]]] = None,
     return_num_usage=False,
+    translation_cache: Optional[TranslationCache] = None,
+    packing_strategy: Optional[PackingStrategy] = None,
+    instruction_durations: Optional[InstructionDurations] = None,
+    duration_imbalance: Optional[float] = None,
+    return_schedule_analytics=False,
+    region_parallel=False,
+    max_workers: Optional[int] = None,
 ) -> List[QuantumCircuit]:
     """Mapping several circuits to single circuit based on calibration for the backend
 
@@ -53,6 +74,28 @@ def dynamic_multiqc_compose(
         backend:
         backend_properties:
         output_name: the name of output circuit. str or List[str]
+        translation_cache: on-disk cache of the queued circuits translated to basis gates.
+                           Cached circuits skip the translation.
+        packing_strategy: strategy to group queued circuits into composites.
+                          CxDifferencePacking is used by default.
+        instruction_durations: durations of instructions used for scheduling and for
+                               estimating the duration of each queued circuit.
+                               Taken from the backend if not given.
+        duration_imbalance: if given, circuits with similar estimated durations are
+                            grouped by DurationBalancedPacking with this imbalance
+                            tolerance, instead of the default packing strategy.
+                            Cannot be combined with packing_strategy.
+        return_schedule_analytics: if True, each composite is also scheduled by
+                                   MultiASAPSchedule for scheduling_method "asap",
+                                   otherwise MultiALAPSchedule, and the busy time, idle
+                                   time and critical path of its qubits and programs are
+                                   returned (see BaseMultiSchedule).
+        region_parallel: if True, the programs of each composite are routed and
+                         optimized separately on their hardware regions in parallel
+                         processes by region_parallel_transpile.
+        max_workers: the number of worker processes for region_parallel. The pool is
+                     shared by all the composites. Programs are transpiled in this
+                     process if max_workers is 1.
 
     Returns:
         list of tuple of composed QuantumCircuit and its layout
@@ -66,9 +109,134 @@ def dynamic_multiqc_compose(
         raise TypeError(
             "Expected input type of 'circuits' argument was list of QuantumCircuit object."
         )
+
+    # repeat until all queued qcs are assigned
+    transpiled_circuit = []
+    num_usage = []
+    for _transpiled, _num_usage in _compose(
+        queued_qc,
+        backend=backend,
+        basis_gates=basis_gates,
+        backend_properties=backend_properties,
+        coupling_map=coupling_map,
+        routing_method=routing_method,
+        scheduling_method=scheduling_method,
+        num_buffer=num_buffer,
+        translation_cache=translation_cache,
+        packing_strategy=packing_strategy,
+        instruction_durations=instruction_durations,
+        duration_imbalance=duration_imbalance,
+        working_set_size=None,
+        region_parallel=region_parallel,
+        max_workers=max_workers,
+    ):
+        transpiled_circuit.append(_transpiled)
+        num_usage.append(_num_usage)
+
+    outputs = [transpiled_circuit]
+    if return_num_usage:
+        outputs.append(num_usage)
+    if return_schedule_analytics:
+        if instruction_durations is None:
+            if backend is None:
+                raise ValueError(
+                    "instruction_durations or backend is required for schedule analytics"
+                )
+            instruction_durations = InstructionDurations.from_backend(backend)
+        outputs.append(
+            [
+                _schedule_analytics(qc, instruction_durations, scheduling_method)
+                for qc in transpiled_circuit
+            ]
+        )
+
+    if len(transpiled_circuit) == 1:
+        outputs = [output[0] for output in outputs]
+    if len(outputs) == 1:
+        return outputs[0]
+    return tuple(outputs)
+
+
+def iter_dynamic_multiqc_compose(
+    queued_qc: Iterable[QuantumCircuit],
+    backend: Optional[Union[Backend, BaseBackend]] = None,
+    basis_gates: Optional[List[str]] = None,
+    backend_properties: Optional[BackendProperties] = None,
+    coupling_map=None,
+    routing_method=None,
+    scheduling_method=None,
+    num_buffer=0,
+    translation_cache: Optional[TranslationCache] = None,
+    packing_strategy: Optional[PackingStrategy] = None,
+    instruction_durations: Optional[InstructionDurations] = None,
+    duration_imbalance: Optional[float] = None,
+    working_set_size: int = 64,
+    region_parallel=False,
+    max_workers: Optional[int] = None,
+) -> Iterator[QuantumCircuit]:
+    """Bounded-memory version of dynamic_multiqc_compose for very large queues
+
+    Circuits are pulled from queued_qc only when the working set has room for them,
+    and each composite is yielded as soon as it is transpiled. Peak memory grows with
+    working_set_size instead of the length of the queue.
+
+    Args:
+        queued_qc: Iterable of quantum circuits, e.g. a generator loading circuits lazily.
+        working_set_size: the number of translated circuits kept for packing composites.
+        others: same as dynamic_multiqc_compose
+
+    Yields:
+        composed and transpiled QuantumCircuit
+    """
+    if not isinstance(working_set_size, int) or working_set_size < 1:
+        raise ValueError("working_set_size must be positive int")
+
+    for _transpiled, _ in _compose(
+        queued_qc,
+        backend=backend,
+        basis_gates=basis_gates,
+        backend_properties=backend_properties,
+        coupling_map=coupling_map,
+        routing_method=routing_method,
+        scheduling_method=scheduling_method,
+        num_buffer=num_buffer,
+        translation_cache=translation_cache,
+        packing_strategy=packing_strategy,
+        instruction_durations=instruction_durations,
+        duration_imbalance=duration_imbalance,
+        working_set_size=working_set_size,
+        region_parallel=region_parallel,
+        max_workers=max_workers,
+    ):
+        yield _transpiled
+
+
+def _compose(
+    queued_qc,
+    backend,
+    basis_gates,
+    backend_properties,
+    coupling_map,
+    routing_method,
+    scheduling_method,
+    num_buffer,
+    translation_cache,
+    packing_strategy,
+    instruction_durations,
+    duration_imbalance,
+    working_set_size,
+    region_parallel=False,
+    max_workers=None,
+) -> Iterator[Tuple[QuantumCircuit, int]]:
+    """Compose queued circuits and yield each transpiled composite with its number of
+    program qubits. Translated circuits are kept in a working set of working_set_size
+    (unlimited if None) and refilled from queued_qc after each composite."""
+
     # get backend information
     backend_properties = _backend_properties(backend_properties, backend)
-    coupling_map = _coupling_map(coupling_map=coupling_map, backend=backend)
+    coupling_map = _coupling_map(
+        coupling_map=coupling_map, backend=backend, properties=backend_properties
+    )
 
     # decompose all queued qc by basis_gate
     if basis_gates:
@@ -77,47 +245,112 @@ def dynamic_multiqc_compose(
         basis_gates = backend.configuration().basis_gates
     else:
         basis_gates = ["id", "rz", "sx", "x", "cx", "reset"]
-    queued_qc = [transpile(_qc, basis_gates=basis_gates) for _qc in queued_qc]
-
-    # alter the register name identically
-    queued_qc = _alter_reg_names(queued_qc)
-
-    # repeat until all queued qcs are assigned
-    composed_circuits = []
-    while len(queued_qc) > 0:
-        comp_qc, layout, name_list, queued_qc = _sequential_layout(
-            queued_qc,
-            len(backend_properties.qubits),
-            backend_properties,
-            num_buffer,
-        )
-        composed_circuits.append((comp_qc, layout))
 
-    # apply qiskit pass managers except for layout pass
-    transpiled_circuit = []
-    num_usage = []
-    for comp_qc, layout in composed_circuits:
-        num_usage.append(comp_qc.num_qubits)
-        _transpied = transpile(
-            circuits=comp_qc,
-            backend=backend,
-            basis_gates=basis_gates,
-            coupling_map=coupling_map,
-            backend_properties=backend_properties,
-            initial_layout=layout,
-            routing_method=routing_method,
-            scheduling_method=scheduling_method,
+    if instruction_durations is None and backend is not None:
+        instruction_durations = InstructionDurations.from_backend(backend)
+    if packing_strategy is not None and duration_imbalance is not None:
+        raise ValueError(
+            "duration_imbalance is only used by the default packing strategy, "
+            "set imbalance_tolerance of DurationBalancedPacking instead"
         )
-        transpiled_circuit.append(_transpied)
-
-    if return_num_usage:
-        if len(transpiled_circuit) == 1:
-            return transpiled_circuit[0], num_usage[0]
-        return transpiled_circuit, num_usage
+    if packing_strategy is None:
+        if duration_imbalance is not None:
+            if instruction_durations is None:
+                raise ValueError(
+                    "instruction_durations or backend is required for duration_imbalance"
+                )
+            packing_strategy = DurationBalancedPacking(
+                instruction_durations, imbalance_tolerance=duration_imbalance
+            )
+        else:
+            packing_strategy = CxDifferencePacking()
 
-    if len(transpiled_circuit) == 1:
-        return transpiled_circuit[0]
-    return transpiled_circuit
+    # one pool of worker processes for all the composites
+    if region_parallel and max_workers != 1:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        pool = nullcontext()
+    with pool as executor:
+        queued_iter = enumerate(queued_qc)
+        working_set = []
+        while True:
+            # pull next qcs into the working set
+            for i, _qc in queued_iter:
+                with profile_stage("translate"):
+                    if translation_cache is not None:
+                        _qc = translation_cache.translate(_qc, basis_gates=basis_gates)
+                    else:
+                        _qc = transpile(_qc, basis_gates=basis_gates)
+
+                # alter the register name identically
+                with profile_stage("_alter_reg_names"):
+                    working_set += _alter_reg_names([_qc], start=i)
+                if (
+                    working_set_size is not None
+                    and len(working_set) >= working_set_size
+                ):
+                    break
+            if not working_set:
+                break
+
+            with profile_stage("_sequential_layout"):
+                comp_qc, layout, name_list, working_set = _sequential_layout(
+                    working_set,
+                    len(backend_properties.qubits),
+                    backend_properties,
+                    num_buffer,
+                    packing_strategy,
+                )
+
+            if region_parallel:
+                with profile_stage("region_parallel_transpile"):
+                    _transpied = region_parallel_transpile(
+                        comp_qc,
+                        initial_layout=layout,
+                        coupling_map=coupling_map,
+                        basis_gates=basis_gates,
+                        backend_properties=backend_properties,
+                        routing_method=routing_method,
+                        scheduling_method=scheduling_method,
+                        instruction_durations=instruction_durations,
+                        max_workers=max_workers,
+                        executor=executor,
+                    )
+                yield _transpied, comp_qc.num_qubits
+                continue
+
+            # apply the same pass manager as region_parallel_transpile on the layout
+            with profile_stage("multi_pass_manager"):
+                config = PassManagerConfig(
+                    initial_layout=layout,
+                    basis_gates=basis_gates,
+                    coupling_map=coupling_map,
+                    routing_method=routing_method,
+                    scheduling_method=scheduling_method,
+                    instruction_durations=instruction_durations,
+                    backend_properties=backend_properties,
+                )
+                _transpied = multi_pass_manager(config).run(
+                    comp_qc, callback=pass_callback()
+                )
+            yield _transpied, comp_qc.num_qubits
+
+
+def _schedule_analytics(
+    qc: QuantumCircuit,
+    instruction_durations: InstructionDurations,
+    scheduling_method: Optional[str],
+) -> dict:
+    """Schedule the transpiled composite and return the schedule analytics."""
+    if scheduling_method in {"asap", "as_soon_as_possible"}:
+        scheduler = MultiASAPSchedule(instruction_durations)
+    else:
+        scheduler = MultiALAPSchedule(instruction_durations)
+    # identify programs by the registers of the initial layout
+    scheduler.property_set["layout"] = qc._layout
+    time_unit = "s" if instruction_durations.dt is not None else "dt"
+    scheduler.run(circuit_to_dag(qc), time_unit=time_unit)
+    return scheduler.property_set["schedule_analytics"]
 
 
 def _sequential_layout(
@@ -125,6 +358,7 @@ def _sequential_layout(
     num_hw_qubits,
     backend_properties,
     num_buffer,
+    packing_strategy,
 ) -> Tuple[QuantumCircuit, List[QuantumCircuit]]:
 
     init_dag = None
@@ -133,27 +367,26 @@ def _sequential_layout(
         n_hop=num_buffer,
     )
 
-    num_cx_before = 0
+    packed_qcs = []
     qc_names = []
 
     while queued_circuits:
         if not bm_layout.hw_still_available:
             break
 
-        qc, num_cx = _select_next_qc(queued_circuits)
-
-        # check difference of number of CX gate to previous mapped QC
-        if num_cx > num_cx_before + 10:
+        # select next qc for the composite
+        index = packing_strategy.select(queued_circuits, packed_qcs, bm_layout)
+        if index is None:
             break
+        qc = queued_circuits.pop(index)
 
         dag = circuit_to_dag(qc)
-        allocated_dag = bm_layout.run(next_dag=dag, init_dag=init_dag)
-
-        # update number of CX pointer
-        num_cx_before = num_cx
+        with profile_stage("BufferedMultiLayout.run"):
+            allocated_dag = bm_layout.run(next_dag=dag, init_dag=init_dag)
 
         # save qc name
         if bm_layout.hw_still_available:
+            packed_qcs.append(qc)
             qc_names.append(qc.name)
 
         init_dag = allocated_dag
@@ -168,18 +401,24 @@ def _sequential_layout(
     return composed_circuit, layout, qc_names, queued_circuits
 
 
-def _select_next_qc(queue: List[QuantumCircuit]) -> QuantumCircuit:
-    queue.sort(key=lambda x: x.count_ops().get("cx", 0))
-    next_qc = queue.pop(0)
-    num_cx = next_qc.count_ops().get("cx", 0)
-    return next_qc, num_cx
-
+def _alter_reg_names(
+    queue: List[QuantumCircuit], start: int = 0
+) -> List[QuantumCircuit]:
+    """Rename the registers of each queued circuit so that they are unique in the queue.
 
-def _alter_reg_names(queue: List[QuantumCircuit]) -> List[QuantumCircuit]:
+    The renamed circuit is rebuilt once from the instructions of the original circuit
+    by mapping each bit onto the bit of the renamed register at the same position.
+    Instructions are shared with the original circuit except for conditioned ones,
+    whose condition must point to the renamed classical register.
+    ``start`` is the position of the first circuit in the whole queue.
+    """
 
     new_queue = []
-    for i, _qc in enumerate(queue):
-        new_qc = QuantumCircuit(name=_qc.name)
+    for i, _qc in enumerate(queue, start):
+        new_qc = QuantumCircuit(name=_qc.name, global_phase=_qc.global_phase)
+        new_qc.calibrations = _qc.calibrations
+        bit_map = {}
+        creg_map = {}
         # add quantum register
         for k, _qreg in enumerate(_qc.qregs):
             num_qubits = _qreg.size
@@ -190,6 +429,7 @@ def _alter_reg_names(queue: List[QuantumCircuit]) -> List[QuantumCircuit]:
             )
             new_qreg = QuantumRegister(size=num_qubits, name=qreg_name)
             new_qc.add_register(new_qreg)
+            bit_map.update(zip(_qreg, new_qreg))
 
         for k, _creg in enumerate(_qc.cregs):
             num_clbits = _creg.size
@@ -200,13 +440,24 @@ def _alter_reg_names(queue: List[QuantumCircuit]) -> List[QuantumCircuit]:
             )
             new_creg = ClassicalRegister(size=num_clbits, name=creg_name)
             new_qc.add_register(new_creg)
+            bit_map.update(zip(_creg, new_creg))
+            creg_map[_creg] = new_creg
+
+        for instruction, qargs, cargs in _qc.data:
+            if instruction.condition is not None:
+                cond_reg, cond_val = instruction.condition
+                instruction = instruction.copy()
+                instruction.condition = (
+                    creg_map[cond_reg] if cond_reg in creg_map else bit_map[cond_reg],
+                    cond_val,
+                )
+            new_qc._append(
+                instruction,
+                [bit_map[_q] for _q in qargs],
+                [bit_map[_c] for _c in cargs],
+            )
 
-        _dag = circuit_to_dag(_qc)
-        new_dag = circuit_to_dag(new_qc)
-
-        new_dag.compose(_dag, qubits=new_dag.qubits, clbits=new_dag.clbits)
-
-        new_queue.append(dag_to_circuit(new_dag))
+        new_queue.append(new_qc)
     return new_queue
 
 
@@ -218,61 +469,113 @@ def _backend_properties(backend_properties, backend):
     return backend_properties
 
 
-def _create_faulty_qubits_map(backend):
+def _create_faulty_qubits_map(backend, properties=None):
     """If the backend has faulty qubits, those should be excluded. A faulty_qubit_map is a map
     from working qubit in the backend to dummy qubits that are consecutive and connected."""
 
     faulty_qubits_map = None
     if backend is not None:
-        if backend.properties():
-            faulty_qubits = backend.properties().faulty_qubits()
-            faulty_edges = [
-                gates.qubits for gates in backend.properties().faulty_gates()
-            ]
-        else:
-            faulty_qubits = []
-            faulty_edges = []
-
-        if faulty_qubits or faulty_edges:
-            faulty_qubits_map = {}
-            configuration = backend.configuration()
-            full_coupling_map = configuration.coupling_map
-            functional_cm_list = [
-                edge
-                for edge in full_coupling_map
-                if (set(edge).isdisjoint(faulty_qubits) and edge not in faulty_edges)
-            ]
-
-            connected_working_qubits = CouplingMap(
-                functional_cm_list
-            ).largest_connected_component()
-            dummy_qubit_counter = 0
-            for qubit in range(configuration.n_qubits):
-                if qubit in connected_working_qubits:
-                    faulty_qubits_map[qubit] = dummy_qubit_counter
-                    dummy_qubit_counter += 1
-                else:
-                    faulty_qubits_map[qubit] = None
+        topology = _backend_topology(backend, properties)
+        faulty_qubits_map = topology.faulty_qubits_map
     return faulty_qubits_map
 
 
-def _coupling_map(coupling_map, backend):
+def _coupling_map(coupling_map, backend, properties=None):
     # try getting coupling_map from user, else backend
+    # properties already fetched from the backend are reused for its topology
     if coupling_map is None:
         if getattr(backend, "configuration", None):
-            configuration = backend.configuration()
-            if hasattr(configuration, "coupling_map") and configuration.coupling_map:
-                faulty_map = _create_faulty_qubits_map(backend)
-                if faulty_map:
-                    coupling_map = CouplingMap()
-                    for qubit1, qubit2 in configuration.coupling_map:
-                        if (
-                            faulty_map[qubit1] is not None
-                            and faulty_map[qubit2] is not None
-                        ):
-                            coupling_map.add_edge(
-                                faulty_map[qubit1], faulty_map[qubit2]
-                            )
-                else:
-                    coupling_map = CouplingMap(configuration.coupling_map)
+            coupling_map = _backend_topology(backend, properties).coupling_map
+    elif isinstance(coupling_map, list):
+        # multi_pass_manager takes a CouplingMap instead of a list of edges
+        coupling_map = CouplingMap(coupling_map)
     return coupling_map
+
+
+# topology artifacts derived from the backends, memoized per backend name and
+# calibration timestamp in a bounded LRU
+_BackendTopology = namedtuple(
+    "_BackendTopology",
+    ["faulty_qubits_map", "connected_working_qubits", "coupling_map"],
+)
+_backend_topology_cache = OrderedDict()
+_BACKEND_TOPOLOGY_CACHE_SIZE = 32
+
+
+def _backend_topology(backend, properties=None) -> _BackendTopology:
+    """Derive the faulty qubits map, the connected working qubits and the coupling map
+    of the backend. Those are computed only once for each calibration of the backend.
+    Faulty qubits and gates are a part of the key, since they can be updated without
+    a new calibration timestamp. Each caller gets its own copy of the cached topology."""
+
+    if properties is None:
+        properties = backend.properties()
+    if properties:
+        faulty_qubits = properties.faulty_qubits()
+        faulty_edges = [gates.qubits for gates in properties.faulty_gates()]
+    else:
+        faulty_qubits = []
+        faulty_edges = []
+
+    calib_time = getattr(properties, "last_update_date", None)
+    key = (
+        backend.name(),
+        calib_time,
+        tuple(faulty_qubits),
+        tuple(tuple(edge) for edge in faulty_edges),
+    )
+    topology = _backend_topology_cache.get(key) if calib_time is not None else None
+    if topology is not None:
+        _backend_topology_cache.move_to_end(key)
+        return copy.deepcopy(topology)
+
+    configuration = backend.configuration()
+    full_coupling_map = getattr(configuration, "coupling_map", None)
+
+    faulty_qubits_map = None
+    connected_working_qubits = None
+    coupling_map = None
+    if faulty_qubits or faulty_edges:
+        faulty_qubits_map = {}
+        functional_cm_list = [
+            edge
+            for edge in full_coupling_map or []
+            if (set(edge).isdisjoint(faulty_qubits) and edge not in faulty_edges)
+        ]
+
+        connected_working_qubits = set(
+            CouplingMap(functional_cm_list).largest_connected_component()
+        )
+        dummy_qubit_counter = 0
+        for qubit in range(configuration.n_qubits):
+            if qubit in connected_working_qubits:
+                faulty_qubits_map[qubit] = dummy_qubit_counter
+                dummy_qubit_counter += 1
+            else:
+                faulty_qubits_map[qubit] = None
+
+    if full_coupling_map:
+        if faulty_qubits_map:
+            # dummy qubits are consecutive, so the edge list is given at once
+            coupling_map = CouplingMap(
+                [
+                    [faulty_qubits_map[qubit1], faulty_qubits_map[qubit2]]
+                    for qubit1, qubit2 in full_coupling_map
+                    if (
+                        faulty_qubits_map[qubit1] is not None
+                        and faulty_qubits_map[qubit2] is not None
+                    )
+                ]
+            )
+        else:
+            coupling_map = CouplingMap(full_coupling_map)
+
+    topology = _BackendTopology(
+        faulty_qubits_map, connected_working_qubits, coupling_map
+    )
+    if calib_time is not None:
+        _backend_topology_cache[key] = topology
+        if len(_backend_topology_cache) > _BACKEND_TOPOLOGY_CACHE_SIZE:
+            _backend_topology_cache.popitem(last=False)
+        return copy.deepcopy(topology)
+    return topology
@@ -0,0 +1,277 @@
+# qiskit version: 0.29.0
+
+# import python tools
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+# import qiskit tools
+from qiskit.circuit.quantumcircuit import QuantumCircuit
+from qiskit.converters import isinstancelist
+from qiskit.providers import BaseBackend
+from qiskit.providers.backend import Backend
+from qiskit.providers.exceptions import BackendPropertyError
+from qiskit.transpiler import InstructionDurations, TranspilerError
+
+# import palloq tools
+from palloq.compiler.dynamic_multiqc_compose import dynamic_multiqc_compose
+from palloq.compiler.packing import estimate_duration, mean_durations
+from palloq.utils.translation_cache import TranslationCache
+
+logger = logging.getLogger(__name__)
+
+
+def multi_backend_dispatch(
+    queued_qc: List[QuantumCircuit],
+    backends: List[Union[Backend, BaseBackend]],
+    max_workers: Optional[int] = None,
+    refine_rounds: int = 0,
+    **compose_options,
+) -> Dict[str, dict]:
+    """Partition queued circuits across several backends and compose them concurrently
+
+    Each queued circuit is assigned to a backend in descending order of its load so that
+    the estimated completion time of the busiest backend is minimized (LPT scheduling).
+    The load of a circuit on a backend is its estimated duration weighted by the share
+    of the device it occupies, since composites run programs concurrently.
+    Then dynamic_multiqc_compose runs for each backend in parallel processes, and the
+    makespan and the fidelity of each plan are estimated from the composed circuits.
+
+    The circuits are translated once per basis gate set through a TranslationCache,
+    the translation_cache in compose_options or a temporary one, so that the
+    composition reuses the translations made for the partition.
+
+    Args:
+        queued_qc: List of quantum circuits to execute
+        backends: List of backends to dispatch the circuits. Backends and circuits must
+                  be picklable.
+        max_workers: the number of worker processes. Composition runs in this process
+                     if max_workers is 1.
+        refine_rounds: the number of rounds to refine the partition. In each round, the
+                       loads on each backend are scaled by the makespan of its plan
+                       over the estimated completion time, the queue is partitioned
+                       again and the backends with new circuits are composed again.
+                       The new plans are kept only if the largest makespan decreases.
+        compose_options: keyword arguments passed to dynamic_multiqc_compose
+
+    Returns:
+        dict from backend name to its plan, a dict with the keys
+            "backend": the backend,
+            "circuits": queued circuits assigned to the backend,
+            "composites": composed circuits for the backend,
+            "makespan": estimated total duration of the composites in seconds,
+            "fidelity": mean estimated success probability of the composites
+    """
+    if not isinstancelist(queued_qc):
+        raise TypeError(
+            "Expected input type of 'circuits' argument was list of QuantumCircuit object."
+        )
+    if not backends:
+        raise ValueError("At least one backend is required")
+    if not isinstance(refine_rounds, int) or refine_rounds < 0:
+        raise ValueError("refine_rounds must be non-negative int")
+
+    names = [backend.name() for backend in backends]
+    if len(set(names)) != len(names):
+        raise ValueError("Backends must have unique names")
+
+    if compose_options.get("translation_cache") is None:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            compose_options["translation_cache"] = TranslationCache(cache_dir)
+            return _dispatch(
+                queued_qc, backends, max_workers, refine_rounds, compose_options
+            )
+    return _dispatch(queued_qc, backends, max_workers, refine_rounds, compose_options)
+
+
+def _dispatch(queued_qc, backends, max_workers, refine_rounds, compose_options):
+    names = [backend.name() for backend in backends]
+
+    # 1. partition the queue
+    loads = _estimate_loads(
+        queued_qc,
+        backends,
+        compose_options["translation_cache"],
+        compose_options.get("basis_gates"),
+    )
+    partition, estimates = _partition_queue(queued_qc, backends, loads)
+
+    # 2. compose the circuits for each backend concurrently
+    plans = _compose_plans(backends, partition, max_workers, compose_options)
+
+    # 3. refine the partition by the makespans of the plans
+    for _ in range(refine_rounds):
+        scales = [
+            plans[name][1] / estimate if name in plans and estimate > 0 else 1.0
+            for name, estimate in zip(names, estimates)
+        ]
+        loads = [
+            [None if load is None else load * scale for load in backend_loads]
+            for backend_loads, scale in zip(loads, scales)
+        ]
+        new_partition, new_estimates = _partition_queue(queued_qc, backends, loads)
+        changed = [
+            backend
+            for backend, name in zip(backends, names)
+            if list(map(id, new_partition[name])) != list(map(id, partition[name]))
+        ]
+        if not changed:
+            break
+        new_plans = {
+            name: plan for name, plan in plans.items() if name in new_partition
+        }
+        for backend in changed:
+            new_plans.pop(backend.name(), None)
+        new_plans.update(
+            _compose_plans(changed, new_partition, max_workers, compose_options)
+        )
+        if _max_makespan(new_plans) >= _max_makespan(plans):
+            break
+        partition, estimates, plans = new_partition, new_estimates, new_plans
+
+    result = {}
+    for backend, name in zip(backends, names):
+        composites, makespan, fidelity = plans.get(name, ([], 0.0, 1.0))
+        result[name] = {
+            "backend": backend,
+            "circuits": partition[name],
+            "composites": composites,
+            "makespan": makespan,
+            "fidelity": fidelity,
+        }
+        if partition[name]:
+            logger.info(
+                f"{name}: {len(partition[name])} circuits in {len(composites)} "
+                f"composites, makespan {makespan:.3e} s, fidelity {fidelity:.3f}"
+            )
+    return result
+
+
+def _estimate_loads(
+    queued_qc: List[QuantumCircuit], backends, translation_cache, basis_gates=None
+) -> List[List[Optional[float]]]:
+    """Estimated load of each circuit on each backend (None if it does not fit)."""
+    loads = []
+    for backend in backends:
+        configuration = backend.configuration()
+        backend_basis_gates = basis_gates or configuration.basis_gates
+        gate_durations = mean_durations(InstructionDurations.from_backend(backend))
+        loads.append(
+            [
+                estimate_duration(
+                    translation_cache.translate(_qc, basis_gates=backend_basis_gates),
+                    gate_durations,
+                )
+                * _qc.num_qubits
+                / configuration.n_qubits
+                if _qc.num_qubits <= configuration.n_qubits
+                else None
+                for _qc in queued_qc
+            ]
+        )
+
+    for i, _qc in enumerate(queued_qc):
+        if all(load[i] is None for load in loads):
+            raise ValueError(f"Circuit {_qc.name} is larger than any of the backends")
+    return loads
+
+
+def _partition_queue(
+    queued_qc: List[QuantumCircuit], backends, loads
+) -> Tuple[Dict[str, List[QuantumCircuit]], List[float]]:
+    """Assign each circuit to a backend by LPT scheduling of the loads.
+
+    Returns:
+        dict from backend name to its circuits, and the estimated completion time of
+        each backend
+    """
+    # longest processing time first
+    order = sorted(
+        range(len(queued_qc)),
+        key=lambda i: max(load[i] for load in loads if load[i] is not None),
+        reverse=True,
+    )
+    completion_time = [0.0] * len(backends)
+    partition = {backend.name(): [] for backend in backends}
+    for i in order:
+        candidates = [b for b in range(len(backends)) if loads[b][i] is not None]
+        best = min(candidates, key=lambda b: completion_time[b] + loads[b][i])
+        completion_time[best] += loads[best][i]
+        partition[backends[best].name()].append(queued_qc[i])
+    return partition, completion_time
+
+
+def _compose_plans(backends, partition, max_workers, compose_options) -> dict:
+    """dict from backend name to (composites, makespan, fidelity) of its circuits"""
+    jobs = [
+        (backend, partition[backend.name()], compose_options)
+        for backend in backends
+        if partition[backend.name()]
+    ]
+    if max_workers == 1 or len(jobs) <= 1:
+        plans = list(map(_compose_plan, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            plans = list(executor.map(_compose_plan, jobs))
+    return {backend.name(): plan for (backend, _, _), plan in zip(jobs, plans)}
+
+
+def _max_makespan(plans) -> float:
+    return max((makespan for _, makespan, _ in plans.values()), default=0.0)
+
+
+def _compose_plan(job):
+    backend, circuits, compose_options = job
+    composites = dynamic_multiqc_compose(
+        queued_qc=list(circuits), backend=backend, **compose_options
+    )
+    if isinstance(composites, tuple):
+        # return_num_usage
+        composites = composites[0]
+    if isinstance(composites, QuantumCircuit):
+        composites = [composites]
+
+    durations = InstructionDurations.from_backend(backend)
+    properties = backend.properties()
+    makespan = sum(_composite_duration(qc, durations) for qc in composites)
+    fidelity = sum(_composite_fidelity(qc, properties) for qc in composites) / len(
+        composites
+    )
+    return composites, makespan, fidelity
+
+
+def _composite_duration(qc: QuantumCircuit, durations: InstructionDurations) -> float:
+    """Duration of the physical circuit as the longest path through its instructions."""
+    qubit_index = {q: i for i, q in enumerate(qc.qubits)}
+    qubit_time_available = [0.0] * qc.num_qubits
+    for instruction, qargs, _ in qc.data:
+        if not qargs:
+            continue
+        indices = [qubit_index[q] for q in qargs]
+        try:
+            duration = durations.get(instruction, indices, unit="s")
+        except TranspilerError:
+            duration = 0.0
+        stop_time = max(qubit_time_available[i] for i in indices) + duration
+        for i in indices:
+            qubit_time_available[i] = stop_time
+    return max(qubit_time_available, default=0.0)
+
+
+def _composite_fidelity(qc: QuantumCircuit, properties) -> float:
+    """Estimated success probability of the physical circuit from gate and readout errors."""
+    if properties is None:
+        return 1.0
+    qubit_index = {q: i for i, q in enumerate(qc.qubits)}
+    fidelity = 1.0
+    for instruction, qargs, _ in qc.data:
+        indices = [qubit_index[q] for q in qargs]
+        try:
+            if instruction.name == "measure":
+                fidelity *= 1.0 - properties.readout_error(indices[0])
+            else:
+                fidelity *= 1.0 - properties.gate_error(instruction.name, indices)
+        except BackendPropertyError:
+            continue
+    return fidelity
@@ -0,0 +1,281 @@
+# qiskit version: 0.29.0
+
+# import python tools
+import abc
+import bisect
+from collections import defaultdict
+from typing import Dict, List, Optional
+import networkx as nx
+
+# import qiskit tools
+from qiskit.circuit.quantumcircuit import QuantumCircuit
+from qiskit.transpiler.instruction_durations import InstructionDurations
+from qiskit.utils import apply_prefix
+
+# import palloq tools
+from palloq.transpiler.passes.layout.buffered_layout import BufferedMultiLayout
+
+
+def num_cx(qc: QuantumCircuit) -> int:
+    return qc.count_ops().get("cx", 0)
+
+
+def cx_density(qc: QuantumCircuit) -> float:
+    """Number of CX gates per qubit"""
+    return num_cx(qc) / max(qc.num_qubits, 1)
+
+
+def connected_capacity(bm_layout: BufferedMultiLayout) -> int:
+    """Number of hardware qubits a next program can still be mapped onto as a connected region."""
+    return min(bm_layout.largest_hw_qubits, len(bm_layout.available_hw_qubits))
+
+
+def free_regions(bm_layout: BufferedMultiLayout) -> List[int]:
+    """Sizes of the connected regions of available hardware qubits in ascending order."""
+    available = bm_layout.swap_graph.subgraph(bm_layout.available_hw_qubits)
+    return sorted(len(region) for region in nx.connected_components(available))
+
+
+class PackingStrategy(metaclass=abc.ABCMeta):
+    """
+    Strategy to decide which queued programs are packed into the same composite.
+
+    Composites are filled one by one. Every time a program is mapped by
+    BufferedMultiLayout, the strategy selects the next queued program to add to
+    the composite, or closes the composite by returning None.
+    """
+
+    @abc.abstractmethod
+    def select(
+        self,
+        queue: List[QuantumCircuit],
+        composite: List[QuantumCircuit],
+        bm_layout: BufferedMultiLayout,
+    ) -> Optional[int]:
+        """
+        Select the next program for the composite
+
+        Arguments:
+            queue: (list) queued programs which are not allocated yet
+            composite: (list) programs already packed into the composite
+            bm_layout: (BufferedMultiLayout) layout pass holding the hardware usage
+        Returns:
+            index of the selected program in queue, or None to close the composite
+        """
+        pass
+
+
+class CxDifferencePacking(PackingStrategy):
+    """
+    Pack programs in ascending order of the number of CX gates until the difference
+    of the number of CX gates from the previously packed program exceeds max_cx_gap.
+
+    Arguments:
+        max_cx_gap: (int) allowed increase of the number of CX gates
+    """
+
+    def __init__(self, max_cx_gap: int = 10):
+        self.max_cx_gap = max_cx_gap
+
+    def select(self, queue, composite, bm_layout):
+        queue.sort(key=num_cx)
+        if not composite:
+            return 0
+
+        # check difference of number of CX gate to previous mapped QC
+        if num_cx(queue[0]) > num_cx(composite[-1]) + self.max_cx_gap:
+            return None
+        return 0
+
+
+class FirstFitDecreasingPacking(PackingStrategy):
+    """
+    Pack programs in descending order of the number of qubits.
+    The first program that fits the remaining connected hardware is packed.
+    """
+
+    def select(self, queue, composite, bm_layout):
+        queue.sort(key=lambda qc: qc.num_qubits, reverse=True)
+        if not composite:
+            return 0
+
+        capacity = connected_capacity(bm_layout)
+        for i, qc in enumerate(queue):
+            if qc.num_qubits <= capacity:
+                return i
+        return None
+
+
+class BestFitPacking(PackingStrategy):
+    """
+    Pack the program that leaves the fewest hardware qubits in the smallest free
+    connected region that can hold it. Ties are broken by the smaller number of
+    CX gates.
+    """
+
+    def select(self, queue, composite, bm_layout):
+        if not composite:
+            # open the composite with the largest program
+            return max(range(len(queue)), key=lambda i: queue[i].num_qubits)
+
+        regions = free_regions(bm_layout)
+        best_index = None
+        best_fit = None
+        for i, qc in enumerate(queue):
+            index = bisect.bisect_left(regions, qc.num_qubits)
+            if index == len(regions):
+                continue
+            fit = (regions[index] - qc.num_qubits, num_cx(qc))
+            if best_fit is None or fit < best_fit:
+                best_index = i
+                best_fit = fit
+        return best_index
+
+
+class CxDensityClusterPacking(PackingStrategy):
+    """
+    Pack programs whose CX density (number of CX gates per qubit) is similar.
+
+    The composite is opened with the program of the lowest CX density. Next, the
+    program closest to the mean density of the composite is packed as long as its
+    difference from the mean is within tolerance relative to the mean
+    (or to one CX gate per qubit for sparse composites).
+
+    Arguments:
+        tolerance: (float) allowed relative difference of CX density
+    """
+
+    def __init__(self, tolerance: float = 0.5):
+        if tolerance < 0:
+            raise ValueError("tolerance must be non-negative")
+        self.tolerance = tolerance
+
+    def select(self, queue, composite, bm_layout):
+        queue.sort(key=cx_density)
+        if not composite:
+            return 0
+
+        mean_density = sum(cx_density(qc) for qc in composite) / len(composite)
+        capacity = connected_capacity(bm_layout)
+        best_index = None
+        best_diff = None
+        for i, qc in enumerate(queue):
+            if qc.num_qubits > capacity:
+                continue
+            diff = abs(cx_density(qc) - mean_density)
+            if best_diff is None or diff < best_diff:
+                best_index = i
+                best_diff = diff
+
+        if best_index is None:
+            return None
+        if best_diff > self.tolerance * max(mean_density, 1.0):
+            return None
+        return best_index
+
+
+def mean_durations(instruction_durations: InstructionDurations) -> Dict[str, float]:
+    """
+    Mean duration of each instruction over the physical qubits in seconds.
+    The durations stay in dt if all of them are in dt and dt is unknown.
+
+    Raises:
+        ValueError: if the durations mix dt and seconds but dt is unknown
+    """
+    dt = instruction_durations.dt
+    samples = defaultdict(list)
+    units = set()
+    entries = list(instruction_durations.duration_by_name.items())
+    entries += [
+        (name, value)
+        for (name, _), value in instruction_durations.duration_by_name_qubits.items()
+    ]
+    for name, (duration, unit) in entries:
+        if unit == "dt":
+            if dt is not None:
+                duration, unit = duration * dt, "s"
+        elif unit != "s":
+            duration, unit = apply_prefix(duration, unit), "s"
+        units.add(unit)
+        samples[name].append(duration)
+    if len(units) > 1:
+        raise ValueError(
+            "instruction_durations mix durations in dt and in seconds, but dt is unknown"
+        )
+    return {name: sum(values) / len(values) for name, values in samples.items()}
+
+
+def estimate_duration(qc: QuantumCircuit, gate_durations: Dict[str, float]) -> float:
+    """
+    Estimate the duration of the program as the longest path through its instructions.
+    Each instruction takes the mean duration of its name over the physical qubits,
+    since the program is not mapped yet. Unknown instructions take no time.
+    """
+    qubit_time_available = defaultdict(float)
+    for instruction, qargs, _ in qc.data:
+        if not qargs:
+            continue
+        start_time = max(qubit_time_available[q] for q in qargs)
+        stop_time = start_time + gate_durations.get(instruction.name, 0.0)
+        for q in qargs:
+            qubit_time_available[q] = stop_time
+    return max(qubit_time_available.values(), default=0.0)
+
+
+class DurationBalancedPacking(PackingStrategy):
+    """
+    Pack programs with similar estimated durations to reduce idle time in composites.
+
+    The run time of a composite is set by its longest program. The composite is opened
+    with the longest program in the queue, and programs are packed in descending order
+    of duration as long as the imbalance (1 - duration / longest duration) is within
+    imbalance_tolerance.
+
+    Arguments:
+        instruction_durations: (InstructionDurations) durations of the backend,
+                               the same data MultiALAPSchedule consumes
+        imbalance_tolerance: (float) allowed imbalance of durations in [0, 1]
+    """
+
+    def __init__(
+        self,
+        instruction_durations: InstructionDurations,
+        imbalance_tolerance: float = 0.5,
+    ):
+        if not 0 <= imbalance_tolerance <= 1:
+            raise ValueError("imbalance_tolerance must be in [0, 1]")
+        self.imbalance_tolerance = imbalance_tolerance
+        self.gate_durations = mean_durations(instruction_durations)
+        # id of qc -> (qc, estimated duration)
+        self._durations = {}
+
+    def duration(self, qc: QuantumCircuit) -> float:
+        cached = self._durations.get(id(qc))
+        if cached is None or cached[0] is not qc:
+            cached = (qc, estimate_duration(qc, self.gate_durations))
+            self._durations[id(qc)] = cached
+        return cached[1]
+
+    def select(self, queue, composite, bm_layout):
+        if not composite:
+            # forget durations of the programs which already left the queue
+            queued_ids = {id(qc) for qc in queue}
+            self._durations = {
+                key: value
+                for key, value in self._durations.items()
+                if key in queued_ids
+            }
+
+        queue.sort(key=self.duration, reverse=True)
+        if not composite:
+            return 0
+
+        longest_duration = max(self.duration(qc) for qc in composite)
+        min_duration = (1 - self.imbalance_tolerance) * longest_duration
+        capacity = connected_capacity(bm_layout)
+        for i, qc in enumerate(queue):
+            if self.duration(qc) < min_duration:
+                break
+            if qc.num_qubits <= capacity:
+                return i
+        return None
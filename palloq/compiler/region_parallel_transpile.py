@@ -0,0 +1,216 @@
+# qiskit version: 0.29.0
+
+# import python tools
+import logging
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional
+
+# import qiskit tools
+from qiskit.circuit.quantumcircuit import QuantumCircuit, QuantumRegister
+from qiskit.transpiler import (
+    CouplingMap,
+    InstructionDurations,
+    Layout,
+    PassManager,
+    PassManagerConfig,
+)
+from qiskit.transpiler.exceptions import CouplingError
+from qiskit.transpiler.passes import TimeUnitConversion
+
+# import palloq tools
+from palloq.transpiler.passes import MultiALAPSchedule, MultiASAPSchedule
+from palloq.transpiler.preset_passmanagers.multi_pm import multi_pass_manager
+from palloq.utils.demultiplex import program_of_register
+from palloq.utils.profiler import pass_callback, profile_stage
+
+logger = logging.getLogger(__name__)
+
+
+def region_parallel_transpile(
+    composite: QuantumCircuit,
+    initial_layout: Layout,
+    coupling_map: CouplingMap,
+    basis_gates: Optional[List[str]] = None,
+    backend_properties=None,
+    routing_method=None,
+    scheduling_method=None,
+    instruction_durations: Optional[InstructionDurations] = None,
+    seed_transpiler=None,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> QuantumCircuit:
+    """Transpile a composite circuit by routing and optimizing each program separately
+
+    Programs placed on disjoint hardware regions by BufferedMultiLayout do not interact,
+    so each program is cut out of the composite and transpiled by multi_pass_manager on
+    the coupling map reduced to its region, in parallel processes. Each program is
+    relabeled onto the qubits of its region in order, so that regions of the same shape
+    share one cached pass manager. The transpiled programs are stitched back into a
+    circuit on the physical qubits, which is then scheduled as a whole if
+    scheduling_method is given.
+
+    The whole composite is transpiled at once instead if a gate acts on several
+    programs or if the region of a program is not connected.
+
+    Args:
+        composite: composite circuit whose registers are named by _alter_reg_names
+        initial_layout: layout of the qubits of the composite on the physical qubits
+        coupling_map: coupling map of the backend
+        basis_gates: basis gates to translate into
+        backend_properties: properties of the backend, used when the whole composite
+                            is transpiled at once
+        routing_method: routing method of multi_pass_manager
+        scheduling_method: "alap" or "asap" to schedule the stitched circuit
+        instruction_durations: durations of instructions for scheduling
+        seed_transpiler: seed of the routing
+        max_workers: the number of worker processes. Programs are transpiled in this
+                     process if max_workers is 1.
+        executor: pool of worker processes to reuse across calls. A new pool of
+                  max_workers processes is created for this call if not given.
+
+    Returns:
+        transpiled composite on the physical qubits
+    """
+    regions = _program_regions(composite, initial_layout, coupling_map)
+    if regions is None:
+        logger.info("Programs are not separable, transpile the whole composite")
+        config = PassManagerConfig(
+            initial_layout=initial_layout,
+            basis_gates=basis_gates,
+            coupling_map=coupling_map,
+            routing_method=routing_method,
+            scheduling_method=scheduling_method,
+            instruction_durations=instruction_durations,
+            backend_properties=backend_properties,
+            seed_transpiler=seed_transpiler,
+        )
+        return multi_pass_manager(config).run(composite, callback=pass_callback())
+
+    # 1. transpile the programs on their regions
+    jobs = [
+        (
+            program_qc,
+            PassManagerConfig(
+                initial_layout=local_layout,
+                basis_gates=basis_gates,
+                coupling_map=region_map,
+                routing_method=routing_method,
+                seed_transpiler=seed_transpiler,
+            ),
+        )
+        for program_qc, _, local_layout, region_map in regions
+    ]
+    if max_workers == 1 or len(jobs) <= 1:
+        transpiled = list(map(_transpile_region, jobs))
+    elif executor is not None:
+        transpiled = list(executor.map(_transpile_region, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            transpiled = list(executor.map(_transpile_region, jobs))
+
+    # 2. stitch the programs on the physical qubits
+    physical_qc = QuantumCircuit(
+        QuantumRegister(coupling_map.size(), "q"),
+        *composite.cregs,
+        name=composite.name,
+        global_phase=composite.global_phase,
+    )
+    for (_, region, _, _), program_qc in zip(regions, transpiled):
+        bit_map = {
+            qubit: physical_qc.qubits[region[j]]
+            for j, qubit in enumerate(program_qc.qubits)
+        }
+        bit_map.update({clbit: clbit for clbit in program_qc.clbits})
+        physical_qc.global_phase += program_qc.global_phase
+        for instruction, qargs, cargs in program_qc.data:
+            physical_qc._append(
+                instruction,
+                [bit_map[_q] for _q in qargs],
+                [bit_map[_c] for _c in cargs],
+            )
+    physical_qc._layout = initial_layout
+
+    # 3. schedule the stitched circuit
+    if scheduling_method:
+        if scheduling_method in {"alap", "as_late_as_possible"}:
+            scheduler = MultiALAPSchedule(instruction_durations)
+        elif scheduling_method in {"asap", "as_soon_as_possible"}:
+            scheduler = MultiASAPSchedule(instruction_durations)
+        else:
+            raise ValueError("Invalid scheduling method %s." % scheduling_method)
+        with profile_stage("schedule"):
+            physical_qc = PassManager(
+                [TimeUnitConversion(instruction_durations), scheduler]
+            ).run(physical_qc, callback=pass_callback())
+        physical_qc._layout = initial_layout
+
+    return physical_qc
+
+
+def _program_regions(composite, initial_layout, coupling_map):
+    """
+    Cut the composite into its programs
+
+    Returns:
+        list of (program circuit on the qubits of its region, physical qubits of its
+        region, trivial layout on the region, coupling map reduced to the region), or
+        None if the programs interact or a region is not connected
+    """
+    programs = OrderedDict()
+    for register in composite.qregs + composite.cregs:
+        programs.setdefault(program_of_register(register), []).append(register)
+
+    program_qcs = OrderedDict()
+    bit_program = {}
+    for program, registers in programs.items():
+        program_qcs[program] = QuantumCircuit(*registers, name=composite.name)
+        for register in registers:
+            bit_program.update((bit, program) for bit in register)
+
+    for instruction, qargs, cargs in composite.data:
+        bits_programs = {bit_program[bit] for bit in qargs + cargs}
+        if len(bits_programs) > 1:
+            return None
+        if not bits_programs:
+            continue
+        program_qcs[bits_programs.pop()]._append(instruction, qargs, cargs)
+
+    regions = []
+    for program_qc in program_qcs.values():
+        if not program_qc.qubits:
+            continue
+        region = sorted(initial_layout[qubit] for qubit in program_qc.qubits)
+        region_qc = _relabel_on_region(program_qc, region, initial_layout)
+        local_layout = Layout.generate_trivial_layout(*region_qc.qregs)
+        if len(region) == 1:
+            region_map = CouplingMap()
+            region_map.add_physical_qubit(0)
+        else:
+            try:
+                region_map = coupling_map.reduce(region)
+            except CouplingError:
+                return None
+        regions.append((region_qc, region, local_layout, region_map))
+    return regions
+
+
+def _relabel_on_region(program_qc, region, initial_layout):
+    """Program on a register "q" whose i-th qubit is the i-th physical qubit of region.
+    The layout of the pass manager does not depend on the program then."""
+    qreg = QuantumRegister(len(region), "q")
+    qubit_map = {
+        qubit: qreg[region.index(initial_layout[qubit])] for qubit in program_qc.qubits
+    }
+    region_qc = QuantumCircuit(qreg, *program_qc.cregs, name=program_qc.name)
+    for instruction, qargs, cargs in program_qc.data:
+        region_qc._append(instruction, [qubit_map[_q] for _q in qargs], cargs)
+    return region_qc
+
+
+def _transpile_region(job):
+    program_qc, pass_manager_config = job
+    with profile_stage("multi_pass_manager"):
+        return multi_pass_manager(pass_manager_config).run(
+            program_qc, callback=pass_callback()
+        )
@@ -1,2 +1,4 @@
 from .layout import CrosstalkAdaptiveMultiLayout
-from .schedule import MultiALAPSchedule
\ No newline at end of file
+from .routing import AdaptiveStochasticSwap
+from .schedule import MultiALAPSchedule, MultiASAPSchedule
+from .utils import SetTimeBudget
@@ -16,6 +16,9 @@ from qiskit.transpiler.basepasses import AnalysisPass
 from qiskit.transpiler.exceptions import TranspilerError
 from qiskit.providers.models import BackendProperties
 
+# import palloq tools
+from palloq.utils.profiler import profile_stage
+
 
 class BufferedMultiLayout(AnalysisPass):
     def __init__(
@@ -485,7 +488,8 @@ class BufferedMultiLayout(AnalysisPass):
             self._disable_qubits(hwid, n=self.n_hop)
 
         if init_dag:
-            next_dag = self._combine_dag(init_dag, next_dag)
+            with profile_stage("_combine_dag"):
+                next_dag = self._combine_dag(init_dag, next_dag)
 
         """FIXME
         入力量子回路の順番によって、なぜかlayoutにはない量子回路が追加されるバグが生じることがある
@@ -0,0 +1 @@
+from .adaptive_stochastic_swap import AdaptiveStochasticSwap
@@ -0,0 +1,150 @@
+# qiskit version: 0.29.0
+# This code is based on https://qiskit.org/documentation/stubs/qiskit.transpiler.passes.StochasticSwap.html
+
+# import python tools
+import logging
+import time
+from typing import Optional
+
+# import qiskit tools
+from qiskit.transpiler.exceptions import TranspilerError
+from qiskit.transpiler.passes import StochasticSwap
+
+# import palloq tools
+from palloq.transpiler.passes.utils.time_budget import cut_short, remaining_time
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveStochasticSwap(StochasticSwap):
+    """StochasticSwap with adaptive routing effort.
+
+    Routing starts with initial_trials, and the number of trials is multiplied by
+    growth as long as the number of inserted SWAP gates keeps decreasing, up to
+    max_trials. Growing also stops at time_limit and at the deadline set by
+    SetTimeBudget, in which case the routing stage is reported as cut short.
+    The routing with the fewest SWAP gates is kept, and its number of trials is
+    stored in property_set["stochastic_swap_trials"]. The time is also checked
+    before retrying a failed routing. If it runs out before any routing succeeds,
+    the DAG is left unrouted for the fallback router of the budgeted pass manager,
+    or an error is raised without a budget.
+    """
+
+    def __init__(
+        self,
+        coupling_map,
+        initial_trials: int = 4,
+        max_trials: int = 200,
+        growth: int = 2,
+        time_limit: Optional[float] = None,
+        seed=None,
+        fake_run=False,
+    ):
+        """AdaptiveStochasticSwap initializer.
+        Args:
+            coupling_map (CouplingMap): Directed graph representing a coupling map.
+            initial_trials (int): the number of trials of the first routing
+            max_trials (int): the maximum number of trials
+            growth (int): factor to multiply the number of trials by
+            time_limit (float): wall-clock limit of growing the trials in seconds
+            seed (int): seed for random number generator
+            fake_run (bool): if true, it only pretend to do routing
+        """
+        if not 1 <= initial_trials <= max_trials:
+            raise ValueError("initial_trials must be in [1, max_trials]")
+        if growth < 2:
+            raise ValueError("growth must be at least 2")
+        super().__init__(
+            coupling_map, trials=initial_trials, seed=seed, fake_run=fake_run
+        )
+        self.initial_trials = initial_trials
+        self.max_trials = max_trials
+        self.growth = growth
+        self.time_limit = time_limit
+
+    def run(self, dag):
+        """Run the AdaptiveStochasticSwap pass on `dag`.
+
+        Args:
+            dag (DAGCircuit): DAG to map.
+
+        Returns:
+            DAGCircuit: A mapped DAG.
+
+        Raises:
+            TranspilerError: if the dag can not be routed, or if the routing fails
+                even with max_trials or within time_limit
+        """
+        self._check_dag(dag)
+        start_time = time.perf_counter()
+        best_dag = None
+        best_num_swap = None
+        best_final_layout = None
+        best_trials = None
+
+        trials = self.initial_trials
+        while True:
+            self.trials = trials
+            try:
+                new_dag = super().run(dag)
+            except TranspilerError as err:
+                # only the swap mapper may succeed with more trials
+                if not _is_swap_mapper_failure(err) or trials >= self.max_trials:
+                    raise
+                new_dag = None
+
+            if new_dag is not None:
+                num_swap = new_dag.count_ops().get("swap", 0)
+                if best_num_swap is not None and num_swap >= best_num_swap:
+                    # no more improvement
+                    break
+                best_dag = new_dag
+                best_num_swap = num_swap
+                best_final_layout = self.property_set["final_layout"]
+                best_trials = trials
+                if num_swap == 0:
+                    break
+
+            if trials >= self.max_trials:
+                break
+            out_of_time = remaining_time(self.property_set) <= 0 or (
+                self.time_limit is not None
+                and time.perf_counter() - start_time >= self.time_limit
+            )
+            if out_of_time:
+                if best_dag is None:
+                    if self.property_set["cut_short_stages"] is None:
+                        raise TranspilerError(
+                            f"swap mapper failed: out of time after {trials} trials"
+                        )
+                    # leave the routing to the fallback router of the pass manager
+                    cut_short(self.property_set, "routing")
+                    self.trials = self.initial_trials
+                    return dag
+                cut_short(self.property_set, "routing")
+                break
+            trials = min(trials * self.growth, self.max_trials)
+
+        logger.debug(
+            f"AdaptiveStochasticSwap: {best_num_swap} swaps with {best_trials} trials"
+        )
+        self.trials = self.initial_trials
+        if self.fake_run:
+            self.property_set["final_layout"] = best_final_layout
+        self.property_set["stochastic_swap_trials"] = best_trials
+        return best_dag
+
+    def _check_dag(self, dag):
+        """Raise the errors of StochasticSwap that more trials can not resolve"""
+        if len(dag.qregs) != 1 or dag.qregs.get("q", None) is None:
+            raise TranspilerError("StochasticSwap runs on physical circuits only")
+        if len(dag.qubits) > len(self.coupling_map.physical_qubits):
+            raise TranspilerError(
+                "The layout does not match the amount of qubits in the DAG"
+            )
+        if dag.multi_qubit_ops():
+            raise TranspilerError("Layer contains > 2-qubit gates")
+
+
+def _is_swap_mapper_failure(err: TranspilerError) -> bool:
+    return str(err.message).startswith("swap mapper failed")
@@ -1 +1,2 @@
-from .multi_alap import MultiALAPSchedule
\ No newline at end of file
+from .multi_alap import MultiALAPSchedule
+from .multi_asap import MultiASAPSchedule
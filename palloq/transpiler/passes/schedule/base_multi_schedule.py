@@ -0,0 +1,229 @@
+# qiskit version 0.23.1
+# This code is based on https://qiskit.org/documentation/stubs/qiskit.transpiler.passes.ALAPSchedule.html?highlight=alap#qiskit.transpiler.passes.ALAPSchedule
+# Written by Yasuhiro Ohkura
+
+# import python tools
+import abc
+from typing import Dict, List, Tuple
+
+# import numpy
+import numpy as np
+
+# import qiskit tools
+from qiskit.circuit.delay import Delay
+from qiskit.circuit.quantumregister import AncillaRegister
+from qiskit.dagcircuit import DAGCircuit
+from qiskit.transpiler.basepasses import TransformationPass
+
+# import palloq tools
+from palloq.utils.demultiplex import program_of_register
+
+
+class BaseMultiSchedule(TransformationPass):
+    """Base class of the schedulers for composite circuits.
+
+    Start times of all nodes are computed first by ``_start_times`` in a single pass
+    over the nodes, and the scheduled DAG is then built in forward order with
+    apply_operation_back. Durations are looked up once per (gate name, qubits).
+
+    The busy time, idle time and critical path of each qubit and each program are
+    published to property_set["schedule_analytics"] as a dict of
+        "unit": time unit of the values,
+        "duration": total duration of the composite,
+        "critical_path": length of the longest dependency chain of the composite,
+        "qubit_busy_time", "qubit_idle_time", "qubit_critical_path":
+            np.ndarray indexed by the qubits of the DAG,
+        "programs": list of the programs (see program_of_register),
+        "qubit_program": np.ndarray of the index of the program of each qubit (-1 if none),
+        "program_busy_time", "program_idle_time", "program_critical_path":
+            np.ndarray indexed by the programs.
+    The busy and idle time of a program are summed over its qubits. Delays already in
+    the DAG count as idle time. Programs are identified by the registers of the layout
+    in property_set, or of the DAG if it is not laid out.
+    """
+
+    def __init__(self, durations):
+        """Scheduler initializer.
+        Args:
+            durations (InstructionDurations): Durations of instructions to be used in scheduling
+        """
+        super().__init__()
+        self.durations = durations
+
+    def run(self, dag, time_unit=None):  # pylint: disable=arguments-differ
+        """Run the scheduling pass on `dag`.
+        Args:
+            dag (DAGCircuit): DAG to schedule.
+            time_unit (str): Time unit to be used in scheduling: 'dt' or 's'.
+        Returns:
+            DAGCircuit: A scheduled DAG.
+        """
+        if not time_unit:
+            time_unit = self.property_set["time_unit"]
+
+        bit_indices = {bit: index for index, bit in enumerate(dag.qubits)}
+        nodes = list(dag.topological_op_nodes())
+        qargs = [[bit_indices[q] for q in node.qargs] for node in nodes]
+        durations = self._node_durations(nodes, qargs, time_unit)
+
+        # 1. compute the start times
+        start_times, circuit_duration = self._start_times(
+            qargs, durations, len(dag.qubits)
+        )
+
+        self.property_set["schedule_analytics"] = self._analyze(
+            dag, nodes, qargs, durations, circuit_duration, time_unit
+        )
+
+        # 2. build the scheduled DAG in forward order
+        new_dag = DAGCircuit()
+        for qreg in dag.qregs.values():
+            new_dag.add_qreg(qreg)
+        for creg in dag.cregs.values():
+            new_dag.add_creg(creg)
+
+        qubits = new_dag.qubits
+        qubit_time_available = [0] * len(qubits)
+
+        def pad_with_delays(indices, until, unit) -> None:
+            """Pad idle time-slots in ``qubits`` with delays in ``unit`` until ``until``."""
+            for q in indices:
+                if qubit_time_available[q] < until:
+                    idle_duration = until - qubit_time_available[q]
+                    new_dag.apply_operation_back(
+                        Delay(idle_duration, unit), [qubits[q]], []
+                    )
+                    qubit_time_available[q] = until
+
+        for node, indices, start_time, duration in zip(
+            nodes, qargs, start_times, durations
+        ):
+            pad_with_delays(indices, until=start_time, unit=time_unit)
+
+            new_node = new_dag.apply_operation_back(node.op, node.qargs, node.cargs)
+            # set duration for each instruction (tricky but necessary)
+            new_node.op.duration = duration
+            new_node.op.unit = time_unit
+
+            stop_time = start_time + duration
+            # update time table
+            for q in indices:
+                qubit_time_available[q] = stop_time
+
+        pad_with_delays(range(len(qubits)), until=circuit_duration, unit=time_unit)
+
+        new_dag.name = dag.name
+        new_dag.duration = circuit_duration
+        new_dag.unit = time_unit
+        return new_dag
+
+    @abc.abstractmethod
+    def _start_times(
+        self, qargs: List[List[int]], durations: List[float], num_qubits: int
+    ) -> Tuple[List[float], float]:
+        """
+        Compute the start time of each node
+
+        Arguments:
+            qargs: (list) qubit indices of each node in topological order
+            durations: (list) duration of each node
+            num_qubits: (int) the number of qubits of the circuit
+        Returns:
+            start time of each node, and the duration of the circuit
+        """
+        pass
+
+    def _analyze(self, dag, nodes, qargs, durations, circuit_duration, time_unit):
+        """Busy time, idle time and critical path of the qubits and the programs."""
+        num_qubits = len(dag.qubits)
+        qubit_busy_time = np.zeros(num_qubits)
+        qubit_critical_path = np.zeros(num_qubits)
+        for node, indices, duration in zip(nodes, qargs, durations):
+            if not indices or isinstance(node.op, Delay):
+                continue
+            stop_time = max(qubit_critical_path[q] for q in indices) + duration
+            for q in indices:
+                qubit_busy_time[q] += duration
+                qubit_critical_path[q] = stop_time
+        qubit_idle_time = circuit_duration - qubit_busy_time
+
+        programs, qubit_program = self._qubit_programs(dag)
+        assigned = qubit_program >= 0
+        program_critical_path = np.zeros(len(programs))
+        np.maximum.at(
+            program_critical_path,
+            qubit_program[assigned],
+            qubit_critical_path[assigned],
+        )
+        return {
+            "unit": time_unit,
+            "duration": circuit_duration,
+            "critical_path": float(qubit_critical_path.max(initial=0)),
+            "qubit_busy_time": qubit_busy_time,
+            "qubit_idle_time": qubit_idle_time,
+            "qubit_critical_path": qubit_critical_path,
+            "programs": programs,
+            "qubit_program": qubit_program,
+            "program_busy_time": np.bincount(
+                qubit_program[assigned],
+                weights=qubit_busy_time[assigned],
+                minlength=len(programs),
+            ),
+            "program_idle_time": np.bincount(
+                qubit_program[assigned],
+                weights=qubit_idle_time[assigned],
+                minlength=len(programs),
+            ),
+            "program_critical_path": program_critical_path,
+        }
+
+    def _qubit_programs(self, dag):
+        """Programs, and the index of the program of each qubit of the DAG."""
+        layout = self.property_set["layout"]
+        if layout is not None:
+            registers = layout.get_registers()
+            virtual_bits = layout.get_virtual_bits()
+        else:
+            registers = dag.qregs.values()
+            virtual_bits = {bit: index for index, bit in enumerate(dag.qubits)}
+
+        # ancillas allocated by FullAncillaAllocation do not belong to programs
+        registers = [
+            reg
+            for reg in registers
+            if not isinstance(reg, AncillaRegister)
+            and not reg.name.startswith("ancilla")
+        ]
+        programs = sorted(
+            {program_of_register(reg) for reg in registers},
+            key=lambda program: (isinstance(program, str), program),
+        )
+        program_index = {program: i for i, program in enumerate(programs)}
+
+        qubit_program = np.full(len(dag.qubits), -1, dtype=int)
+        for register in registers:
+            index = program_index[program_of_register(register)]
+            for bit in register:
+                qubit = virtual_bits.get(bit)
+                if qubit is not None and qubit < len(qubit_program):
+                    qubit_program[qubit] = index
+        return programs, qubit_program
+
+    def _node_durations(self, nodes, qargs, time_unit):
+        """Durations of the nodes, looked up once per (gate name, qubits)."""
+        cache: Dict[Tuple[str, Tuple[int, ...]], float] = {}
+        durations = [0] * len(nodes)
+        for i, (node, indices) in enumerate(zip(nodes, qargs)):
+            if not indices:
+                continue
+            if isinstance(node.op, Delay):
+                # the duration is a parameter of the delay
+                durations[i] = self.durations.get(node.op, indices, unit=time_unit)
+                continue
+            key = (node.op.name, tuple(indices))
+            duration = cache.get(key)
+            if duration is None:
+                duration = self.durations.get(node.op, indices, unit=time_unit)
+                cache[key] = duration
+            durations[i] = duration
+        return durations
@@ -0,0 +1,28 @@
+# qiskit version 0.23.1
+# This code is based on https://qiskit.org/documentation/stubs/qiskit.transpiler.passes.ASAPSchedule.html#qiskit.transpiler.passes.ASAPSchedule
+
+# import palloq tools
+from palloq.transpiler.passes.schedule.base_multi_schedule import BaseMultiSchedule
+
+
+class MultiASAPSchedule(BaseMultiSchedule):
+    """ASAP Scheduling.
+
+    Start times are computed from the beginning of the circuit over the nodes in
+    topological order.
+    """
+
+    def _start_times(self, qargs, durations, num_qubits):
+        qubit_time_available = [0] * num_qubits
+        start_times = [0] * len(qargs)
+        for i, indices in enumerate(qargs):
+            if not indices:
+                continue
+            start_time = max(qubit_time_available[q] for q in indices)
+            stop_time = start_time + durations[i]
+            start_times[i] = start_time
+            for q in indices:
+                qubit_time_available[q] = stop_time
+
+        circuit_duration = max(qubit_time_available, default=0)
+        return start_times, circuit_duration
@@ -0,0 +1 @@
+from .time_budget import SetTimeBudget
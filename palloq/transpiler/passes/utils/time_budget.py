@@ -0,0 +1,53 @@
+# qiskit version: 0.29.0
+
+# import python tools
+import logging
+import math
+import time
+
+# import qiskit tools
+from qiskit.transpiler.basepasses import AnalysisPass
+
+logger = logging.getLogger(__name__)
+
+
+class SetTimeBudget(AnalysisPass):
+    """Start the wall-clock time budget of a pass manager run.
+
+    The deadline is stored in property_set["time_budget_deadline"], and the stages
+    that budget-aware passes and flow conditions cut short are collected in
+    property_set["cut_short_stages"].
+    """
+
+    def __init__(self, time_budget: float):
+        """SetTimeBudget initializer.
+        Args:
+            time_budget (float): wall-clock budget of the run in seconds
+        """
+        super().__init__()
+        if time_budget <= 0:
+            raise ValueError("time_budget must be positive")
+        self.time_budget = time_budget
+
+    def run(self, dag):
+        self.property_set["time_budget_deadline"] = (
+            time.perf_counter() + self.time_budget
+        )
+        self.property_set["cut_short_stages"] = []
+
+
+def remaining_time(property_set) -> float:
+    """Seconds left until the deadline set by SetTimeBudget (inf if no budget is set)"""
+    deadline = property_set["time_budget_deadline"]
+    if deadline is None:
+        return math.inf
+    return deadline - time.perf_counter()
+
+
+def cut_short(property_set, stage: str):
+    """Record that the stage was cut short to fit the time budget.
+    The list is updated in place, since flow conditions see a read-only property_set."""
+    stages = property_set["cut_short_stages"]
+    if stages is not None and stage not in stages:
+        logger.info(f"{stage} was cut short to fit the time budget")
+        stages.append(stage)
@@ -3,6 +3,10 @@
 # This code is based on https://qiskit.org/documentation/stubs/qiskit.transpiler.preset_passmanagers.level_3_pass_manager.html?highlight=pass_manager#qiskit.transpiler.preset_passmanagers.level_3_pass_manager
 # Written by Yasuhiro Ohkura
 
+import hashlib
+import json
+from collections import OrderedDict
+
 from qiskit.transpiler.passmanager_config import PassManagerConfig
 from qiskit.transpiler.passmanager import PassManager
 
@@ -21,7 +25,6 @@ from qiskit.transpiler.passes import SabreLayout
 from qiskit.transpiler.passes import BarrierBeforeFinalMeasurements
 from qiskit.transpiler.passes import BasicSwap
 from qiskit.transpiler.passes import LookaheadSwap
-from qiskit.transpiler.passes import StochasticSwap
 from qiskit.transpiler.passes import SabreSwap
 from qiskit.transpiler.passes import FullAncillaAllocation
 from qiskit.transpiler.passes import EnlargeWithAncilla
@@ -38,7 +41,7 @@ from qiskit.transpiler.passes import ConsolidateBlocks
 from qiskit.transpiler.passes import UnitarySynthesis
 from qiskit.transpiler.passes import ApplyLayout
 from qiskit.transpiler.passes import CheckCXDirection
-from qiskit.transpiler.passes import TimeUnitAnalysis
+from qiskit.transpiler.passes import TimeUnitConversion
 
 # from qiskit.transpiler.passes import ALAPSchedule
 # from qiskit.transpiler.passes import ASAPSchedule
@@ -46,14 +49,161 @@ from qiskit.transpiler.passes import TimeUnitAnalysis
 from qiskit.transpiler import TranspilerError
 
 from palloq.transpiler.passes import CrosstalkAdaptiveMultiLayout
+from palloq.transpiler.passes import AdaptiveStochasticSwap
 from palloq.transpiler.passes import MultiALAPSchedule
+from palloq.transpiler.passes import MultiASAPSchedule
+from palloq.transpiler.passes import SetTimeBudget
+from palloq.transpiler.passes.utils.time_budget import cut_short, remaining_time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# pass managers built by multi_pass_manager with their SetLayout pass, in least
+# recently used order
+_pass_manager_cache = OrderedDict()
+_PASS_MANAGER_CACHE_SIZE = 32
+
+# hashes of the backend and crosstalk properties in the keys, memoized per object
+_properties_hash_cache = OrderedDict()
+
+# shares of the time budget of the low-latency preset
+_LAYOUT_BUDGET_SHARE = 0.25
+_ROUTING_TRIALS_PER_SECOND = 20
+_OPTIMIZATION_ITERATIONS_PER_SECOND = 10
+
 
 def multi_pass_manager(
-    pass_manager_config: PassManagerConfig, crosstalk_prop=None
+    pass_manager_config: PassManagerConfig,
+    crosstalk_prop=None,
+    use_cache=True,
+    time_budget=None,
+) -> PassManager:
+    """Pass manager for composite circuits
+
+    Pass managers are cached by the fields of pass_manager_config and crosstalk_prop,
+    so that repeated compiles against the same device reuse the pass pipeline together
+    with the precomputation of its passes, e.g. the distance matrix of the coupling map.
+    The initial layout is not a part of the cache key. It is set on the property set
+    of the next runs of the returned pass manager, so the pass manager has to be run
+    before multi_pass_manager is called again with another initial layout.
+
+    Args:
+        pass_manager_config: configuration of the pass manager
+        crosstalk_prop: crosstalk properties for the "xtalk_adaptive" layout method
+        use_cache: if False, a new pass manager is always built
+        time_budget: wall-clock budget of a run in seconds for the low-latency preset.
+                     CSPLayout gets a time limit of a quarter of the budget, the maximum
+                     trials of AdaptiveStochasticSwap and the iterations of the
+                     optimization loop are sized to the budget, and each stage is cut
+                     short or replaced by a cheaper one once the budget runs out. The stages cut short in the
+                     last run are listed in property_set["cut_short_stages"] of the
+                     returned pass manager.
+
+    Returns:
+        PassManager, shared by the calls with the same configuration if use_cache
+    """
+    if not use_cache:
+        return _build_multi_pass_manager(
+            pass_manager_config, crosstalk_prop, time_budget
+        )
+
+    key = _pass_manager_key(pass_manager_config, crosstalk_prop) + (time_budget,)
+    cached = _pass_manager_cache.get(key)
+    if cached is not None:
+        _pass_manager_cache.move_to_end(key)
+        multi_pm, given_layout = cached
+    else:
+        given_layout = SetLayout(None)
+        multi_pm = _build_multi_pass_manager(
+            pass_manager_config, crosstalk_prop, time_budget, given_layout
+        )
+        _pass_manager_cache[key] = (multi_pm, given_layout)
+        if len(_pass_manager_cache) > _PASS_MANAGER_CACHE_SIZE:
+            _pass_manager_cache.popitem(last=False)
+    given_layout.layout = pass_manager_config.initial_layout
+    return multi_pm
+
+
+def clear_pass_manager_cache():
+    """Forget all the pass managers cached by multi_pass_manager"""
+    _pass_manager_cache.clear()
+    _properties_hash_cache.clear()
+
+
+def _pass_manager_key(pass_manager_config: PassManagerConfig, crosstalk_prop) -> tuple:
+    basis_gates = pass_manager_config.basis_gates
+    coupling_map = pass_manager_config.coupling_map
+    initial_layout = pass_manager_config.initial_layout
+    instruction_durations = pass_manager_config.instruction_durations
+    backend_properties = pass_manager_config.backend_properties
+
+    if instruction_durations is not None:
+        durations_key = (
+            tuple(sorted(instruction_durations.duration_by_name.items())),
+            tuple(sorted(instruction_durations.duration_by_name_qubits.items())),
+            instruction_durations.dt,
+        )
+    else:
+        durations_key = None
+    if backend_properties is not None:
+        properties_key = _properties_hash(
+            backend_properties, lambda properties: properties.to_dict()
+        )
+    else:
+        properties_key = None
+    if crosstalk_prop is not None:
+        crosstalk_key = _properties_hash(
+            crosstalk_prop,
+            lambda crosstalk_prop: sorted(
+                (str(edge), sorted((str(e), r) for e, r in xtalk.items()))
+                for edge, xtalk in crosstalk_prop.items()
+            ),
+        )
+    else:
+        crosstalk_key = None
+
+    return (
+        tuple(basis_gates) if basis_gates is not None else None,
+        tuple(sorted(coupling_map.get_edges())) if coupling_map is not None else None,
+        # only whether there is a layout changes the passes
+        bool(initial_layout),
+        pass_manager_config.layout_method,
+        pass_manager_config.routing_method,
+        pass_manager_config.translation_method,
+        pass_manager_config.scheduling_method,
+        durations_key,
+        pass_manager_config.seed_transpiler,
+        properties_key,
+        crosstalk_key,
+    )
+
+
+def _properties_hash(properties, to_json) -> str:
+    """Hash of the properties serialized by to_json, memoized per properties object.
+    The cached objects are kept alive, so that their ids are not reused."""
+    cached = _properties_hash_cache.get(id(properties))
+    if cached is not None:
+        _properties_hash_cache.move_to_end(id(properties))
+        return cached[1]
+
+    properties_hash = _hash_json(to_json(properties))
+    _properties_hash_cache[id(properties)] = (properties, properties_hash)
+    if len(_properties_hash_cache) > _PASS_MANAGER_CACHE_SIZE:
+        _properties_hash_cache.popitem(last=False)
+    return properties_hash
+
+
+def _hash_json(obj) -> str:
+    return hashlib.sha256(
+        json.dumps(obj, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _build_multi_pass_manager(
+    pass_manager_config: PassManagerConfig,
+    crosstalk_prop=None,
+    time_budget=None,
+    given_layout=None,
 ) -> PassManager:
     basis_gates = pass_manager_config.basis_gates
     coupling_map = pass_manager_config.coupling_map
@@ -66,16 +216,42 @@ def multi_pass_manager(
     seed_transpiler = pass_manager_config.seed_transpiler
     backend_properties = pass_manager_config.backend_properties
 
+    if coupling_map is not None:
+        # computed once and kept by the coupling map shared by the cached passes
+        coupling_map.distance_matrix  # pylint: disable=pointless-statement
+
     # 1. Unroll to 1q or 2q gates
     _unroll3q = Unroll3qOrMore()
 
     # 2. Layout on good qubits if calibration info available, otherwise on dense links
-    _given_layout = SetLayout(initial_layout)
+    if given_layout is None:
+        given_layout = SetLayout(initial_layout)
+    _given_layout = given_layout
 
     def _choose_layout_condition(property_set):
         return not property_set["layout"]
 
-    _choose_layout_1 = CSPLayout(coupling_map, call_limit=10000, time_limit=60)
+    def _choose_layout_1_condition(property_set):
+        if not property_set["layout"] and remaining_time(property_set) <= 0:
+            cut_short(property_set, "layout")
+            return False
+        return _choose_layout_condition(property_set)
+
+    def _choose_layout_2_condition(property_set):
+        if property_set["CSPLayout_stop_reason"] in {
+            "call limit reached",
+            "time limit reached",
+        }:
+            cut_short(property_set, "layout")
+        return _choose_layout_condition(property_set)
+
+    if time_budget:
+        csp_time_limit = _LAYOUT_BUDGET_SHARE * time_budget
+    else:
+        csp_time_limit = 60
+    _choose_layout_1 = CSPLayout(
+        coupling_map, call_limit=10000, time_limit=csp_time_limit
+    )
     if layout_method == "trivial":
         _choose_layout_2 = TrivialLayout(coupling_map)
     elif layout_method == "dense":
@@ -104,11 +280,36 @@ def multi_pass_manager(
     def _swap_condition(property_set):
         return not property_set["is_swap_mapped"]
 
+    def _budget_swap_condition(property_set):
+        if _swap_condition(property_set) and remaining_time(property_set) <= 0:
+            # no time for the routing method, fall back to BasicSwap
+            cut_short(property_set, "routing")
+            return False
+        return _swap_condition(property_set)
+
+    def _fallback_swap_condition(property_set):
+        return "routing" in property_set["cut_short_stages"]
+
+    _fallback_swap = [BarrierBeforeFinalMeasurements(), BasicSwap(coupling_map)]
+
+    if time_budget:
+        max_trials = int(_ROUTING_TRIALS_PER_SECOND * time_budget)
+        max_trials = min(200, max(max_trials, 1))
+    else:
+        max_trials = 200
     _swap = [BarrierBeforeFinalMeasurements()]
     if routing_method == "basic":
         _swap += [BasicSwap(coupling_map)]
     elif routing_method == "stochastic":
-        _swap += [StochasticSwap(coupling_map, trials=200, seed=seed_transpiler)]
+        # start with a few trials and grow them while the number of swaps improves
+        _swap += [
+            AdaptiveStochasticSwap(
+                coupling_map,
+                initial_trials=min(4, max_trials),
+                max_trials=max_trials,
+                seed=seed_transpiler,
+            )
+        ]
     elif routing_method == "lookahead":
         _swap += [LookaheadSwap(coupling_map, search_depth=5, search_width=6)]
     elif routing_method == "sabre":
@@ -151,6 +352,28 @@ def multi_pass_manager(
     def _opt_control(property_set):
         return not property_set["depth_fixed_point"]
 
+    if time_budget:
+        max_iterations = int(_OPTIMIZATION_ITERATIONS_PER_SECOND * time_budget)
+        max_iterations = max(max_iterations, 1)
+    # iterations of the optimization loop in the current run
+    opt_iterations = [0]
+
+    def _budget_opt_condition(property_set):
+        opt_iterations[0] = 0
+        if remaining_time(property_set) <= 0:
+            cut_short(property_set, "optimization")
+            return False
+        return True
+
+    def _budget_opt_control(property_set):
+        if not _opt_control(property_set):
+            return False
+        opt_iterations[0] += 1
+        if opt_iterations[0] >= max_iterations or remaining_time(property_set) <= 0:
+            cut_short(property_set, "optimization")
+            return False
+        return True
+
     _reset = [RemoveResetInZeroState()]
 
     _meas = [OptimizeSwapBeforeMeasure(), RemoveDiagonalGatesBeforeMeasure()]
@@ -176,31 +399,44 @@ def multi_pass_manager(
 
     # Schedule the circuit only when scheduling_method is supplied
     if scheduling_method:
-        _scheduling = [TimeUnitAnalysis(instruction_durations)]
+        _scheduling = [TimeUnitConversion(instruction_durations)]
         if scheduling_method in {"alap", "as_late_as_possible"}:
             _scheduling += [MultiALAPSchedule(instruction_durations)]
         elif scheduling_method in {"asap", "as_soon_as_possible"}:
-            # _scheduling += [ASAPSchedule(instruction_durations)]
-            """FIXME"""
-            raise TranspilerError(
-                "Sorry now this method is not available: %s." % scheduling_method
-            )
+            _scheduling += [MultiASAPSchedule(instruction_durations)]
         else:
             raise TranspilerError("Invalid scheduling method %s." % scheduling_method)
 
     # Build pass manager
     multi_pm = PassManager()
+    if time_budget:
+        multi_pm.append(SetTimeBudget(time_budget))
     multi_pm.append(_unroll3q)
     multi_pm.append(_reset + _meas)
     if coupling_map or initial_layout:
         multi_pm.append(_given_layout)
-        multi_pm.append(_choose_layout_1, condition=_choose_layout_condition)
-        multi_pm.append(_choose_layout_2, condition=_choose_layout_condition)
+        if time_budget:
+            multi_pm.append(_choose_layout_1, condition=_choose_layout_1_condition)
+            multi_pm.append(_choose_layout_2, condition=_choose_layout_2_condition)
+        else:
+            multi_pm.append(_choose_layout_1, condition=_choose_layout_condition)
+            multi_pm.append(_choose_layout_2, condition=_choose_layout_condition)
         multi_pm.append(_embed)
         multi_pm.append(_swap_check)
-        multi_pm.append(_swap, condition=_swap_condition)
+        if time_budget:
+            multi_pm.append(_swap, condition=_budget_swap_condition)
+            multi_pm.append(_fallback_swap, condition=_fallback_swap_condition)
+        else:
+            multi_pm.append(_swap, condition=_swap_condition)
     multi_pm.append(_unroll)
-    multi_pm.append(_depth_check + _opt + _unroll, do_while=_opt_control)
+    if time_budget:
+        multi_pm.append(
+            _depth_check + _opt + _unroll,
+            do_while=_budget_opt_control,
+            condition=_budget_opt_condition,
+        )
+    else:
+        multi_pm.append(_depth_check + _opt + _unroll, do_while=_opt_control)
     if coupling_map and not coupling_map.is_symmetric:
         multi_pm.append(_direction_check)
         multi_pm.append(_direction, condition=_direction_condition)
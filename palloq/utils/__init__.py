@@ -1 +1,4 @@
 from .pickle_tools import pickle_dump, pickle_load
+from .translation_cache import TranslationCache
+from .demultiplex import demultiplex_counts, demultiplex_memory
+from .profiler import PipelineProfiler
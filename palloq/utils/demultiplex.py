@@ -0,0 +1,230 @@
+"""
+Demultiplex measurement results of composite circuits into the results of each program
+"""
+import re
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from qiskit.circuit.classicalregister import ClassicalRegister
+from qiskit.circuit.register import Register
+
+# register name given by _alter_reg_names: <name>_<program index>_<register index>
+_REG_NAME = re.compile(r"^(?P<name>.*)_(?P<program>\d+)_(?P<register>\d+)$")
+
+
+def program_of_register(register: Register) -> Union[int, str]:
+    """Program index of a register named by _alter_reg_names, or the register name."""
+    match = _REG_NAME.match(register.name)
+    return int(match.group("program")) if match else register.name
+
+
+def program_clbit_layout(
+    cregs: Sequence[Union[ClassicalRegister, int]]
+) -> Dict[Union[int, str], List[Tuple[int, int]]]:
+    """
+    Locate the clbits of each program in the composite result.
+
+    Arguments:
+        cregs: (list) classical registers of the composite circuit in the circuit order,
+               or just their sizes. Registers named by _alter_reg_names are grouped by
+               program index. Other registers are regarded as a program respectively.
+    Returns:
+        OrderedDict from program to the list of (offset, size) of its registers,
+        where offset is the position of the first bit from the right of the bitstring
+    """
+    layout = OrderedDict()
+    offset = 0
+    for i, creg in enumerate(cregs):
+        if isinstance(creg, ClassicalRegister):
+            size = creg.size
+            program = program_of_register(creg)
+        else:
+            size = int(creg)
+            program = i
+        layout.setdefault(program, []).append((offset, size))
+        offset += size
+    return layout
+
+
+def pack_bitstrings(bitstrings: Sequence[str], num_clbits: int = None) -> np.ndarray:
+    """
+    Convert measured bitstrings to integers
+
+    Arguments:
+        bitstrings: (list) bitstrings like '01 110' or hexadecimal strings like '0x6'
+        num_clbits: (int) the number of clbits, required only for more than 64 clbits
+    Returns:
+        np.ndarray of uint64, or of python int for more than 64 clbits
+    """
+    if len(bitstrings) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    if bitstrings[0].startswith("0x"):
+        dtype = object if num_clbits and num_clbits > 64 else np.uint64
+        return np.array([int(b, 16) for b in bitstrings], dtype=dtype)
+
+    stripped = [b.replace(" ", "") for b in bitstrings]
+    width = len(stripped[0])
+    if width > 64:
+        return np.array([int(b, 2) for b in stripped], dtype=object)
+    if width == 0:
+        return np.zeros(len(stripped), dtype=np.uint64)
+
+    # vectorized conversion of ascii '0'/'1' into integers
+    chars = np.array(stripped, dtype="S%d" % width).view(np.uint8)
+    bits = (chars.reshape(len(stripped), width) - ord("0")).astype(np.uint64)
+    weights = np.left_shift(np.uint64(1), np.arange(width - 1, -1, -1, dtype=np.uint64))
+    return (bits * weights).sum(axis=1, dtype=np.uint64)
+
+
+def extract_bits(values: np.ndarray, registers: List[Tuple[int, int]]) -> np.ndarray:
+    """Gather the bits of registers given as (offset, size) into consecutive integers."""
+    one = values.dtype.type(1) if values.dtype != object else 1
+    result = np.zeros(len(values), dtype=values.dtype)
+    local_offset = 0
+    for offset, size in registers:
+        if values.dtype != object and size >= 64:
+            mask = np.uint64(0xFFFFFFFFFFFFFFFF)
+        else:
+            mask = (one << _as(values, size)) - one
+        part = (values >> _as(values, offset)) & mask
+        result |= part << _as(values, local_offset)
+        local_offset += size
+    return result
+
+
+def _as(values, n):
+    return n if values.dtype == object else np.uint64(n)
+
+
+def format_bits(value: int, registers: List[Tuple[int, int]]) -> str:
+    """Format a program outcome as qiskit does, registers separated by spaces."""
+    parts = []
+    local_offset = 0
+    for _, size in registers:
+        parts.append(format((value >> local_offset) & ((1 << size) - 1), "0%db" % size))
+        local_offset += size
+    return " ".join(reversed(parts))
+
+
+def demultiplex_counts(
+    counts: Union[Dict[str, int], Sequence[str]],
+    cregs: Sequence[Union[ClassicalRegister, int]],
+) -> Dict[Union[int, str], Dict[str, int]]:
+    """
+    Recover the counts of each program from the result of a composite circuit
+
+    Arguments:
+        counts: (dict or list) counts of the composite like {'01 110': 100, ...},
+                or the memory of each shot like ['01 110', '00 111', ...]
+                or np.ndarray of the memory packed into integers
+        cregs: (list) classical registers of the composite circuit (see program_clbit_layout)
+    Returns:
+        dict from program to its sparse counts
+    """
+    layout = program_clbit_layout(cregs)
+    num_clbits = sum(size for registers in layout.values() for _, size in registers)
+
+    if isinstance(counts, dict):
+        keys = list(counts.keys())
+        values = pack_bitstrings(keys, num_clbits)
+        weights = np.fromiter(counts.values(), dtype=np.int64, count=len(keys))
+    elif isinstance(counts, np.ndarray) and counts.dtype.kind in "ui":
+        # memory already packed into integers
+        values = counts.astype(np.uint64)
+        weights = np.ones(len(values), dtype=np.int64)
+    else:
+        values = pack_bitstrings(list(counts), num_clbits)
+        weights = np.ones(len(values), dtype=np.int64)
+
+    result = OrderedDict()
+    for program, registers in layout.items():
+        outcomes = extract_bits(values, registers)
+        result[program] = _histogram(outcomes, weights, registers)
+    return result
+
+
+def _histogram(outcomes, weights, registers) -> Dict[str, int]:
+    uniques, inverse = np.unique(outcomes, return_inverse=True)
+    if weights is None:
+        program_counts = np.bincount(inverse, minlength=len(uniques))
+    else:
+        program_counts = np.bincount(inverse, weights=weights, minlength=len(uniques))
+    return {
+        format_bits(int(value), registers): int(count)
+        for value, count in zip(uniques, program_counts)
+    }
+
+
+def program_outcomes(
+    memory: Union[np.ndarray, Sequence[str]],
+    cregs: Sequence[Union[ClassicalRegister, int]],
+) -> Tuple[List[Union[int, str]], np.ndarray]:
+    """
+    Extract the outcome of each program in each shot
+
+    Arguments:
+        memory: (np.ndarray or list) memory of the composite packed into uint64,
+                or bitstrings of each shot given by Result.get_memory()
+        cregs: (list) classical registers of the composite circuit (see program_clbit_layout)
+    Returns:
+        list of programs, and np.ndarray of uint64 with shape (shots, programs)
+    """
+    layout = program_clbit_layout(cregs)
+    num_clbits = sum(size for registers in layout.values() for _, size in registers)
+    if num_clbits > 64:
+        raise ValueError("Per-shot demultiplexing supports up to 64 clbits")
+
+    if isinstance(memory, np.ndarray) and memory.dtype.kind in "ui":
+        values = memory.astype(np.uint64, copy=False)
+    else:
+        values = pack_bitstrings(list(memory), num_clbits)
+
+    outcomes = np.empty((len(values), len(layout)), dtype=np.uint64)
+    for j, registers in enumerate(layout.values()):
+        outcomes[:, j] = extract_bits(values, registers)
+    return list(layout), outcomes
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Number of ones in each uint64 value"""
+    bits = np.unpackbits(values.astype(np.uint64).view(np.uint8))
+    return bits.reshape(len(values), 64).sum(axis=1)
+
+
+def demultiplex_memory(
+    memory: Union[np.ndarray, Sequence[str]],
+    cregs: Sequence[Union[ClassicalRegister, int]],
+) -> Tuple[Dict[Union[int, str], Dict[str, int]], np.ndarray]:
+    """
+    Marginalize the per-shot memory of a composite circuit into the counts of each
+    program, together with the per-shot correlations between programs.
+
+    The correlation between two programs is the Pearson correlation over shots of the
+    number of ones in their outcomes, which is zero for independent programs and is
+    used to find crosstalk between them.
+
+    Arguments:
+        memory: (np.ndarray or list) memory of the composite packed into uint64,
+                or bitstrings of each shot given by Result.get_memory()
+        cregs: (list) classical registers of the composite circuit (see program_clbit_layout)
+    Returns:
+        dict from program to its sparse counts, and np.ndarray of the correlations
+        with shape (programs, programs) in the order of the dict
+    """
+    programs, outcomes = program_outcomes(memory, cregs)
+    layout = program_clbit_layout(cregs)
+
+    result = OrderedDict()
+    for j, program in enumerate(programs):
+        result[program] = _histogram(outcomes[:, j], None, layout[program])
+
+    weights = np.stack([popcount(outcomes[:, j]) for j in range(len(programs))])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = np.corrcoef(weights.astype(float)).reshape(
+            len(programs), len(programs)
+        )
+    # programs with constant outcomes are uncorrelated to the others
+    correlations = np.nan_to_num(correlations)
+    np.fill_diagonal(correlations, 1.0)
+    return result, correlations
@@ -0,0 +1,207 @@
+"""
+Opt-in profiler of the multi-programming pipeline
+"""
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+# the profiler activated by PipelineProfiler.__enter__
+_active_profiler = None
+
+# tracemalloc.reset_peak is available from python 3.9
+_CAN_RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+class _Record:
+    __slots__ = ("kind", "calls", "wall_time", "peak_memory")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.calls = 0
+        self.wall_time = 0.0
+        self.peak_memory = 0
+
+
+class _Frame:
+    __slots__ = ("path", "start_time", "start_memory", "peak")
+
+    def __init__(self, path, start_time, start_memory):
+        self.path = path
+        self.start_time = start_time
+        self.start_memory = start_memory
+        self.peak = start_memory
+
+
+class PipelineProfiler:
+    """
+    Record wall time, call counts and peak memory of the stages of the pipeline
+    and of each pass run by the pass managers.
+
+    Stages are instrumented by profile_stage, and passes are recorded through the
+    callback of PassManager.run given by pass_callback. Both do nothing unless a
+    profiler is active:
+
+        with PipelineProfiler() as profiler:
+            dynamic_multiqc_compose(queued_qc, backend)
+        profiler.to_json("profile.json")
+
+    Peak memory is the increase of the memory traced by tracemalloc over the stage.
+    Before python 3.9, where the peak can not be reset, the memory at the boundaries
+    of stages and passes is used instead. Work done in other processes is not recorded.
+
+    Arguments:
+        trace_memory: (bool) whether to trace memory with tracemalloc
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.records = OrderedDict()
+        self._stack = []
+        self._last_memory = 0
+        self._started_tracing = False
+        self._previous = None
+
+    def __enter__(self):
+        global _active_profiler
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._previous = _active_profiler
+        _active_profiler = self
+        self._last_memory = self._flush()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active_profiler
+        _active_profiler = self._previous
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    @contextmanager
+    def stage(self, name: str):
+        """Record the block as a stage nested in the current stage"""
+        path = self._path(name)
+        record = self._record(path, "stage")
+        frame = _Frame(path, time.perf_counter(), self._flush())
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            current = self._flush()
+            self._stack.pop()
+            record.calls += 1
+            record.wall_time += time.perf_counter() - frame.start_time
+            record.peak_memory = max(
+                record.peak_memory, frame.peak - frame.start_memory
+            )
+            self._last_memory = current
+
+    def pass_callback(self, pass_, **kwargs):
+        """Callback of PassManager.run recording each pass in the current stage"""
+        start_memory = self._last_memory
+        peak = self._peak()
+        current = self._flush()
+        record = self._record(self._path(type(pass_).__name__), "pass")
+        record.calls += 1
+        record.wall_time += kwargs["time"]
+        record.peak_memory = max(record.peak_memory, peak - start_memory)
+        self._last_memory = current
+
+    def report(self) -> dict:
+        """Structured report of the records in the order they were first seen"""
+        return {
+            "total_time": sum(
+                record.wall_time
+                for path, record in self.records.items()
+                if len(path) == 1
+            ),
+            "records": [
+                {
+                    "path": "/".join(path),
+                    "name": path[-1],
+                    "kind": record.kind,
+                    "calls": record.calls,
+                    "wall_time": record.wall_time,
+                    "peak_memory": record.peak_memory,
+                }
+                for path, record in self.records.items()
+            ],
+        }
+
+    def to_json(self, path: Optional[str] = None, indent: int = 2) -> str:
+        """Report as JSON, also written to path if given"""
+        text = json.dumps(self.report(), indent=indent)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def to_folded(self, path: Optional[str] = None) -> str:
+        """
+        Report in the folded stack format read by flamegraph.pl and speedscope.
+        Each line is a stack and its self time in microseconds, also written to path
+        if given.
+        """
+        self_time = OrderedDict(
+            (stack, record.wall_time) for stack, record in self.records.items()
+        )
+        for stack, record in self.records.items():
+            if len(stack) > 1 and stack[:-1] in self_time:
+                self_time[stack[:-1]] -= record.wall_time
+        text = "".join(
+            "%s %d\n" % (";".join(stack), max(round(seconds * 1e6), 0))
+            for stack, seconds in self_time.items()
+        )
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def _path(self, name):
+        parent = self._stack[-1].path if self._stack else ()
+        return parent + (name,)
+
+    def _record(self, path, kind):
+        record = self.records.get(path)
+        if record is None:
+            record = self.records[path] = _Record(kind)
+        return record
+
+    def _peak(self):
+        if not tracemalloc.is_tracing():
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        return peak if _CAN_RESET_PEAK else current
+
+    def _flush(self):
+        """Update the peak of the open stages, and return the current memory"""
+        if not tracemalloc.is_tracing():
+            return 0
+        peak = self._peak()
+        for frame in self._stack:
+            frame.peak = max(frame.peak, peak)
+        if _CAN_RESET_PEAK:
+            tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+@contextmanager
+def profile_stage(name: str):
+    """Record the block as a stage if a PipelineProfiler is active"""
+    if _active_profiler is None:
+        yield
+    else:
+        with _active_profiler.stage(name):
+            yield
+
+
+def pass_callback():
+    """Callback for PassManager.run if a PipelineProfiler is active, otherwise None"""
+    if _active_profiler is None:
+        return None
+    return _active_profiler.pass_callback
@@ -0,0 +1,227 @@
+# qiskit version: 0.29.0
+
+# import python tools
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+# import qiskit tools
+import qiskit
+from qiskit.circuit import ControlledGate, Gate, Instruction, qpy_serialization
+from qiskit.circuit.quantumcircuit import QuantumCircuit
+from qiskit.compiler import transpile
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".qpy"
+
+# generic classes of the gates built from circuits, e.g. by QuantumCircuit.to_gate,
+# which are told apart only by their definitions
+_CUSTOM_CLASSES = (Gate, ControlledGate, Instruction)
+
+
+class TranslationCache:
+    """Content-addressed on-disk cache of circuits translated to a basis gate set.
+
+    Entries are keyed by a structural hash of the input circuit, the basis gate set
+    and the qiskit version, and are stored in the compact QPY binary format.
+    The name and the calibrations of the input circuit are set on the cached
+    circuit, so that renamed copies of a circuit share an entry.
+    When the total size of the entries exceeds ``max_bytes``, the least recently
+    used entries are evicted.
+
+    Args:
+        cache_dir: directory to store the translated circuits
+        max_bytes: size cap of the cache directory in bytes
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        if not isinstance(max_bytes, int) or max_bytes <= 0:
+            raise ValueError("max_bytes must be positive int")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> file size, ordered from the least recently used entry
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        files = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(_SUFFIX):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, fname))
+            files.append((stat.st_mtime, fname[: -len(_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    @staticmethod
+    def key(circuit: QuantumCircuit, basis_gates: List[str]) -> str:
+        """Structural hash of ``circuit`` translated to ``basis_gates``."""
+        sha = hashlib.sha256()
+        sha.update(repr(qiskit.__version__).encode())
+        sha.update(repr(sorted(basis_gates)).encode())
+        _update_circuit(sha, circuit)
+        return sha.hexdigest()
+
+    def get(self, key: str) -> Optional[QuantumCircuit]:
+        """Return the cached circuit for ``key`` or None on a miss."""
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key), mode="rb") as f:
+                circuit = qpy_serialization.load(f)[0]
+        except (OSError, ValueError, EOFError) as err:
+            logger.warning(f"Broken translation cache entry {key}: {err}")
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        # mark as the most recently used entry
+        self._entries.move_to_end(key)
+        os.utime(self._path(key))
+        self.hits += 1
+        return circuit
+
+    def put(self, key: str, circuit: QuantumCircuit) -> None:
+        """Store ``circuit`` under ``key`` and evict the least recently used entries."""
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, mode="wb") as f:
+                qpy_serialization.dump(circuit, f)
+        except Exception as err:  # pylint: disable=broad-except
+            # circuits which QPY cannot serialize are just not cached
+            logger.debug(f"Skip caching circuit {circuit.name}: {err}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        size = os.path.getsize(path)
+        self._entries[key] = size
+        self._total_bytes += size
+
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._total_bytes -= self._entries.pop(key, 0)
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def translate(
+        self, circuit: QuantumCircuit, basis_gates: List[str]
+    ) -> QuantumCircuit:
+        """Translate ``circuit`` to ``basis_gates``, skipping translation on a cache hit."""
+        key = self.key(circuit, basis_gates)
+        translated = self.get(key)
+        if translated is None:
+            translated = transpile(circuit, basis_gates=basis_gates)
+            self.put(key, translated)
+        else:
+            # neither is a part of the key or of the QPY entry
+            translated.name = circuit.name
+            translated.calibrations = circuit.calibrations
+        return translated
+
+    def clear(self) -> None:
+        """Remove all the entries from the cache directory."""
+        for key in list(self._entries):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        """Cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _is_custom(instruction: Instruction) -> bool:
+    """Whether the instruction is not a gate of qiskit identified by its name"""
+    cls = type(instruction)
+    return cls in _CUSTOM_CLASSES or not cls.__module__.startswith("qiskit.")
+
+
+def _param_key(param) -> str:
+    """Parameter in the key. Arrays, e.g. of UnitaryGate, are hashed by their bytes
+    since str truncates large arrays"""
+    if isinstance(param, np.ndarray):
+        data = np.ascontiguousarray(param)
+        return repr(
+            (data.dtype.str, data.shape, hashlib.sha256(data.tobytes()).hexdigest())
+        )
+    return str(param)
+
+
+def _update_circuit(sha, circuit: QuantumCircuit) -> None:
+    """Hash the structure of the circuit and the definitions of its custom gates"""
+    bit_index = {bit: i for i, bit in enumerate(circuit.qubits)}
+    bit_index.update({bit: i for i, bit in enumerate(circuit.clbits)})
+
+    sha.update(repr(str(circuit.global_phase)).encode())
+    sha.update(repr([(reg.name, reg.size) for reg in circuit.qregs]).encode())
+    sha.update(repr([(reg.name, reg.size) for reg in circuit.cregs]).encode())
+    # calibrated gates are not translated
+    for gate, schedules in sorted(circuit.calibrations.items()):
+        for (qubits, params), schedule in sorted(
+            schedules.items(), key=lambda item: repr(item[0])
+        ):
+            sha.update(
+                repr(
+                    (gate, qubits, [str(p) for p in params], schedule.instructions)
+                ).encode()
+            )
+    for instruction, qargs, cargs in circuit.data:
+        condition = instruction.condition
+        if condition is not None:
+            cond_bit = condition[0]
+            condition = (
+                bit_index[cond_bit] if cond_bit in bit_index else cond_bit.name,
+                condition[1],
+            )
+        sha.update(
+            repr(
+                (
+                    instruction.name,
+                    [_param_key(param) for param in instruction.params],
+                    [bit_index[_q] for _q in qargs],
+                    [bit_index[_c] for _c in cargs],
+                    condition,
+                )
+            ).encode()
+        )
+        if _is_custom(instruction):
+            # gates of the same name may have different definitions
+            definition = instruction.definition
+            sha.update(repr(definition is None).encode())
+            if definition is not None:
+                _update_circuit(sha, definition)
@@ -0,0 +1,86 @@
+import pytest
+from qiskit import QuantumCircuit
+from qiskit.converters import circuit_to_dag
+from qiskit.test.mock import FakeParis
+from qiskit.transpiler import CouplingMap
+from qiskit.transpiler.passes import CheckMap
+
+from palloq.compiler import multi_transpile
+from palloq.compiler.multi_transpile import _compose_multicircuits
+from palloq.utils.demultiplex import program_of_register
+
+
+def _bell(name):
+    qc = QuantumCircuit(2, 2, name=name)
+    qc.h(0)
+    qc.cx(0, 1)
+    qc.measure([0, 1], [0, 1])
+    return qc
+
+
+def _ghz(name):
+    qc = QuantumCircuit(3, 3, name=name)
+    qc.h(0)
+    qc.cx(0, 1)
+    qc.cx(1, 2)
+    qc.measure(range(3), range(3))
+    return qc
+
+
+def _is_mapped(qc, coupling_map):
+    check_map = CheckMap(coupling_map)
+    check_map.run(circuit_to_dag(qc))
+    return check_map.property_set["is_swap_mapped"]
+
+
+def test_multi_transpile_single_group():
+    multi_circuit = multi_transpile(
+        [_bell("bell"), _ghz("ghz")],
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        output_name="multi",
+    )
+
+    assert isinstance(multi_circuit, QuantumCircuit)
+    assert multi_circuit.name == "multi"
+    assert multi_circuit.num_qubits == 5
+    assert [program_of_register(creg) for creg in multi_circuit.cregs] == [0, 1]
+    assert multi_circuit.count_ops()["measure"] == 5
+
+
+def test_multi_transpile_global_phase():
+    bell, ghz = _bell("bell"), _ghz("ghz")
+    bell.global_phase = 0.8
+    ghz.global_phase = 0.3
+    multi_circuit = _compose_multicircuits([bell, ghz], None)
+
+    baseline = QuantumCircuit(5, 5)
+    baseline.compose(bell, qubits=[0, 1], clbits=[0, 1], inplace=True)
+    baseline.compose(ghz, qubits=[2, 3, 4], clbits=[2, 3, 4], inplace=True)
+    assert float(multi_circuit.global_phase) == pytest.approx(
+        float(baseline.global_phase)
+    )
+    assert float(multi_circuit.global_phase) == pytest.approx(1.1)
+
+
+def test_multi_transpile_groups():
+    backend = FakeParis()
+    groups = [[_bell("bell"), _ghz("ghz")], [_ghz("ghz"), _ghz("ghz")], [_bell("bell")]]
+    multi_circuits = multi_transpile(
+        groups, backend=backend, seed_transpiler=1, max_workers=2
+    )
+
+    assert len(multi_circuits) == len(groups)
+    coupling_map = CouplingMap(backend.configuration().coupling_map)
+    for multi_circuit, group in zip(multi_circuits, groups):
+        assert multi_circuit.num_qubits == backend.configuration().n_qubits
+        assert len(multi_circuit.cregs) == len(group)
+        assert multi_circuit.count_ops()["measure"] == sum(
+            qc.num_clbits for qc in group
+        )
+        assert _is_mapped(multi_circuit, coupling_map)
+
+    # the same as transpiling in this process
+    inline = multi_transpile(groups, backend=backend, seed_transpiler=1, max_workers=1)
+    assert [qc.count_ops() for qc in inline] == [
+        qc.count_ops() for qc in multi_circuits
+    ]
@@ -1,10 +1,31 @@
 # test for dynamic_multiqc_compose()
 
+import importlib
+
 from qiskit.circuit.quantumcircuit import QuantumCircuit
 from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
 from qiskit.test.mock import FakeMelbourne, FakeParis
+import pytest
+
+from palloq.compiler.packing import (
+    CxDifferencePacking,
+    FirstFitDecreasingPacking,
+    BestFitPacking,
+    CxDensityClusterPacking,
+)
+from palloq.compiler.dynamic_multiqc_compose import (
+    dynamic_multiqc_compose,
+    iter_dynamic_multiqc_compose,
+    _alter_reg_names,
+    _backend_topology_cache,
+    _coupling_map,
+    _create_faulty_qubits_map,
+)
 
-from palloq.compiler.dynamic_multiqc_compose import dynamic_multiqc_compose
+# the module is shadowed by the function of the same name in palloq.compiler
+dynamic_multiqc_compose_module = importlib.import_module(
+    "palloq.compiler.dynamic_multiqc_compose"
+)
 
 """This test is written as pytest style"""
 
@@ -123,3 +144,191 @@ def test_qasmbench_s_falconr4(small_circuits):
     for _qc in transpiled_qcs:
         print()
         print(_qc)
+
+
+def test_alter_reg_names():
+    # prepare qcs
+    qr = QuantumRegister(3, "q1")
+    cr = ClassicalRegister(3, "c")
+    qc1 = QuantumCircuit(qr, cr, name="qc1")
+    qc1.h(qr[0])
+    qc1.cx(qr[0], qr[1])
+    qc1.measure(qr, cr)
+    qc1.x(qr[2]).c_if(cr, 3)
+
+    qc2 = QuantumCircuit(2, 2, name="qc2")
+    qc2.h(0)
+    qc2.measure([0, 1], [0, 1])
+
+    renamed_qcs = _alter_reg_names([qc1, qc2])
+
+    assert [qreg.name for qreg in renamed_qcs[0].qregs] == ["qc1_0_0"]
+    assert [creg.name for creg in renamed_qcs[0].cregs] == ["c_0_0"]
+    assert [qreg.name for qreg in renamed_qcs[1].qregs] == ["qc2_1_0"]
+    assert renamed_qcs[0].count_ops() == qc1.count_ops()
+    assert renamed_qcs[1].count_ops() == qc2.count_ops()
+
+    # the condition must refer to the renamed classical register
+    conditioned = [inst for inst, _, _ in renamed_qcs[0].data if inst.condition]
+    assert conditioned[0].condition == (renamed_qcs[0].cregs[0], 3)
+
+
+def test_backend_topology_cache():
+    # prepare mock backend with faulty qubit 0
+    backend = FakeParis()
+    bprop = backend.properties()
+    bprop._qubits[0]["operational"] = (0, bprop.last_update_date)
+    _backend_topology_cache.clear()
+
+    faulty_qubits_map = _create_faulty_qubits_map(backend)
+    assert faulty_qubits_map[0] is None
+    assert faulty_qubits_map[1] == 0
+
+    coupling_map = _coupling_map(coupling_map=None, backend=backend)
+    assert len(coupling_map.physical_qubits) == 26
+    # the topology is derived only once for the calibration
+    cached_coupling_map = _coupling_map(coupling_map=None, backend=backend)
+    assert cached_coupling_map.get_edges() == coupling_map.get_edges()
+    assert len(_backend_topology_cache) == 1
+
+    # callers get their own copy of the cached coupling map
+    assert cached_coupling_map is not coupling_map
+    coupling_map.add_physical_qubit(26)
+    cached_coupling_map = _coupling_map(coupling_map=None, backend=backend)
+    assert len(cached_coupling_map.physical_qubits) == 26
+
+    # the same calibration without faulty qubits has its own topology
+    coupling_map = _coupling_map(coupling_map=None, backend=FakeParis())
+    assert len(coupling_map.physical_qubits) == 27
+    _backend_topology_cache.clear()
+
+
+def test_backend_topology_reuses_properties(monkeypatch):
+    backend = FakeParis()
+    properties = backend.properties()
+    _backend_topology_cache.clear()
+
+    def properties_fetched_again():
+        raise AssertionError("the properties are fetched again")
+
+    monkeypatch.setattr(backend, "properties", properties_fetched_again)
+    coupling_map = _coupling_map(None, backend, properties)
+    assert len(coupling_map.physical_qubits) == 27
+    # the cached topology is looked up by the same properties
+    cached_coupling_map = _coupling_map(None, backend, properties)
+    assert cached_coupling_map.get_edges() == coupling_map.get_edges()
+    assert len(_backend_topology_cache) == 1
+    _backend_topology_cache.clear()
+
+
+def test_backend_topology_cache_size(monkeypatch):
+    backend = FakeParis()
+    properties = backend.properties()
+    _backend_topology_cache.clear()
+    monkeypatch.setattr(
+        dynamic_multiqc_compose_module, "_BACKEND_TOPOLOGY_CACHE_SIZE", 2
+    )
+
+    for hour in range(3):
+        properties.last_update_date = properties.last_update_date.replace(hour=hour)
+        _coupling_map(None, backend, properties)
+    # the least recently used calibration is evicted
+    assert len(_backend_topology_cache) == 2
+    assert [key[1].hour for key in _backend_topology_cache] == [1, 2]
+    _backend_topology_cache.clear()
+
+
+@pytest.mark.parametrize(
+    "packing_strategy",
+    [
+        CxDifferencePacking(),
+        FirstFitDecreasingPacking(),
+        BestFitPacking(),
+        CxDensityClusterPacking(),
+    ],
+)
+def test_packing_strategies(packing_strategy, make_cx_ring_qc):
+    # prepare qcs with various size and number of cx
+    qcs = [make_cx_ring_qc(2 + i % 4, 3 * i, "qc" + str(i)) for i in range(8)]
+    total_qubits = sum(qc.num_qubits for qc in qcs)
+
+    transpiled_qcs, num_usage = dynamic_multiqc_compose(
+        queued_qc=qcs,
+        backend=FakeParis(),
+        packing_strategy=packing_strategy,
+        return_num_usage=True,
+    )
+
+    # every queued qc must be allocated to one of composites
+    if isinstance(num_usage, list):
+        assert sum(num_usage) == total_qubits
+    else:
+        assert num_usage == total_qubits
+
+
+def test_duration_balanced_packing(make_cx_ring_qc):
+    # prepare short and long qcs
+    qcs = [make_cx_ring_qc(3, 1 if i % 2 else 60, "qc" + str(i)) for i in range(6)]
+
+    transpiled_qcs, num_usage = dynamic_multiqc_compose(
+        queued_qc=qcs,
+        backend=FakeParis(),
+        duration_imbalance=0.5,
+        return_num_usage=True,
+    )
+
+    # short and long qcs are not mixed
+    assert num_usage == [9, 9]
+
+    # duration_imbalance is not silently ignored
+    with pytest.raises(ValueError):
+        dynamic_multiqc_compose(
+            queued_qc=qcs,
+            backend=FakeParis(),
+            packing_strategy=CxDifferencePacking(),
+            duration_imbalance=0.5,
+        )
+
+
+def test_iter_dynamic_multiqc_compose(make_cx_ring_qc):
+    def queued_qcs():
+        for i in range(10):
+            yield make_cx_ring_qc(2 + i % 3, i, "qc" + str(i))
+
+    transpiled_qcs = iter_dynamic_multiqc_compose(
+        queued_qc=queued_qcs(),
+        backend=FakeParis(),
+        working_set_size=3,
+    )
+
+    creg_names = []
+    for _qc in transpiled_qcs:
+        creg_names += [creg.name for creg in _qc.cregs]
+
+    # every queued qc is composed exactly once
+    assert sorted(creg_names) == sorted("c_" + str(i) + "_0" for i in range(10))
+
+
+def test_schedule_analytics(make_cx_ring_qc):
+    qcs = [make_cx_ring_qc(2, i * 5, "qc" + str(i)) for i in range(3)]
+
+    transpiled_qc, analytics = dynamic_multiqc_compose(
+        queued_qc=qcs,
+        backend=FakeParis(),
+        return_schedule_analytics=True,
+    )
+
+    assert analytics["unit"] == "s"
+    assert analytics["programs"] == [0, 1, 2]
+    assert len(analytics["qubit_busy_time"]) == transpiled_qc.num_qubits
+    # up to the rounding of the durations in seconds
+    assert analytics["critical_path"] <= analytics["duration"] * (1 + 1e-12)
+    # a program with more cx is busier
+    busy = analytics["program_busy_time"]
+    assert busy[0] < busy[1] < busy[2]
+    for program in range(3):
+        num_qubits = (analytics["qubit_program"] == program).sum()
+        assert num_qubits == 2
+        assert busy[program] + analytics["program_idle_time"][program] == pytest.approx(
+            num_qubits * analytics["duration"]
+        )
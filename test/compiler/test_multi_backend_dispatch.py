@@ -0,0 +1,93 @@
+# test for multi_backend_dispatch()
+
+import importlib
+
+from qiskit import QuantumCircuit
+from qiskit.test.mock import FakeMelbourne, FakeParis
+
+from palloq.compiler.multi_backend_dispatch import multi_backend_dispatch
+from palloq.utils.translation_cache import TranslationCache
+
+# the module, which is shadowed by the function in palloq.compiler
+multi_backend_dispatch_module = importlib.import_module(
+    "palloq.compiler.multi_backend_dispatch"
+)
+
+"""This test is written as pytest style"""
+
+
+def _queued_qcs(make_cx_ring_qc):
+    return [make_cx_ring_qc(2 + i % 4, 3 * i, "qc" + str(i)) for i in range(8)]
+
+
+def test_multi_backend_dispatch(make_cx_ring_qc):
+    qcs = _queued_qcs(make_cx_ring_qc)
+    plans = multi_backend_dispatch(qcs, [FakeParis(), FakeMelbourne()], max_workers=2)
+
+    assert set(plans) == {"fake_paris", "fake_melbourne"}
+    # every queued qc is assigned to exactly one backend
+    assigned = [qc.name for plan in plans.values() for qc in plan["circuits"]]
+    assert sorted(assigned) == sorted(qc.name for qc in qcs)
+
+    for plan in plans.values():
+        if plan["circuits"]:
+            assert plan["composites"]
+            assert plan["makespan"] > 0
+            assert 0 < plan["fidelity"] <= 1
+
+
+def test_large_qc_dispatch():
+    # 20 qubits qc only fits in fake_paris
+    qc = QuantumCircuit(20, name="large")
+    qc.h(0)
+    for i in range(19):
+        qc.cx(i, i + 1)
+    qc.measure_all()
+
+    plans = multi_backend_dispatch([qc], [FakeMelbourne(), FakeParis()], max_workers=1)
+
+    assert [qc.name for qc in plans["fake_paris"]["circuits"]] == ["large"]
+    assert plans["fake_melbourne"]["circuits"] == []
+
+
+def test_dispatch_reuses_translations(tmp_path, make_cx_ring_qc):
+    qcs = _queued_qcs(make_cx_ring_qc)
+    translation_cache = TranslationCache(str(tmp_path))
+    plans = multi_backend_dispatch(
+        qcs,
+        [FakeParis(), FakeMelbourne()],
+        max_workers=1,
+        translation_cache=translation_cache,
+    )
+
+    # each circuit is translated once per basis for the partition and its backend
+    # composes it from the cache
+    basis = {
+        tuple(sorted(b.configuration().basis_gates))
+        for b in [FakeParis(), FakeMelbourne()]
+    }
+    assert translation_cache.misses == len(qcs) * len(basis)
+    assert translation_cache.hits == sum(
+        len(plan["circuits"]) for plan in plans.values()
+    )
+
+
+def test_dispatch_refine_rounds(monkeypatch, make_cx_ring_qc):
+    # fake_paris turns out to be 10 times slower than estimated
+    def compose_plan(job):
+        backend, circuits, _ = job
+        per_circuit = 10.0 if backend.name() == "fake_paris" else 1.0
+        return list(circuits), per_circuit * len(circuits), 1.0
+
+    monkeypatch.setattr(multi_backend_dispatch_module, "_compose_plan", compose_plan)
+    qcs = _queued_qcs(make_cx_ring_qc)
+    backends = [FakeParis(), FakeMelbourne()]
+    plans = multi_backend_dispatch(qcs, backends, max_workers=1)
+    refined = multi_backend_dispatch(qcs, backends, max_workers=1, refine_rounds=2)
+
+    assigned = [qc.name for plan in refined.values() for qc in plan["circuits"]]
+    assert sorted(assigned) == sorted(qc.name for qc in qcs)
+    assert len(refined["fake_paris"]["circuits"]) < len(plans["fake_paris"]["circuits"])
+    assert max(plan["makespan"] for plan in refined.values()) < max(
+        plan["makespan"] for plan in plans.values()
+    )
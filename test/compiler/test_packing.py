@@ -0,0 +1,180 @@
+# test for packing strategies
+
+from types import SimpleNamespace
+
+import networkx as nx
+import pytest
+from qiskit import QuantumCircuit
+from qiskit.test.mock import FakeParis
+from qiskit.transpiler import InstructionDurations
+
+from palloq.compiler.dynamic_multiqc_compose import (
+    _alter_reg_names,
+    _sequential_layout,
+)
+from palloq.compiler.packing import (
+    cx_density,
+    estimate_duration,
+    free_regions,
+    mean_durations,
+    num_cx,
+    BestFitPacking,
+    CxDensityClusterPacking,
+    CxDifferencePacking,
+    DurationBalancedPacking,
+    FirstFitDecreasingPacking,
+)
+
+"""This test is written as pytest style"""
+
+
+def test_mean_durations():
+    durations = InstructionDurations(
+        [("cx", [0, 1], 300), ("cx", [1, 2], 500), ("x", None, 50)], dt=1e-9
+    )
+    gate_durations = mean_durations(durations)
+
+    assert gate_durations["cx"] == pytest.approx(400e-9)
+    assert gate_durations["x"] == pytest.approx(50e-9)
+
+
+def test_mean_durations_units():
+    durations = InstructionDurations(
+        [("cx", [0, 1], 300), ("cx", [1, 2], 0.5, "us"), ("x", None, 50e-9, "s")],
+        dt=1e-9,
+    )
+    assert mean_durations(durations)["cx"] == pytest.approx(400e-9)
+
+    # durations in dt are kept if dt is unknown
+    assert mean_durations(InstructionDurations([("cx", None, 300)])) == {"cx": 300}
+
+    # but cannot be averaged with durations in seconds
+    durations = InstructionDurations([("cx", [0, 1], 300), ("cx", [1, 2], 500e-9, "s")])
+    with pytest.raises(ValueError):
+        mean_durations(durations)
+
+
+def test_estimate_duration():
+    gate_durations = {"cx": 10.0, "x": 1.0}
+    qc = QuantumCircuit(3)
+    qc.x(0)
+    qc.cx(0, 1)
+    qc.x(2)
+    qc.cx(1, 2)
+    qc.barrier()
+
+    # x(0) -> cx(0, 1) -> cx(1, 2)
+    assert estimate_duration(qc, gate_durations) == 21.0
+    assert estimate_duration(QuantumCircuit(2), gate_durations) == 0.0
+
+
+def test_duration_balanced_packing_order():
+    durations = InstructionDurations([("cx", None, 10)])
+    packing = DurationBalancedPacking(durations, imbalance_tolerance=0.5)
+    qcs = []
+    for cx_count in [1, 8, 10, 4]:
+        qc = QuantumCircuit(2)
+        for _ in range(cx_count):
+            qc.cx(0, 1)
+        qcs.append(qc)
+
+    # the composite is opened with the longest qc
+    assert packing.select(qcs, [], None) == 0
+    assert packing.duration(qcs[0]) == 100
+    assert [packing.duration(qc) for qc in qcs] == [100, 80, 40, 10]
+
+
+def test_best_fit_packing_regions():
+    # free regions of 3 and 10 connected hardware qubits
+    swap_graph = nx.union(nx.path_graph(3), nx.path_graph(range(4, 14)))
+    bm_layout = SimpleNamespace(
+        swap_graph=swap_graph,
+        available_hw_qubits=list(swap_graph.nodes),
+        largest_hw_qubits=10,
+    )
+    assert free_regions(bm_layout) == [3, 10]
+    large, small = QuantumCircuit(5, name="large"), QuantumCircuit(3, name="small")
+    composite = [QuantumCircuit(2)]
+
+    # first fit takes the largest program that fits, best fit fills the small region
+    queue = [small, large]
+    assert (
+        queue[FirstFitDecreasingPacking().select(queue, composite, bm_layout)] is large
+    )
+    queue = [large, small]
+    assert queue[BestFitPacking().select(queue, composite, bm_layout)] is small
+
+    # the region of qubits taken by the buffer does not hold the program
+    bm_layout.available_hw_qubits.remove(1)
+    assert free_regions(bm_layout) == [1, 1, 10]
+    assert queue[BestFitPacking().select(queue, composite, bm_layout)] is large
+
+
+def _skewed_queue(make_cx_ring_qc):
+    """Programs of 2 to 5 qubits, every third of them has 40 cx and the rest 1 or 2."""
+    return [
+        make_cx_ring_qc(2 + i % 4, 40 if i % 3 == 0 else i % 3, "qc" + str(i))
+        for i in range(12)
+    ]
+
+
+def _composites(qcs, packing_strategy):
+    """Programs of each composite in the packed order"""
+    by_name = {qc.name: qc for qc in qcs}
+    properties = FakeParis().properties()
+    working_set = _alter_reg_names(qcs)
+    composites = []
+    while working_set:
+        _, _, names, working_set = _sequential_layout(
+            working_set, len(properties.qubits), properties, 0, packing_strategy
+        )
+        composites.append([by_name[name] for name in names])
+    return composites
+
+
+def _max_spread(composites, key):
+    return max(max(map(key, qcs)) - min(map(key, qcs)) for qcs in composites)
+
+
+def _max_imbalance(composites, duration):
+    return max(
+        1 - min(map(duration, qcs)) / max(map(duration, qcs)) for qcs in composites
+    )
+
+
+def test_packing_strategy_properties(make_cx_ring_qc):
+    qcs = _skewed_queue(make_cx_ring_qc)
+    durations = InstructionDurations.from_backend(FakeParis())
+    duration = DurationBalancedPacking(durations).duration
+
+    default = _composites(qcs, CxDifferencePacking())
+    first_fit = _composites(qcs, FirstFitDecreasingPacking())
+    best_fit = _composites(qcs, BestFitPacking())
+    density = _composites(qcs, CxDensityClusterPacking())
+    balanced = _composites(qcs, DurationBalancedPacking(durations))
+
+    for composites in [default, first_fit, best_fit, density, balanced]:
+        assert sorted(qc.name for c in composites for qc in c) == sorted(
+            qc.name for qc in qcs
+        )
+
+    # ascending number of cx gates without a gap over max_cx_gap in a composite
+    for composite in default:
+        cx_counts = [num_cx(qc) for qc in composite]
+        assert cx_counts == sorted(cx_counts)
+        assert all(b - a <= 10 for a, b in zip(cx_counts, cx_counts[1:]))
+
+    # fitting by size fills the device with fewer composites
+    for composites in [first_fit, best_fit]:
+        assert len(composites) < len(default)
+        # each composite is opened with the largest remaining program
+        for i, composite in enumerate(composites):
+            remaining = [qc for c in composites[i:] for qc in c]
+            assert composite[0].num_qubits == max(qc.num_qubits for qc in remaining)
+
+    # similar cx densities are clustered
+    assert _max_spread(density, cx_density) < _max_spread(first_fit, cx_density)
+
+    # similar durations are balanced within the tolerance, unlike packing by size
+    assert _max_imbalance(balanced, duration) <= 0.5
+    assert _max_imbalance(balanced, duration) < _max_imbalance(first_fit, duration)
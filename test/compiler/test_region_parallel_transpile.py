@@ -0,0 +1,151 @@
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
+from qiskit.converters import circuit_to_dag
+from qiskit.test.mock import FakeParis
+from qiskit.transpiler import CouplingMap, InstructionDurations, Layout
+from qiskit.transpiler.passes import CheckMap
+
+from palloq.compiler import dynamic_multiqc_compose, region_parallel_transpile
+from palloq.transpiler.preset_passmanagers.multi_pm import _pass_manager_cache
+
+# the modules, which are shadowed by the functions in palloq.compiler
+dynamic_multiqc_compose_module = importlib.import_module(
+    "palloq.compiler.dynamic_multiqc_compose"
+)
+region_parallel_module = importlib.import_module(
+    "palloq.compiler.region_parallel_transpile"
+)
+
+
+def _triangle(name):
+    """A program that needs swaps on a line of three qubits."""
+    qc = QuantumCircuit(3, 3, name=name)
+    qc.h(0)
+    qc.cx(0, 1)
+    qc.cx(1, 2)
+    qc.cx(0, 2)
+    qc.measure(range(3), range(3))
+    return qc
+
+
+def _composite():
+    """Two triangles on the lines 0-1-2 and 4-5-6."""
+    qr_0, qr_1 = QuantumRegister(3, "p_0_0"), QuantumRegister(3, "p_1_0")
+    cr_0, cr_1 = ClassicalRegister(3, "c_0_0"), ClassicalRegister(3, "c_1_0")
+    composite = QuantumCircuit(qr_0, qr_1, cr_0, cr_1)
+    composite.compose(_triangle("p"), qr_0, cr_0, inplace=True)
+    composite.compose(_triangle("p"), qr_1, cr_1, inplace=True)
+    layout = Layout({qr_0[i]: i for i in range(3)})
+    for i in range(3):
+        layout[qr_1[i]] = 4 + i
+    return composite, layout
+
+
+def _is_mapped(qc, coupling_map):
+    check_map = CheckMap(coupling_map)
+    check_map.run(circuit_to_dag(qc))
+    return check_map.property_set["is_swap_mapped"]
+
+
+def test_region_parallel_transpile():
+    coupling_map = CouplingMap.from_line(7)
+    composite, layout = _composite()
+    durations = InstructionDurations(
+        [("rz", None, 0), ("sx", None, 100), ("x", None, 100)]
+        + [("cx", None, 300), ("measure", None, 1000)]
+    )
+
+    for max_workers in [1, 2]:
+        transpiled = region_parallel_transpile(
+            composite,
+            layout,
+            coupling_map,
+            basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+            scheduling_method="alap",
+            instruction_durations=durations,
+            seed_transpiler=1,
+            max_workers=max_workers,
+        )
+
+        assert transpiled.num_qubits == 7
+        assert transpiled.count_ops()["measure"] == 6
+        assert _is_mapped(transpiled, coupling_map)
+        # each program stays on its region
+        used = {
+            transpiled.qubits.index(q)
+            for inst, qargs, _ in transpiled.data
+            if inst.name != "delay"
+            for q in qargs
+        }
+        assert used <= {0, 1, 2, 4, 5, 6}
+        assert transpiled.duration is not None
+
+
+def test_region_parallel_transpile_interacting_programs():
+    coupling_map = CouplingMap.from_line(7)
+    composite, layout = _composite()
+    composite.cx(2, 3)
+
+    # programs are transpiled as a whole
+    transpiled = region_parallel_transpile(
+        composite,
+        layout,
+        coupling_map,
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        seed_transpiler=1,
+    )
+    assert _is_mapped(transpiled, coupling_map)
+    assert transpiled.count_ops()["measure"] == 6
+
+
+def test_dynamic_multiqc_compose_region_parallel():
+    backend = FakeParis()
+    transpiled = dynamic_multiqc_compose(
+        queued_qc=[_triangle("qc" + str(i)) for i in range(3)],
+        backend=backend,
+        region_parallel=True,
+    )
+
+    assert transpiled.count_ops()["measure"] == 9
+    assert _is_mapped(transpiled, CouplingMap(backend.configuration().coupling_map))
+
+
+def test_region_parallel_transpile_shares_pass_manager(empty_pass_manager_cache):
+    composite, layout = _composite()
+
+    # the two line regions build one pass manager
+    region_parallel_transpile(
+        composite,
+        layout,
+        CouplingMap.from_line(7),
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        seed_transpiler=1,
+        max_workers=1,
+    )
+    assert len(_pass_manager_cache) == 1
+
+
+def test_dynamic_multiqc_compose_region_parallel_shares_pool(monkeypatch):
+    pools = []
+
+    class _CountedPool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(
+        dynamic_multiqc_compose_module, "ProcessPoolExecutor", _CountedPool
+    )
+    monkeypatch.setattr(region_parallel_module, "ProcessPoolExecutor", _CountedPool)
+
+    transpiled = dynamic_multiqc_compose(
+        queued_qc=[_triangle("qc" + str(i)) for i in range(12)],
+        backend=FakeParis(),
+        region_parallel=True,
+        max_workers=2,
+    )
+
+    assert len(transpiled) > 1
+    assert len(pools) == 1
@@ -13,6 +13,8 @@ from datetime import datetime
 from qiskit import QuantumCircuit
 from qiskit.providers.models.backendproperties import BackendProperties, Nduv, Gate
 
+from palloq.transpiler.preset_passmanagers.multi_pm import clear_pass_manager_cache
+
 _log = logging.getLogger(__name__)
 
 
@@ -155,3 +157,24 @@ def make_qubit_with_error():
         ]
 
     return qubit
+
+
+@pytest.fixture(scope="function")
+def make_cx_ring_qc():
+    def cx_ring_qc(num_qubits, num_cx, name=None):
+        """Create a measured circuit of num_cx cx gates around a ring of qubits"""
+        qc = QuantumCircuit(num_qubits, num_qubits, name=name)
+        for k in range(num_cx):
+            qc.cx(k % num_qubits, (k + 1) % num_qubits)
+        qc.measure(range(num_qubits), range(num_qubits))
+        return qc
+
+    return cx_ring_qc
+
+
+@pytest.fixture(scope="function")
+def empty_pass_manager_cache():
+    """Start and leave the test with no pass manager cached by multi_pass_manager"""
+    clear_pass_manager_cache()
+    yield
+    clear_pass_manager_cache()
@@ -0,0 +1,85 @@
+import gc
+
+from qiskit import QuantumCircuit
+from qiskit.compiler import transpile
+
+import palloq.circuitcombination.circuit_features as circuit_features
+from palloq.circuitcombination.circuit_features import FeatureCache
+from palloq.circuitcombination.OptimizationFunction import (
+    DepthBaseCost,
+    DurationTimeCost,
+)
+
+
+def _circuit():
+    qc = QuantumCircuit(3, 3)
+    qc.h(0)
+    qc.cx(0, 1)
+    qc.ccx(0, 1, 2)
+    qc.measure(range(3), range(3))
+    return qc
+
+
+def test_features():
+    qc = _circuit()
+    cache = FeatureCache()
+    features = cache.features(qc)
+
+    assert features.num_qubits == 3
+    assert features.num_clbits == 3
+    assert features.depth == qc.depth()
+    assert features.size == qc.size()
+    assert features.count_ops == dict(qc.count_ops())
+    assert cache.features(qc) is features
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # a circuit with the same content is another entry
+    cache.features(_circuit())
+    assert cache.stats()["misses"] == 2
+
+
+def test_translated_ops(monkeypatch):
+    qc = _circuit()
+    cache = FeatureCache()
+    calls = []
+
+    def _transpile(circuit, **kwargs):
+        calls.append(circuit)
+        return transpile(circuit, **kwargs)
+
+    monkeypatch.setattr(circuit_features, "transpile", _transpile)
+    basis_gates = ["rz", "cx", "sx", "x", "id"]
+    ops = cache.translated_ops(qc, basis_gates)
+
+    assert ops == dict(transpile(qc, basis_gates=basis_gates).count_ops())
+    assert cache.translated_ops(qc, list(reversed(basis_gates))) is ops
+    assert len(calls) == 1
+
+
+def test_entries_are_dropped_with_circuits():
+    cache = FeatureCache()
+    qc = _circuit()
+    cache.features(qc)
+    assert len(cache) == 1
+
+    del qc
+    gc.collect()
+    assert len(cache) == 0
+
+
+def test_cost_functions_read_features():
+    qc_0, qc_1 = _circuit(), _circuit()
+    cache = FeatureCache()
+
+    depth_cost = DepthBaseCost(10, feature_cache=cache)
+    assert depth_cost.cost([qc_0, qc_1]) == 2 * qc_0.depth() * 3
+
+    duration_cost = DurationTimeCost(10, feature_cache=cache)
+    ops = transpile(qc_0, basis_gates=["rz", "cx", "sx", "x", "id"]).count_ops()
+    expected = 2000 * ops.get("cx", 0) + 200 * sum(
+        ops.get(gate, 0) for gate in ["rz", "sx", "x", "id"]
+    )
+    assert duration_cost.cost([qc_0, qc_1]) == 2 * expected
+    assert duration_cost.cost([qc_0]) == expected
+    assert cache.stats()["misses"] == 2
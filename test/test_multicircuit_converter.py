@@ -1,11 +1,86 @@
+import copy
+import itertools
+
 import pytest
 
 from palloq import MCC, MCC_dp, MCC_random, MultiCircuit
+from palloq.circuitcombination.OptimizationFunction import (
+    CrosstalkBaseCost,
+    DepthBaseCost,
+)
 from qiskit import QuantumCircuit
+from qiskit.circuit import Gate
+from qiskit.circuit.random import random_circuit
+from qiskit.transpiler import InstructionDurations
 
 
-class TestMultiCircuitConverter:
+def _random_circuits(num_circuits, seed):
+    return [
+        random_circuit(2 + (seed + i) % 4, 1 + (seed * i) % 5, seed=seed + i)
+        for i in range(num_circuits)
+    ]
+
+
+def _exhaustive_compose(qcircuits, device_size, threshold, cost_function):
+    """The groups chosen by the former depth first search over all the subsets"""
+    cost_func = cost_function(device_size)
+    candidates = []
+
+    def dfs(circuits, index):
+        instances = [i[1] for i in circuits]
+        total_qubits = sum([i.num_qubits for i in instances])
+        if (
+            total_qubits >= device_size
+            or cost_func.cost(instances) >= threshold
+            or index >= len(qcircuits)
+        ):
+            # the average cost of CrosstalkBaseCost is undefined for no circuits
+            _cost = cost_func.cost(instances[:-1]) if len(instances) > 1 else 0
+            candidates.append((circuits[:-1], _cost))
+            return
+        _nqc = copy.copy(circuits)
+        _nqc.append((index, qcircuits[index]))
+        dfs(_nqc, index + 1)
+        dfs(circuits, index + 1)
+
+    dfs([(0, qcircuits[0])], 1)
+    candidates = sorted(
+        candidates, key=lambda x: (len(x[0]), 1 / (x[1] + 1e-6)), reverse=True
+    )
+    for choice in candidates:
+        if len(choice[0]) > 1:
+            return [i for i, _ in choice[0]]
+    return [0]
+
 
+def _list_knapsack(weights, values, W):
+    """The group chosen by the former knapsack on lists of lists"""
+    n = len(weights)
+    dp = [[0] * (W) for _ in range(n + 1)]
+    rev = [[0] * (W) for _ in range(n + 1)]
+    for i in range(n):
+        for w in range(W):
+            if w >= weights[i]:
+                if dp[i + 1][w] < dp[i][w - weights[i]] + values[i]:
+                    dp[i + 1][w] = dp[i][w - weights[i]] + values[i]
+                    rev[i + 1][w] = w - weights[i]
+            if dp[i + 1][w] < dp[i][w]:
+                dp[i + 1][w] = dp[i][w]
+                rev[i + 1][w] = w
+    combination = []
+    cur_w = W - 1
+    for i in range(n - 1, -1, -1):
+        if rev[i + 1][cur_w] == cur_w - weights[i]:
+            combination.append(i)
+        cur_w = rev[i + 1][cur_w]
+    return combination
+
+
+def _depth_value(qc, error_rates):
+    return 1 / (1 + qc.depth())
+
+
+class TestMultiCircuitConverter:
     @pytest.fixture
     def dummy_device(self):
         pass
@@ -23,12 +98,253 @@ class TestMultiCircuitConverter:
     def test_dp_optimize(self, small_circuits):
         multi_conv = MCC_dp(small_circuits, 10)
         circuit = multi_conv.compose()
-    
+
     def test_mcc_random(self, small_circuits):
         multi_comv = MCC_random(small_circuits, 10, 0.5)
         circuits = multi_comv.compose()
         print(circuits)
 
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("cost_function", [DepthBaseCost, CrosstalkBaseCost])
+    def test_branch_and_bound(self, seed, cost_function):
+        qcircuits = _random_circuits(12, seed)
+        threshold = 60 if cost_function is DepthBaseCost else 1
+        expected = _exhaustive_compose(qcircuits, 12, threshold, cost_function)
+
+        multi_conv = MCC(list(qcircuits), 12, threshold, cost_function)
+        circuit = multi_conv.compose()
+        assert circuit.circuits() == [qcircuits[i] for i in expected]
+        assert len(multi_conv.qcircuits) == len(qcircuits) - len(expected)
+
+    def test_branch_and_bound_budget(self):
+        qcircuits = _random_circuits(40, 0)
+        multi_conv = MCC(list(qcircuits), 20, 200, max_nodes=10)
+        circuit = multi_conv.compose()
+        assert circuit.circuits()[0] is qcircuits[0]
+        assert sum(qc.num_qubits for qc in circuit.circuits()) < 20
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_dp_knapsack(self, seed):
+        qcircuits = _random_circuits(15, seed)
+        weights = [qc.num_qubits for qc in qcircuits]
+        values = [_depth_value(qc, None) for qc in qcircuits]
+        expected = _list_knapsack(weights, values, 20 - 2)
+
+        multi_conv = MCC_dp(list(qcircuits), 20, 2, eval_func=_depth_value)
+        circuit = multi_conv.compose()
+        assert circuit.circuits() == [qcircuits[i] for i in expected]
+        assert len(multi_conv.qcircuits) == len(qcircuits) - len(expected)
+
+    def test_dp_values_are_cached(self):
+        calls = []
+
+        def _value(qc, error_rates):
+            calls.append(qc)
+            return _depth_value(qc, error_rates)
+
+        qcircuits = _random_circuits(15, 0)
+        multi_conv = MCC_dp(list(qcircuits), 10, 0, eval_func=_value)
+        while multi_conv.has_qc():
+            multi_conv.compose()
+        assert len(calls) == len(qcircuits)
+        assert multi_conv._values == {}
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_dp_compose_all(self, seed):
+        qcircuits = _random_circuits(30, seed)
+        multi_conv = MCC_dp(list(qcircuits), 12, 2, eval_func=_depth_value)
+        multi_circuits = multi_conv.compose_all()
+
+        assert not multi_conv.has_qc()
+        packed = [qc for mult in multi_circuits for qc in mult.circuits()]
+        assert sorted(map(id, packed)) == sorted(map(id, qcircuits))
+        for mult in multi_circuits:
+            assert sum(qc.num_qubits for qc in mult.circuits()) < 12 - 2
+        values = [
+            sum(_depth_value(qc, None) for qc in mult.circuits())
+            for mult in multi_circuits
+        ]
+        assert values == sorted(values, reverse=True)
+
+        assert sum(values) == pytest.approx(
+            sum(_depth_value(qc, None) for qc in qcircuits)
+        )
+
+    def test_dp_compose_all_values(self):
+        qcircuits = _random_circuits(12, 0)
+        worthless = set(map(id, qcircuits[::3]))
+
+        def value(qc, _):
+            return 0.0 if id(qc) in worthless else _depth_value(qc, None)
+
+        multi_conv = MCC_dp(list(qcircuits), 12, 2, eval_func=value)
+        multi_circuits = multi_conv.compose_all()
+
+        packed = [qc for mult in multi_circuits for qc in mult.circuits()]
+        assert sorted(map(id, packed)) == sorted(map(id, qcircuits))
+        for mult in multi_circuits:
+            assert sum(qc.num_qubits for qc in mult.circuits()) < 12 - 2
+        # circuits of no value are not grouped
+        for mult in multi_circuits:
+            if any(id(qc) in worthless for qc in mult.circuits()):
+                assert len(mult.circuits()) == 1
+
+    def test_dp_compose_all_beats_compose_loop(self):
+        # the knapsack of each compose takes the valuable 2 qubit circuits together,
+        # which leaves the 4 qubit circuits alone
+        qcircuits = [
+            QuantumCircuit(num_qubits, name="qc" + str(i))
+            for i, num_qubits in enumerate([4, 4, 2, 2])
+        ]
+
+        def value(qc, _):
+            return 10.0 if qc.num_qubits == 2 else 1.0
+
+        multi_conv = MCC_dp(list(qcircuits), 8, 1, eval_func=value)
+        looped = super(MCC_dp, multi_conv).compose_all()
+        multi_conv = MCC_dp(list(qcircuits), 8, 1, eval_func=value)
+        packed = multi_conv.compose_all()
+
+        assert len(looped) == 3
+        assert len(packed) == 2
+        for mult in packed:
+            assert sorted(qc.num_qubits for qc in mult.circuits()) == [2, 4]
+
+    def test_compose_all(self):
+        qcircuits = _random_circuits(10, 0)
+        multi_conv = MCC(list(qcircuits), 12, 100)
+        multi_circuits = multi_conv.compose_all()
+        assert not multi_conv.has_qc()
+        assert sum(len(mult.circuits()) for mult in multi_circuits) == 10
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_dp_clbits(self, seed):
+        qcircuits = [
+            random_circuit(2 + i % 3, 2, seed=seed + i, measure=i % 2 == 0)
+            for i in range(10)
+        ]
+        multi_conv = MCC_dp(
+            list(qcircuits), 10, 0, eval_func=_depth_value, max_clbits=5
+        )
+        circuit = multi_conv.compose()
+
+        # the best group by brute force
+        best = max(
+            (
+                group
+                for k in range(1, len(qcircuits) + 1)
+                for group in itertools.combinations(qcircuits, k)
+                if sum(qc.num_qubits for qc in group) < 10
+                and sum(qc.num_clbits for qc in group) <= 5
+            ),
+            key=lambda group: sum(_depth_value(qc, None) for qc in group),
+        )
+        assert sum(qc.num_clbits for qc in circuit.circuits()) <= 5
+        assert sum(_depth_value(qc, None) for qc in circuit.circuits()) == (
+            pytest.approx(sum(_depth_value(qc, None) for qc in best))
+        )
+
+        # the greedy heuristic fits the limits as well
+        multi_conv = MCC_dp(
+            list(qcircuits),
+            10,
+            0,
+            eval_func=_depth_value,
+            max_clbits=5,
+            max_states=1,
+        )
+        circuits = multi_conv.compose().circuits()
+        assert sum(qc.num_qubits for qc in circuits) < 10
+        assert sum(qc.num_clbits for qc in circuits) <= 5
+
+        multi_conv = MCC_dp(
+            list(qcircuits), 10, 0, eval_func=_depth_value, max_clbits=5
+        )
+        for mult in multi_conv.compose_all():
+            assert sum(qc.num_qubits for qc in mult.circuits()) < 10
+            assert sum(qc.num_clbits for qc in mult.circuits()) <= 5
+
+    def test_dp_device_limits(self):
+        qcircuits = _random_circuits(5, 0)
+        with pytest.raises(ValueError):
+            MCC_dp([random_circuit(3, 2, measure=True)], 10, 0, max_clbits=2)
+        deepest = max(qc.depth() for qc in qcircuits)
+        with pytest.raises(ValueError):
+            MCC_dp(list(qcircuits), 10, 0, max_depth=deepest - 1)
+        with pytest.raises(ValueError):
+            MCC_dp(list(qcircuits), 10, 0, max_duration=100)
+
+        qc = QuantumCircuit(2)
+        qc.h(0)
+        qc.cx(0, 1)
+        durations = InstructionDurations([("h", None, 10), ("cx", None, 30)])
+        MCC_dp([qc], 10, 0, max_duration=40, instruction_durations=durations)
+        with pytest.raises(ValueError):
+            MCC_dp([qc], 10, 0, max_duration=39, instruction_durations=durations)
+
+    def test_dp_duration_of_translated_circuits(self):
+        qc = QuantumCircuit(3)
+        for _ in range(50):
+            qc.h(0)
+            qc.ccx(0, 1, 2)
+
+        durations = InstructionDurations(
+            [
+                ("rz", None, 0),
+                ("sx", None, 3.5e-8),
+                ("x", None, 3.5e-8),
+                ("cx", None, 3e-7),
+            ]
+        )
+        # an opaque gate can not be translated and has no duration
+        opaque = QuantumCircuit(2)
+        opaque.h(0)
+        opaque.append(Gate("opaque", 2, []), [0, 1])
+        with pytest.raises(ValueError):
+            MCC_dp([opaque], 10, 0, max_duration=1e-5, instruction_durations=durations)
+
+        # ccx is estimated by its translation into the basis gates
+        with pytest.raises(ValueError):
+            MCC_dp([qc], 10, 0, max_duration=1e-5, instruction_durations=durations)
+        MCC_dp([qc], 10, 0, max_duration=1e-3, instruction_durations=durations)
+
+    def test_dp_push_checks_device_limits(self):
+        durations = InstructionDurations([("h", None, 10), ("cx", None, 30)])
+        multi_conv = MCC_dp(
+            [],
+            4,
+            0,
+            max_clbits=2,
+            max_depth=3,
+            max_duration=50,
+            instruction_durations=durations,
+        )
+        with pytest.raises(ValueError):
+            multi_conv.push(QuantumCircuit(5))
+        with pytest.raises(ValueError):
+            multi_conv.push(QuantumCircuit(2, 3))
+        deep = QuantumCircuit(1)
+        for _ in range(4):
+            deep.h(0)
+        with pytest.raises(ValueError):
+            multi_conv.push(deep)
+        long = QuantumCircuit(2)
+        long.cx(0, 1)
+        long.cx(0, 1)
+        with pytest.raises(ValueError):
+            multi_conv.push(long)
+        unknown = QuantumCircuit(1)
+        unknown.x(0)
+        with pytest.raises(ValueError):
+            multi_conv.push(unknown)
+        assert not multi_conv.has_qc()
+
+        qc = QuantumCircuit(2, 2)
+        qc.h(0)
+        qc.cx(0, 1)
+        multi_conv.push(qc)
+        assert multi_conv.qcircuits == [qc]
+
     def test_has_qc(self):
         pass
 
@@ -36,4 +352,4 @@ class TestMultiCircuitConverter:
         pass
 
     def test_push(self):
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from qiskit.circuit.random import random_circuit
+
+from palloq.circuitcombination.OptimizationFunction import (
+    CrosstalkBaseCost,
+    DepthBaseCost,
+    DurationTimeCost,
+)
+
+
+@pytest.mark.parametrize(
+    "cost_function", [CrosstalkBaseCost, DurationTimeCost, DepthBaseCost]
+)
+def test_batch_cost(cost_function):
+    circuits = [
+        random_circuit(2 + i % 3, 1 + i % 4, seed=i, measure=True) for i in range(8)
+    ]
+    membership = np.random.default_rng(0).random((50, len(circuits))) < 0.4
+    membership[:, 0] = True
+    cost_func = cost_function(10)
+
+    costs = cost_func.batch_cost(membership, cost_func.feature_matrix(circuits))
+
+    assert costs.shape == (50,)
+    expected = [
+        cost_func.cost([qc for qc, member in zip(circuits, row) if member])
+        for row in membership
+    ]
+    assert np.allclose(costs, expected)
+
+
+def test_batch_cost_of_no_circuits():
+    circuits = [random_circuit(3, 2, seed=0)]
+    membership = np.zeros((1, 1), dtype=bool)
+
+    cost_func = DepthBaseCost(10)
+    assert cost_func.batch_cost(membership, cost_func.feature_matrix(circuits)) == [0]
+    cost_func = CrosstalkBaseCost(10)
+    assert np.isnan(
+        cost_func.batch_cost(membership, cost_func.feature_matrix(circuits))[0]
+    )
+
+
+@pytest.mark.parametrize(
+    "cost_function", [CrosstalkBaseCost, DurationTimeCost, DepthBaseCost]
+)
+def test_accumulator(cost_function):
+    circuits = [random_circuit(2 + i % 3, 1 + i % 4, seed=i) for i in range(6)]
+    cost_func = cost_function(10)
+    accumulator = cost_func.accumulator(circuits[:2])
+    group = circuits[:2]
+    assert accumulator.cost() == pytest.approx(cost_func.cost(group))
+
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        qc = circuits[rng.integers(len(circuits))]
+        if any(qc is member for member in group) and len(group) > 1:
+            accumulator.remove(qc)
+            group = [member for member in group if member is not qc]
+        elif not any(qc is member for member in group):
+            accumulator.add(qc)
+            group = group + [qc]
+        assert accumulator.num_circuits == len(group)
+        assert accumulator.cost() == pytest.approx(cost_func.cost(group))
@@ -0,0 +1,111 @@
+import pytest
+from qiskit import QuantumCircuit, QuantumRegister
+from qiskit.circuit.random import random_circuit
+from qiskit.converters import circuit_to_dag
+from qiskit.transpiler import CouplingMap
+from qiskit.transpiler.exceptions import TranspilerError
+from qiskit.transpiler.passes import CheckMap, StochasticSwap
+
+from palloq.transpiler.passes import AdaptiveStochasticSwap
+
+
+LINE = CouplingMap.from_line(6)
+
+
+def _physical_circuit(qc):
+    """Copy the circuit onto the canonical register q as a laid out circuit."""
+    physical = QuantumCircuit(QuantumRegister(qc.num_qubits, "q"))
+    physical.compose(qc.remove_final_measurements(inplace=False), inplace=True)
+    return physical
+
+
+def _num_swap(dag):
+    return dag.count_ops().get("swap", 0)
+
+
+def test_adaptive_stochastic_swap():
+    qc = _physical_circuit(random_circuit(6, 10, max_operands=2, seed=7))
+    dag = circuit_to_dag(qc)
+
+    swap = AdaptiveStochasticSwap(LINE, initial_trials=2, max_trials=64, seed=3)
+    routed = swap.run(dag)
+
+    check_map = CheckMap(LINE)
+    check_map.run(routed)
+    assert check_map.property_set["is_swap_mapped"]
+    trials = swap.property_set["stochastic_swap_trials"]
+    assert trials in {2, 4, 8, 16, 32, 64}
+
+    # the first attempt is the routing with the initial trials
+    fixed = StochasticSwap(LINE, trials=2, seed=3)
+    assert _num_swap(routed) <= _num_swap(fixed.run(dag))
+
+
+def test_adaptive_stochastic_swap_routed_circuit():
+    qc = QuantumCircuit(QuantumRegister(6, "q"))
+    for i in range(5):
+        qc.cx(i, i + 1)
+
+    swap = AdaptiveStochasticSwap(LINE, initial_trials=4, seed=3)
+    routed = swap.run(circuit_to_dag(qc))
+
+    # no swap is needed, so routing stops at the initial trials
+    assert _num_swap(routed) == 0
+    assert swap.property_set["stochastic_swap_trials"] == 4
+
+
+def test_adaptive_stochastic_swap_raises_without_retry(monkeypatch):
+    calls = []
+    run = StochasticSwap.run
+
+    def _run(self, dag):
+        calls.append(self.trials)
+        return run(self, dag)
+
+    monkeypatch.setattr(StochasticSwap, "run", _run)
+    swap = AdaptiveStochasticSwap(LINE, initial_trials=2, max_trials=64, seed=3)
+
+    # not a physical circuit
+    qc = QuantumCircuit(QuantumRegister(3, "v"))
+    qc.cx(0, 2)
+    with pytest.raises(TranspilerError, match="physical circuits only"):
+        swap.run(circuit_to_dag(qc))
+
+    # gate on more than 2 qubits
+    qc = QuantumCircuit(QuantumRegister(3, "q"))
+    qc.ccx(0, 1, 2)
+    with pytest.raises(TranspilerError, match="> 2-qubit gates"):
+        swap.run(circuit_to_dag(qc))
+
+    # more qubits than the coupling map
+    qc = QuantumCircuit(QuantumRegister(7, "q"))
+    with pytest.raises(TranspilerError, match="amount of qubits"):
+        swap.run(circuit_to_dag(qc))
+    assert calls == []
+
+
+def test_adaptive_stochastic_swap_out_of_time(monkeypatch):
+    calls = []
+
+    def _run(self, dag):
+        calls.append(self.trials)
+        raise TranspilerError("swap mapper failed: layer 1, sublayer 1")
+
+    monkeypatch.setattr(StochasticSwap, "run", _run)
+    qc = QuantumCircuit(QuantumRegister(3, "q"))
+    qc.cx(0, 2)
+    dag = circuit_to_dag(qc)
+
+    # failed routings are not retried after the time limit
+    swap = AdaptiveStochasticSwap(LINE, initial_trials=2, time_limit=0, seed=3)
+    with pytest.raises(TranspilerError, match="out of time after 2 trials"):
+        swap.run(dag)
+    assert calls == [2]
+
+    # nor after the deadline of the time budget, which leaves the dag unrouted
+    swap = AdaptiveStochasticSwap(LINE, initial_trials=2, seed=3)
+    swap.property_set["time_budget_deadline"] = 0
+    swap.property_set["cut_short_stages"] = []
+    assert swap.run(dag) is dag
+    assert swap.property_set["cut_short_stages"] == ["routing"]
+    assert calls == [2, 2]
@@ -0,0 +1,208 @@
+from qiskit import QuantumCircuit, QuantumRegister
+from qiskit.circuit.delay import Delay
+from qiskit.converters import circuit_to_dag, dag_to_circuit
+from qiskit.test.mock import FakeParis
+from qiskit.transpiler import (
+    CouplingMap,
+    InstructionDurations,
+    Layout,
+    PassManagerConfig,
+)
+from qiskit.transpiler.passes import CheckMap
+
+from palloq.transpiler.passes.schedule import MultiALAPSchedule, MultiASAPSchedule
+from palloq.transpiler.preset_passmanagers.multi_pm import multi_pass_manager
+
+
+DURATIONS = InstructionDurations(
+    [
+        ("h", None, 100),
+        ("x", None, 100),
+        ("sx", None, 100),
+        ("rz", None, 0),
+        ("cx", None, 300),
+        ("measure", None, 1000),
+    ]
+)
+
+
+def _composite():
+    """Two programs in separated registers, the second one shorter than the first."""
+    qr_0 = QuantumRegister(2, "q_0_0")
+    qr_1 = QuantumRegister(1, "q_1_0")
+    qc = QuantumCircuit(qr_0, qr_1)
+    qc.h(qr_0[0])
+    qc.cx(qr_0[0], qr_0[1])
+    qc.x(qr_1[0])
+    return qc
+
+
+def _delays(qc, qubit):
+    return [
+        instruction.duration
+        for instruction, qargs, _ in qc.data
+        if isinstance(instruction, Delay) and qargs[0] == qubit
+    ]
+
+
+def test_multi_alap_schedule():
+    qc = _composite()
+    scheduled = MultiALAPSchedule(DURATIONS).run(circuit_to_dag(qc), time_unit="dt")
+
+    assert scheduled.duration == 400
+    sc = dag_to_circuit(scheduled)
+    # h is followed by cx without idle time, x waits until the end of the cx
+    assert _delays(sc, qc.qubits[0]) == []
+    assert _delays(sc, qc.qubits[1]) == [100]
+    assert _delays(sc, qc.qubits[2]) == [300]
+    assert [inst.name for inst, qargs, _ in sc.data if qargs[0] == qc.qubits[2]] == [
+        "delay",
+        "x",
+    ]
+    assert sc.count_ops()["h"] == 1
+    assert sc.count_ops()["cx"] == 1
+
+
+def test_multi_asap_schedule():
+    qc = _composite()
+    scheduled = MultiASAPSchedule(DURATIONS).run(circuit_to_dag(qc), time_unit="dt")
+
+    assert scheduled.duration == 400
+    sc = dag_to_circuit(scheduled)
+    # x starts at the beginning and the qubit idles until the end of the cx
+    assert _delays(sc, qc.qubits[1]) == [100]
+    assert _delays(sc, qc.qubits[2]) == [300]
+    assert [inst.name for inst, qargs, _ in sc.data if qargs[0] == qc.qubits[2]] == [
+        "x",
+        "delay",
+    ]
+
+
+def test_multi_pass_manager_asap():
+    qc = _composite()
+    qc.measure_all()
+    config = PassManagerConfig(
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        instruction_durations=DURATIONS,
+        scheduling_method="asap",
+    )
+    scheduled = multi_pass_manager(config).run(qc)
+
+    # cx and measure are on the critical path
+    assert scheduled.duration >= 1300
+    assert "delay" in scheduled.count_ops()
+
+
+def test_schedule_analytics():
+    qc = _composite()
+    scheduler = MultiALAPSchedule(DURATIONS)
+    scheduler.run(circuit_to_dag(qc), time_unit="dt")
+    analytics = scheduler.property_set["schedule_analytics"]
+
+    assert analytics["duration"] == 400
+    assert analytics["critical_path"] == 400
+    assert analytics["programs"] == [0, 1]
+    assert list(analytics["qubit_program"]) == [0, 0, 1]
+    assert list(analytics["qubit_busy_time"]) == [400, 300, 100]
+    assert list(analytics["qubit_idle_time"]) == [0, 100, 300]
+    assert list(analytics["program_busy_time"]) == [700, 100]
+    assert list(analytics["program_idle_time"]) == [100, 300]
+    assert list(analytics["program_critical_path"]) == [400, 100]
+
+
+def test_multi_pass_manager_cache(empty_pass_manager_cache):
+    config = PassManagerConfig(
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        coupling_map=CouplingMap([[0, 1], [1, 0], [1, 2], [2, 1]]),
+        instruction_durations=DURATIONS,
+        scheduling_method="alap",
+    )
+    same_config = PassManagerConfig(
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        coupling_map=CouplingMap([[0, 1], [1, 0], [1, 2], [2, 1]]),
+        instruction_durations=DURATIONS,
+        scheduling_method="alap",
+    )
+    multi_pm = multi_pass_manager(config)
+
+    assert multi_pass_manager(same_config) is multi_pm
+    assert (
+        multi_pass_manager(config, crosstalk_prop={(0, 1): {(1, 2): 2}}) is not multi_pm
+    )
+    assert multi_pass_manager(config, use_cache=False) is not multi_pm
+
+    # the cached pass manager can run repeatedly
+    qc = _composite()
+    qc.measure_all()
+    assert multi_pm.run(qc).duration == multi_pm.run(qc).duration
+
+
+def test_multi_pass_manager_cache_layout(empty_pass_manager_cache):
+    qc = _composite()
+    configs = [
+        PassManagerConfig(
+            basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+            coupling_map=CouplingMap([[0, 1], [1, 0], [1, 2], [2, 1]]),
+            initial_layout=Layout.from_intlist(physical_bits, *qc.qregs),
+        )
+        for physical_bits in [[0, 1, 2], [2, 1, 0]]
+    ]
+
+    # the pass manager is shared by the layouts, which are set per run
+    multi_pm = multi_pass_manager(configs[0])
+    assert multi_pm.run(qc).count_ops()["cx"] == 1
+    assert multi_pm.property_set["layout"] == configs[0].initial_layout
+    assert multi_pass_manager(configs[1]) is multi_pm
+    multi_pm.run(qc)
+    assert multi_pm.property_set["layout"] == configs[1].initial_layout
+
+
+def test_multi_pass_manager_cache_properties(empty_pass_manager_cache, monkeypatch):
+    properties = FakeParis().properties()
+    config = PassManagerConfig(
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        backend_properties=properties,
+    )
+    multi_pm = multi_pass_manager(config)
+
+    # the properties are serialized only once for the key
+    def serialized_again():
+        raise AssertionError("the properties are serialized again")
+
+    monkeypatch.setattr(properties, "to_dict", serialized_again)
+    assert multi_pass_manager(config) is multi_pm
+
+
+def _triangle():
+    """A circuit that needs swaps on a line of three qubits."""
+    qc = QuantumCircuit(3)
+    qc.cx(0, 1)
+    qc.cx(1, 2)
+    qc.cx(0, 2)
+    qc.measure_all()
+    return qc
+
+
+def test_multi_pass_manager_time_budget():
+    config = PassManagerConfig(
+        basis_gates=["id", "rz", "sx", "x", "cx", "reset"],
+        coupling_map=CouplingMap([[0, 1], [1, 0], [1, 2], [2, 1]]),
+        seed_transpiler=1,
+    )
+
+    # everything is cut short, but the circuit is still mapped
+    multi_pm = multi_pass_manager(config, use_cache=False, time_budget=1e-9)
+    transpiled = multi_pm.run(_triangle())
+    assert multi_pm.property_set["cut_short_stages"] == [
+        "layout",
+        "routing",
+        "optimization",
+    ]
+    assert "swap" in transpiled.count_ops() or transpiled.count_ops()["cx"] > 3
+    check_map = CheckMap(config.coupling_map)
+    check_map.run(circuit_to_dag(transpiled))
+    assert check_map.property_set["is_swap_mapped"]
+
+    multi_pm = multi_pass_manager(config, use_cache=False, time_budget=10)
+    multi_pm.run(_triangle())
+    assert multi_pm.property_set["cut_short_stages"] == []
@@ -0,0 +1,78 @@
+# test for demultiplex_counts()
+
+import numpy as np
+import pytest
+from qiskit import ClassicalRegister
+
+from palloq.utils.demultiplex import (
+    demultiplex_counts,
+    demultiplex_memory,
+    pack_bitstrings,
+)
+
+"""This test is written as pytest style"""
+
+# program 0 has c_0_0, program 1 has meas_1_0 and c_1_1
+CREGS = [
+    ClassicalRegister(2, "c_0_0"),
+    ClassicalRegister(3, "meas_1_0"),
+    ClassicalRegister(1, "c_1_1"),
+]
+
+
+def test_pack_bitstrings():
+    values = pack_bitstrings(["1 010 01", "0 111 11", "0 000 00"])
+    assert values.tolist() == [0b101001, 0b011111, 0]
+    assert pack_bitstrings(["0x5", "0x21"]).tolist() == [5, 33]
+
+
+def test_demultiplex_counts():
+    counts = {"1 010 01": 10, "0 010 11": 5, "1 111 01": 2}
+    result = demultiplex_counts(counts, CREGS)
+
+    assert list(result) == [0, 1]
+    assert result[0] == {"01": 12, "11": 5}
+    assert result[1] == {"1 010": 10, "0 010": 5, "1 111": 2}
+
+
+def test_demultiplex_memory():
+    memory = ["1 010 01", "0 010 11", "1 010 01"]
+    result = demultiplex_counts(memory, CREGS)
+    assert result[0] == {"01": 2, "11": 1}
+    assert result[1] == {"1 010": 2, "0 010": 1}
+
+    packed = np.array([0b101001, 0b001011, 0b101001])
+    assert demultiplex_counts(packed, CREGS) == result
+
+
+def test_demultiplex_register_sizes():
+    counts = {"1 010 01": 10, "0 010 11": 5}
+    result = demultiplex_counts(counts, [2, 3, 1])
+    assert result == {0: {"01": 10, "11": 5}, 1: {"010": 15}, 2: {"1": 10, "0": 5}}
+
+
+def test_demultiplex_wide_registers():
+    cregs = [ClassicalRegister(40, "a_0_0"), ClassicalRegister(40, "b_1_0")]
+    counts = {"1" * 40 + " " + "0" * 39 + "1": 3}
+    result = demultiplex_counts(counts, cregs)
+    assert result == {0: {"0" * 39 + "1": 3}, 1: {"1" * 40: 3}}
+
+
+def test_demultiplex_memory_correlations():
+    cregs = [ClassicalRegister(1, "c_0_0"), ClassicalRegister(1, "c_1_0"), 2]
+    # program 0 and 1 always agree, program 2 is constant
+    memory = np.array([0b0000, 0b0011, 0b0000, 0b0011], dtype=np.uint64)
+    counts, correlations = demultiplex_memory(memory, cregs)
+
+    assert counts[0] == {"0": 2, "1": 2}
+    assert counts[1] == {"0": 2, "1": 2}
+    assert counts[2] == {"00": 4}
+    assert correlations.shape == (3, 3)
+    assert correlations[0, 1] == pytest.approx(1.0)
+    assert correlations[0, 2] == 0.0
+    assert np.all(np.diag(correlations) == 1.0)
+
+    # bitstrings of Result.get_memory()
+    memory = ["00 1 1", "00 0 0"]
+    counts, correlations = demultiplex_memory(memory, cregs)
+    assert counts[0] == {"0": 1, "1": 1}
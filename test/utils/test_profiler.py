@@ -0,0 +1,55 @@
+import json
+
+from qiskit import QuantumCircuit
+from qiskit.test.mock import FakeParis
+
+from palloq.compiler import dynamic_multiqc_compose
+from palloq.utils import PipelineProfiler
+from palloq.utils.profiler import pass_callback, profile_stage
+
+
+def test_profile_stage_inactive():
+    # instrumentation does nothing without an active profiler
+    with profile_stage("stage"):
+        pass
+    assert pass_callback() is None
+
+
+def test_pipeline_profiler(tmp_path):
+    qcs = []
+    for i in range(3):
+        qc = QuantumCircuit(2, 2, name="qc" + str(i))
+        qc.h(0)
+        qc.cx(0, 1)
+        qc.measure(range(2), range(2))
+        qcs.append(qc)
+
+    with PipelineProfiler() as profiler:
+        with profile_stage("compose"):
+            dynamic_multiqc_compose(queued_qc=qcs, backend=FakeParis())
+    assert pass_callback() is None
+
+    records = {r["path"]: r for r in profiler.report()["records"]}
+    assert records["compose"]["calls"] == 1
+    assert records["compose/_alter_reg_names"]["calls"] == 3
+    assert records["compose/_sequential_layout/BufferedMultiLayout.run"]["calls"] == 3
+    assert (
+        records["compose/_sequential_layout/BufferedMultiLayout.run/_combine_dag"][
+            "calls"
+        ]
+        == 2
+    )
+    # passes of the pass manager are recorded in the stage
+    assert records["compose/multi_pass_manager/SetLayout"]["kind"] == "pass"
+    assert records["compose"]["peak_memory"] >= 0
+    assert records["compose/multi_pass_manager"]["wall_time"] <= records["compose"]["wall_time"]
+
+    report = json.loads(profiler.to_json(str(tmp_path / "profile.json")))
+    assert report["total_time"] == records["compose"]["wall_time"]
+    assert (tmp_path / "profile.json").exists()
+
+    folded = profiler.to_folded().splitlines()
+    assert len(folded) == len(records)
+    stack, self_time = folded[0].rsplit(" ", 1)
+    assert stack == "compose"
+    assert int(self_time) >= 0
@@ -0,0 +1,132 @@
+# test for TranslationCache
+
+import numpy as np
+from qiskit import QuantumCircuit, pulse
+from qiskit.compiler import transpile
+
+from palloq.utils.translation_cache import TranslationCache
+
+"""This test is written as pytest style"""
+
+BASIS_GATES = ["id", "rz", "sx", "x", "cx", "reset"]
+
+
+def _toffoli_qc(name, angle=None):
+    qc = QuantumCircuit(3, 3, name=name)
+    qc.h(0)
+    if angle is not None:
+        qc.rz(angle, 0)
+    qc.ccx(0, 1, 2)
+    qc.measure([0, 1, 2], [0, 1, 2])
+    return qc
+
+
+def test_translate_hit(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    translated = cache.translate(_toffoli_qc("toffoli"), BASIS_GATES)
+    cached = cache.translate(_toffoli_qc("toffoli"), BASIS_GATES)
+
+    assert translated == cached
+    assert set(cached.count_ops()) <= set(BASIS_GATES + ["measure"])
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    # entries persist over cache instances
+    reopened = TranslationCache(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.translate(_toffoli_qc("toffoli"), BASIS_GATES) == translated
+    assert reopened.stats()["hits"] == 1
+
+
+def test_translate_renamed_copy(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    cache.translate(_toffoli_qc("toffoli"), BASIS_GATES)
+    cached = cache.translate(_toffoli_qc("renamed"), BASIS_GATES)
+
+    assert cache.stats()["hits"] == 1
+    assert cached.name == "renamed"
+
+
+def test_key_depends_on_basis_gates():
+    qc = _toffoli_qc("toffoli")
+    assert TranslationCache.key(qc, BASIS_GATES) == TranslationCache.key(
+        qc, list(reversed(BASIS_GATES))
+    )
+    assert TranslationCache.key(qc, BASIS_GATES) != TranslationCache.key(
+        qc, ["u3", "cx"]
+    )
+
+
+def test_lru_eviction(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    cache.translate(_toffoli_qc("qc0", 0.0), BASIS_GATES)
+    entry_size = cache.stats()["bytes"]
+    cache.max_bytes = 2 * entry_size
+
+    cache.translate(_toffoli_qc("qc1", 0.1), BASIS_GATES)
+    # qc0 is used more recently than qc1
+    cache.translate(_toffoli_qc("qc0", 0.0), BASIS_GATES)
+    cache.translate(_toffoli_qc("qc2", 0.2), BASIS_GATES)
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(TranslationCache.key(_toffoli_qc("qc0", 0.0), BASIS_GATES))
+    assert cache.get(TranslationCache.key(_toffoli_qc("qc1", 0.1), BASIS_GATES)) is None
+
+
+def _custom_gate_qc(angle):
+    body = QuantumCircuit(2, name="custom")
+    body.rx(angle, 0)
+    body.cx(0, 1)
+    qc = QuantumCircuit(2, name="custom_qc")
+    qc.append(body.to_gate(), [0, 1])
+    return qc
+
+
+def test_key_depends_on_custom_gate_definitions(tmp_path):
+    qc_0, qc_1 = _custom_gate_qc(0.1), _custom_gate_qc(0.2)
+    assert TranslationCache.key(qc_0, BASIS_GATES) != TranslationCache.key(
+        qc_1, BASIS_GATES
+    )
+    assert TranslationCache.key(qc_0, BASIS_GATES) == TranslationCache.key(
+        _custom_gate_qc(0.1), BASIS_GATES
+    )
+
+    cache = TranslationCache(str(tmp_path))
+    cache.translate(qc_0, BASIS_GATES)
+    translated = cache.translate(qc_1, BASIS_GATES)
+    assert cache.stats()["hits"] == 0
+    assert translated == transpile(qc_1, basis_gates=BASIS_GATES)
+
+
+def test_key_depends_on_array_params():
+    # str of an array of more than 1000 elements is truncated
+    unitary = np.eye(32)
+    swapped = np.eye(32)
+    swapped[[15, 16]] = swapped[[16, 15]]
+    qcs = []
+    for matrix in [unitary, swapped]:
+        qc = QuantumCircuit(5, name="unitary")
+        qc.unitary(matrix, range(5))
+        qcs.append(qc)
+
+    assert TranslationCache.key(qcs[0], BASIS_GATES) != TranslationCache.key(
+        qcs[1], BASIS_GATES
+    )
+
+
+def test_key_depends_on_calibrations(tmp_path):
+    with pulse.build() as schedule:
+        pulse.play(pulse.Gaussian(160, 0.1, 40), pulse.DriveChannel(0))
+    calibrated = _toffoli_qc("toffoli")
+    calibrated.add_calibration("h", [0], schedule)
+    assert TranslationCache.key(calibrated, BASIS_GATES) != TranslationCache.key(
+        _toffoli_qc("toffoli"), BASIS_GATES
+    )
+
+    # the calibrations are not stored in QPY but set on the cached circuit
+    cache = TranslationCache(str(tmp_path))
+    translated = cache.translate(calibrated, BASIS_GATES)
+    cached = cache.translate(calibrated, BASIS_GATES)
+    assert cache.stats()["hits"] == 1
+    assert cached.calibrations == translated.calibrations == calibrated.calibrations